@@ -0,0 +1,159 @@
+# appointments/history.py
+"""
+Read appointments across the hot table and its archive.
+
+`manage.py archive_closed_days` moves closed days from appointment_details
+into appointment_details_history. Anything that looks at past dates
+(reports) reads through these helpers so it sees both; today's rows are
+always hot, so ranges that start today never touch the archive.
+
+Prescriptions, visit documents, notes and vitals keep the appointment id
+after it is archived (db_constraint=False), so screens reached from them
+(receipts, tokens, the patient's visits) look an appointment up with
+get_appointment_or_404() / attach_archived_appointments() instead of the
+plain AppointmentDetails query or FK.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.db.models import Count, Q
+from django.http import Http404
+
+from .models import AppointmentDetails, AppointmentHistory
+
+
+# PaymentMaster -> appointment reverse lookups, hot then archived
+PAYMENT_LINKS = ("appointmentdetails", "appointmenthistory")
+
+ROW_FIELDS = (
+    "appoint_id", "appointment_on", "token_num", "que_pos", "eta", "called",
+    "completed", "queue_start_time", "completed_at",
+    "doctor_id", "doctor__doctor_name", "patient_id", "patient__patient_name",
+)
+
+
+def appointment_sources(hospital, start, end=None, **filters):
+    """Hot queryset, plus the archive one when the range reaches back before today."""
+    end = end or start
+    lookup = dict(hospital=hospital, appointment_on__range=[start, end], **filters)
+    sources = [AppointmentDetails.objects.filter(**lookup)]
+    if start < date.today():
+        sources.append(AppointmentHistory.objects.filter(**lookup))
+    return sources
+
+
+def _as_row(r):
+    """Shape like the model so templates keep using appt.doctor.doctor_name."""
+    r["doctor"] = {"id": r["doctor_id"], "doctor_name": r.pop("doctor__doctor_name")}
+    r["patient"] = {"id": r["patient_id"], "patient_name": r.pop("patient__patient_name")}
+    return r
+
+
+def appointment_rows(hospital, start, end=None, **filters):
+    """
+    Appointment rows from both tables in one UNION ALL query, ordered by
+    date, doctor and queue position.
+    """
+    sources = [qs.order_by().values(*ROW_FIELDS) for qs in appointment_sources(hospital, start, end, **filters)]
+    qs = sources[0].union(*sources[1:], all=True) if len(sources) > 1 else sources[0]
+    rows = [_as_row(r) for r in qs]
+    rows.sort(key=lambda r: (r["appointment_on"], r["doctor"]["doctor_name"] or "", r["que_pos"] or 0))
+    return rows
+
+
+def status_counts(hospital, start, end=None, **filters):
+    """{status: count} over both tables."""
+    counts = defaultdict(int)
+    for qs in appointment_sources(hospital, start, end, **filters):
+        for row in qs.order_by().values("completed").annotate(n=Count("appoint_id")):
+            counts[row["completed"]] += row["n"]
+    return counts
+
+
+def status_counts_by_doctor(hospital, start, end=None, **filters):
+    """{doctor_id: {status: count}} over both tables, one grouped query per table."""
+    counts = defaultdict(lambda: defaultdict(int))
+    for qs in appointment_sources(hospital, start, end, **filters):
+        for row in qs.order_by().values("doctor_id", "completed").annotate(n=Count("appoint_id")):
+            counts[row["doctor_id"]][row["completed"]] += row["n"]
+    return counts
+
+
+def distinct_patients(hospital, start, end=None, **filters):
+    """Number of different patients booked in the range, over both tables."""
+    seen = set()
+    for qs in appointment_sources(hospital, start, end, **filters):
+        seen.update(qs.order_by().values_list("patient_id", flat=True).distinct())
+    return len(seen)
+
+
+def _doctor_q(doctor_id, field, column):
+    q = Q()
+    for model in (AppointmentDetails, AppointmentHistory):
+        q |= Q(**{f"{field}__in": model.objects.filter(doctor_id=doctor_id).values(column)})
+    return q
+
+
+def doctor_payments_q(doctor_id, field="pk"):
+    """
+    Q on `<field>__in` matching payments whose appointment, hot or archived,
+    is with the doctor (e.g. field="payment" for PaymentTransaction).
+    """
+    return _doctor_q(doctor_id, field, "payment_id")
+
+
+def doctor_patients_q(doctor_id, field="pk"):
+    """Q matching patients with an appointment, hot or archived, with the doctor."""
+    return _doctor_q(doctor_id, field, "patient_id")
+
+
+def latest_doctor_names(hospital, patient_ids):
+    """{patient_id: doctor name of their latest appointment} over both tables."""
+    latest = {}
+    for model in (AppointmentDetails, AppointmentHistory):
+        rows = model.objects.filter(hospital=hospital, patient_id__in=patient_ids).values_list(
+            "patient_id", "appointment_on", "appoint_id", "doctor__doctor_name",
+        )
+        for patient_id, day, pk, name in rows:
+            if patient_id not in latest or (day, pk) > latest[patient_id][0]:
+                latest[patient_id] = ((day, pk), name)
+    return {patient_id: name for patient_id, (_, name) in latest.items()}
+
+
+def get_appointment_or_404(hospital, pk, related=()):
+    """The appointment from the hot table or, once archived, from the archive (same id)."""
+    for model in (AppointmentDetails, AppointmentHistory):
+        appt = model.objects.select_related(*related).filter(pk=pk, hospital=hospital).first()
+        if appt is not None:
+            return appt
+    raise Http404("No appointment matches the given query.")
+
+
+def patient_appointments(hospital, patient, related=()):
+    """All of the patient's appointments, hot and archived, newest first."""
+    appts = [
+        appt
+        for model in (AppointmentDetails, AppointmentHistory)
+        for appt in model.objects.filter(patient=patient, hospital=hospital).select_related(*related)
+    ]
+    appts.sort(key=lambda a: (a.appointment_on, a.pk), reverse=True)
+    return appts
+
+
+def attach_archived_appointments(records, field="appointment", related=("doctor", "payment")):
+    """
+    Point `record.<field>` at the archived appointment where the hot row is
+    gone, so templates keep showing the visit. Expects the records to be
+    fetched with select_related(field): a missing hot row is then None.
+    """
+    fk = type(records[0])._meta.get_field(field) if records else None
+    pending = defaultdict(list)
+    for record in records:
+        appt_id = getattr(record, fk.attname)
+        if appt_id and fk.get_cached_value(record, default=None) is None:
+            pending[appt_id].append(record)
+    if pending:
+        for appt in AppointmentHistory.objects.select_related(*related).filter(pk__in=list(pending)):
+            for record in pending[appt.pk]:
+                fk.set_cached_value(record, appt)
+    return records
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.14 on 2026-10-17 23:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_alter_role_role_name'),
+        ('doctors', '0003_doctor_consult_message_template_and_more'),
+        ('appointments', '0009_appointmentdetails_completed_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_on', models.DateField()),
+                ('last_registration_pos', models.PositiveIntegerField(default=0)),
+                ('last_queue_pos', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='doctors.doctor')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'db_table': 'appointment_queue_counter',
+                'unique_together': {('hospital', 'doctor', 'appointment_on')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.14 on 2026-10-17 23:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_alter_role_role_name'),
+        ('doctors', '0003_doctor_consult_message_template_and_more'),
+        ('appointments', '0010_queuecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorServiceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('median_minutes', models.FloatField()),
+                ('p90_minutes', models.FloatField()),
+                ('ewma_minutes', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='doctors.doctor')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'db_table': 'appointment_service_stat',
+                'unique_together': {('doctor', 'weekday', 'hour')},
+            },
+        ),
+    ]
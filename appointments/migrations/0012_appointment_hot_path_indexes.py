@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_doctorservicestat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointmentdetails',
+            index=models.Index(fields=['hospital', 'appointment_on', 'completed', 'que_pos'], name='appt_hosp_day_status_pos'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentdetails',
+            index=models.Index(fields=['hospital', 'doctor', 'appointment_on', 'completed', 'que_pos'], name='appt_hosp_doc_day_status_pos'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_alter_paymenttransaction_pay_type'),
+        ('patients', '0003_remove_patient_age_months_remove_patient_age_years'),
+        ('core', '0010_alter_role_role_name'),
+        ('doctors', '0003_doctor_consult_message_template_and_more'),
+        ('appointments', '0012_appointment_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentHistory',
+            fields=[
+                ('appoint_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('appointment_on', models.DateField()),
+                ('mobile_num', models.CharField(max_length=10)),
+                ('token_num', models.CharField(max_length=20)),
+                ('called', models.BooleanField(default=False)),
+                ('que_pos', models.IntegerField()),
+                ('eta', models.TimeField(blank=True, null=True)),
+                ('completed', models.SmallIntegerField(choices=[(2, 'No Show'), (-1, 'Registered'), (0, 'In Queue'), (1, 'Done')])),
+                ('queue_start_time', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='doctors.doctor')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='patients.patient')),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='billing.paymentmaster')),
+            ],
+            options={
+                'db_table': 'appointment_details_history',
+            },
+        ),
+        migrations.CreateModel(
+            name='AppointmentAuditLogHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('action', models.CharField(max_length=50)),
+                ('token_num', models.CharField(max_length=10)),
+                ('que_pos', models.IntegerField()),
+                ('eta', models.TimeField(blank=True, null=True)),
+                ('completion_time', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointments.appointmenthistory')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='doctors.doctor')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='patients.patient')),
+            ],
+            options={
+                'db_table': 'appointment_audit_log_history',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='appointmenthistory',
+            index=models.Index(fields=['hospital', 'appointment_on', 'completed'], name='appt_hist_hosp_day_status'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmenthistory',
+            index=models.Index(fields=['hospital', 'doctor', 'appointment_on'], name='appt_hist_hosp_doc_day'),
+        ),
+    ]
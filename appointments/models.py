@@ -51,6 +51,14 @@ class AppointmentDetails(models.Model):
             models.Index(fields=['appointment_on']),
             models.Index(fields=['doctor']),
             models.Index(fields=['payment']),
+            # Hot paths: a hospital's day board (snapshot/dashboard/display),
+            # ordered by status then queue position.
+            models.Index(fields=['hospital', 'appointment_on', 'completed', 'que_pos'],
+                         name='appt_hosp_day_status_pos'),
+            # One doctor's day by status, in queue order (counts, ETA recompute,
+            # reschedule, next-to-call, get_patients_for_doctor).
+            models.Index(fields=['hospital', 'doctor', 'appointment_on', 'completed', 'que_pos'],
+                         name='appt_hosp_doc_day_status_pos'),
         ]
         ordering = ['-appointment_on', 'doctor']
     
@@ -88,3 +96,118 @@ class AppointmentAuditLog(models.Model):
 
     def __str__(self):
         return f"{self.appointment_id} {self.action} @ {self.created_at}"
+
+
+class QueueCounter(models.Model):
+    """
+    One row per (hospital, doctor, day) holding the last handed-out
+    registration and queue positions. Positions are allocated with an
+    atomic UPDATE on this row instead of counting AppointmentDetails.
+    """
+    hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
+    doctor = models.ForeignKey("doctors.Doctor", on_delete=models.CASCADE)
+    appointment_on = models.DateField()
+
+    last_registration_pos = models.PositiveIntegerField(default=0)
+    last_queue_pos = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'appointment_queue_counter'
+        unique_together = ('hospital', 'doctor', 'appointment_on')
+
+    def __str__(self):
+        return (
+            f"{self.doctor_id} @ {self.appointment_on}: "
+            f"reg={self.last_registration_pos} queue={self.last_queue_pos}"
+        )
+
+
+class DoctorServiceStat(models.Model):
+    """
+    Learned consultation length for a doctor, per weekday and hour of
+    day. Rebuilt nightly by `manage.py build_service_stats` from the
+    completed appointments; read by utils.eta_calculator.
+    """
+    hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
+    doctor = models.ForeignKey("doctors.Doctor", on_delete=models.CASCADE)
+    weekday = models.PositiveSmallIntegerField()   # 0 = Monday
+    hour = models.PositiveSmallIntegerField()      # 0..23, hour the consultation started
+
+    samples = models.PositiveIntegerField(default=0)
+    median_minutes = models.FloatField()
+    p90_minutes = models.FloatField()
+    ewma_minutes = models.FloatField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'appointment_service_stat'
+        unique_together = ('doctor', 'weekday', 'hour')
+
+    def __str__(self):
+        return (
+            f"{self.doctor_id} wd={self.weekday} h={self.hour}: "
+            f"median={self.median_minutes:.1f} ewma={self.ewma_minutes:.1f} (n={self.samples})"
+        )
+
+
+# ---------------------------------------------------------------
+# Cold storage: closed days moved out by `manage.py archive_closed_days`.
+# Same columns and primary keys as the hot tables; read through
+# appointments.history for anything that spans past dates.
+# ---------------------------------------------------------------
+class AppointmentHistory(models.Model):
+    appoint_id = models.IntegerField(primary_key=True)
+    appointment_on = models.DateField()
+    doctor = models.ForeignKey(Doctor, on_delete=models.PROTECT)
+    mobile_num = models.CharField(max_length=10)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
+    payment = models.ForeignKey('billing.PaymentMaster', on_delete=models.PROTECT)
+    token_num = models.CharField(max_length=20)
+    called = models.BooleanField(default=False)
+    que_pos = models.IntegerField()
+    eta = models.TimeField(null=True, blank=True)
+    completed = models.SmallIntegerField(choices=AppointmentDetails.STATUS_CHOICES)
+    queue_start_time = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'appointment_details_history'
+        indexes = [
+            models.Index(fields=['hospital', 'appointment_on', 'completed'],
+                         name='appt_hist_hosp_day_status'),
+            models.Index(fields=['hospital', 'doctor', 'appointment_on'],
+                         name='appt_hist_hosp_doc_day'),
+        ]
+
+    def __str__(self):
+        return f"Archived appt #{self.appoint_id} on {self.appointment_on}"
+
+
+class AppointmentAuditLogHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
+    appointment = models.ForeignKey(AppointmentHistory, on_delete=models.CASCADE)
+    doctor = models.ForeignKey("doctors.Doctor", on_delete=models.CASCADE)
+    patient = models.ForeignKey("patients.Patient", on_delete=models.CASCADE)
+
+    action = models.CharField(max_length=50)
+    token_num = models.CharField(max_length=10)
+    que_pos = models.IntegerField()
+
+    eta = models.TimeField(blank=True, null=True)
+    completion_time = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'appointment_audit_log_history'
+
+    def __str__(self):
+        return f"{self.appointment_id} {self.action} @ {self.created_at} (archived)"
@@ -1,3 +1,228 @@
+import json
+import re
+from datetime import date, time, timedelta
+from unittest import mock
+
+from django.db import connection
+from django.db.models import Max
+from django.db.models.query import QuerySet
 from django.test import TestCase
 
-# Create your tests here.
+from appointments.models import AppointmentDetails, QueueCounter
+from appointments.utils import (
+    allocate_queue_position, allocate_queue_positions, allocate_registration_position,
+)
+from billing.models import PaymentMaster
+from core.models import Hospital
+from doctors.models import Doctor
+from patients.models import Contact, Patient
+from queue_mgt.events import queue_snapshot_queryset
+
+
+TABLE = AppointmentDetails._meta.db_table
+
+
+def plan_problems(qs):
+    """
+    EXPLAIN the queryset and list what regressed for the appointment
+    table: a full scan or a sort the index should have provided.
+    """
+    if connection.vendor == "sqlite":
+        plan = qs.explain()
+        problems = []
+        for line in plan.splitlines():
+            if re.search(rf"\bSCAN {TABLE}\b", line):
+                problems.append(f"full scan: {line.strip()}")
+            if "TEMP B-TREE" in line:
+                problems.append(f"sort: {line.strip()}")
+        return problems
+
+    if connection.vendor == "mysql":
+        plan = json.loads(qs.explain(format="json"))
+        problems = []
+
+        def walk(node):
+            if isinstance(node, dict):
+                if node.get("table_name") == TABLE and node.get("access_type") == "ALL":
+                    problems.append(f"full scan: {node}")
+                if node.get("using_filesort"):
+                    problems.append("filesort")
+                for v in node.values():
+                    walk(v)
+            elif isinstance(node, list):
+                for v in node:
+                    walk(v)
+
+        walk(plan)
+        return problems
+
+    return None
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    The queue's hot queries must stay on the composite indexes
+    (appt_hosp_day_status_pos / appt_hosp_doc_day_status_pos).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(
+            hospital_name="Plan Test", phone_num="9990001111",
+            email="plan@test.local", name="plan",
+        )
+        cls.doctors = [
+            Doctor.objects.create(
+                doctor_name=f"Dr {i}", doc_mobile_num=f"98000000{i:02d}",
+                average_time_minutes=10, fees=100,
+                hospital=cls.hospital, start_time=time(9, 0),
+            )
+            for i in range(3)
+        ]
+        patients = []
+        for i in range(10):
+            contact = Contact.objects.create(
+                mobile_num=9100000000 + i, contact_name=f"C{i}", hospital=cls.hospital,
+            )
+            patients.append(Patient.objects.create(
+                contact=contact, patient_name=f"P{i}", gender="M", hospital=cls.hospital,
+            ))
+        pay = PaymentMaster.objects.create(
+            mobile_num="9100000000", patient=patients[0], total_amount=0,
+            collected_by="test", hospital=cls.hospital,
+        )
+
+        cls.today = date.today()
+        rows = []
+        for day_offset in range(10):
+            day = cls.today - timedelta(days=day_offset)
+            for doctor in cls.doctors:
+                for pos, patient in enumerate(patients, start=1):
+                    rows.append(AppointmentDetails(
+                        appointment_on=day, doctor=doctor, patient=patient,
+                        payment=pay, mobile_num="9100000000", token_num=f"T{pos}",
+                        que_pos=pos, completed=(pos % 4) - 1, hospital=cls.hospital,
+                    ))
+        AppointmentDetails.objects.bulk_create(rows)
+        cls.doctor = cls.doctors[0]
+
+    def _doctor_day(self, **extra):
+        return AppointmentDetails.objects.filter(
+            hospital=self.hospital, doctor=self.doctor,
+            appointment_on=self.today, **extra,
+        )
+
+    def assertIndexedPlan(self, qs):
+        problems = plan_problems(qs)
+        if problems is None:
+            self.skipTest(f"No plan check for {connection.vendor}")
+        self.assertEqual(problems, [], qs.explain())
+
+    def test_queue_snapshot(self):
+        # queue_dashboard / queue_display / doctor_info_api / get_queued_patients
+        self.assertIndexedPlan(queue_snapshot_queryset(self.hospital, self.today))
+
+    def test_next_queue_position_counts(self):
+        # appointments.utils.get_next_queue_position
+        self.assertIndexedPlan(self._doctor_day(completed=AppointmentDetails.STATUS_IN_QUEUE))
+        self.assertIndexedPlan(self._doctor_day(completed=AppointmentDetails.STATUS_DONE))
+
+    def test_queue_counter_seed(self):
+        # appointments.utils._seed_counter
+        self.assertIndexedPlan(self._doctor_day(
+            completed__in=[AppointmentDetails.STATUS_IN_QUEUE, AppointmentDetails.STATUS_DONE],
+        ).values("doctor").annotate(m=Max("que_pos")))
+
+    def test_waiting_queue_in_order(self):
+        # recompute_queue_etas / send_reschedule_notifications
+        self.assertIndexedPlan(
+            self._doctor_day(completed=AppointmentDetails.STATUS_IN_QUEUE).order_by("que_pos")
+        )
+
+    def test_next_to_call(self):
+        # prescribe_patient: next uncalled patient in the queue
+        self.assertIndexedPlan(
+            self._doctor_day(completed=AppointmentDetails.STATUS_IN_QUEUE, called=False)
+            .order_by("que_pos")
+        )
+
+    def test_patients_for_doctor(self):
+        # patients.views.get_patients_for_doctor
+        for status in (AppointmentDetails.STATUS_REGISTERED,
+                       AppointmentDetails.STATUS_IN_QUEUE,
+                       AppointmentDetails.STATUS_DONE):
+            self.assertIndexedPlan(
+                AppointmentDetails.objects.filter(
+                    doctor_id=self.doctor.pk, hospital=self.hospital,
+                    appointment_on=self.today, completed=status,
+                ).select_related("patient")
+            )
+
+
+class QueueCounterAllocationTests(TestCase):
+    """appointments.utils: positions come from one QueueCounter row per doctor-day."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(
+            hospital_name="Counter Test", phone_num="9990003333",
+            email="counter@test.local", name="counter",
+        )
+        cls.doctor = Doctor.objects.create(
+            doctor_name="Dr Counter", doc_mobile_num="9800000100",
+            average_time_minutes=10, fees=100,
+            hospital=cls.hospital, start_time=time(9, 0),
+        )
+        contact = Contact.objects.create(mobile_num=9100000100, contact_name="C", hospital=cls.hospital)
+        cls.patient = Patient.objects.create(
+            contact=contact, patient_name="P", gender="M", hospital=cls.hospital,
+        )
+        cls.today = date.today()
+
+    def args(self):
+        return self.doctor, self.today, self.hospital
+
+    def test_positions_are_sequential(self):
+        self.assertEqual([allocate_registration_position(*self.args()) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(allocate_queue_position(*self.args()), 1)
+        self.assertEqual(allocate_queue_positions(*self.args(), 3), [2, 3, 4])
+        self.assertEqual(allocate_queue_positions(*self.args(), 0), [])
+        self.assertEqual(QueueCounter.objects.count(), 1)
+
+    def test_new_counter_continues_from_the_board(self):
+        pay = PaymentMaster.objects.create(
+            mobile_num="9100000100", patient=self.patient, total_amount=0,
+            collected_by="test", hospital=self.hospital,
+        )
+        patients = [self.patient] + [
+            Patient.objects.create(
+                contact=self.patient.contact, patient_name=f"P{i}", gender="F", hospital=self.hospital,
+            )
+            for i in (2, 3)
+        ]
+        AppointmentDetails.objects.bulk_create([
+            AppointmentDetails(
+                appointment_on=self.today, doctor=self.doctor, patient=patient, payment=pay,
+                mobile_num="9100000100", token_num=f"T{pos}", que_pos=pos, completed=status,
+                hospital=self.hospital,
+            )
+            for pos, (patient, status) in enumerate(zip(patients, [
+                AppointmentDetails.STATUS_DONE,
+                AppointmentDetails.STATUS_IN_QUEUE,
+                AppointmentDetails.STATUS_REGISTERED,
+            ]), start=1)
+        ])
+        self.assertEqual(allocate_registration_position(*self.args()), 4)
+        self.assertEqual(allocate_queue_position(*self.args()), 3)
+
+    def test_counter_created_concurrently(self):
+        # another desk committed the counter after this transaction's snapshot:
+        # the first lookup misses it and the insert hits the unique key
+        QueueCounter.objects.create(
+            hospital=self.hospital, doctor=self.doctor, appointment_on=self.today,
+            last_registration_pos=7, last_queue_pos=5,
+        )
+        with mock.patch.object(QuerySet, "first", return_value=None):
+            self.assertEqual(allocate_registration_position(*self.args()), 8)
+        self.assertEqual(allocate_queue_position(*self.args()), 6)
+        self.assertEqual(QueueCounter.objects.count(), 1)
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta,time
-from appointments.models import AppointmentDetails
-from django.db.models import Max
+from appointments.models import AppointmentDetails, QueueCounter
+from django.db import IntegrityError, transaction
+from django.db.models import Max, F
 
 
 def get_registration_queue_position(doctor, date, hospital):
@@ -52,3 +53,78 @@ def get_next_queue_position(doctor, date, hospital):
         "next_pos": next_pos,
         "completed_count": completed_count,
     }
+
+
+# ---------------------------------------------------------
+# Atomic position allocation (QueueCounter)
+# ---------------------------------------------------------
+
+def _seed_counter(doctor, date, hospital):
+    """
+    Starting values for a doctor-day counter created after appointments
+    already exist (e.g. first use on a busy day), so allocated positions
+    continue from what is on the board instead of restarting at 1.
+    """
+    day_qs = AppointmentDetails.objects.filter(
+        doctor=doctor,
+        appointment_on=date,
+        hospital=hospital,
+    )
+    last_queue_pos = day_qs.filter(
+        completed__in=[AppointmentDetails.STATUS_IN_QUEUE, AppointmentDetails.STATUS_DONE],
+    ).aggregate(m=Max("que_pos"))["m"] or 0
+
+    return {
+        "last_registration_pos": day_qs.count(),
+        "last_queue_pos": last_queue_pos,
+    }
+
+
+def _get_counter(doctor, date, hospital):
+    lookup = {"hospital": hospital, "doctor": doctor, "appointment_on": date}
+    counter = QueueCounter.objects.filter(**lookup).first()
+    if counter is not None:
+        return counter
+    try:
+        with transaction.atomic():       # savepoint: losing the race keeps the outer transaction
+            return QueueCounter.objects.create(**_seed_counter(doctor, date, hospital), **lookup)
+    except IntegrityError:
+        # Another desk created it first. Only a locking read sees that row: a
+        # plain get() reads this transaction's snapshot (REPEATABLE READ on MySQL).
+        return QueueCounter.objects.select_for_update().get(**lookup)
+
+
+def _allocate(doctor, date, hospital, field, count=1):
+    with transaction.atomic():
+        counter = _get_counter(doctor, date, hospital)
+        # UPDATE takes the row lock; the read-back sees our own increment
+        QueueCounter.objects.filter(pk=counter.pk).update(**{field: F(field) + count})
+        return QueueCounter.objects.values_list(field, flat=True).get(pk=counter.pk)
+
+
+def allocate_registration_position(doctor, date, hospital):
+    """
+    Atomically returns the next position for a newly REGISTERED patient.
+    Two desks registering for the same doctor-day never get the same number.
+    """
+    return _allocate(doctor, date, hospital, "last_registration_pos")
+
+
+def allocate_queue_position(doctor, date, hospital):
+    """
+    Atomically returns the next queue position when a patient moves
+    REGISTERED → IN_QUEUE. Replaces the in_queue + completed counts of
+    get_next_queue_position on the write path.
+    """
+    return _allocate(doctor, date, hospital, "last_queue_pos")
+
+
+def allocate_queue_positions(doctor, date, hospital, count):
+    """
+    Reserve `count` consecutive queue positions in one UPDATE (bulk
+    REGISTERED → IN_QUEUE). Returns them in ascending order.
+    """
+    if count <= 0:
+        return []
+    last = _allocate(doctor, date, hospital, "last_queue_pos", count=count)
+    return list(range(last - count + 1, last + 1))
@@ -17,12 +17,12 @@ from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.dateparse import parse_date
 
-from weasyprint import HTML
-
 from core.decorators import role_required
+from utils.pdf_cache import cached_pdf_response
 from patients.models import Patient
 from services.models import Service
 from appointments.models import AppointmentDetails
+from appointments.history import PAYMENT_LINKS, distinct_patients, doctor_payments_q, status_counts
 from doctors.models import Doctor
 from .forms import PaymentMasterForm, PaymentTransactionFormSet, limit_tx_queryset
 from .models import PaymentMaster, PaymentTransaction
@@ -294,10 +294,8 @@ def bill_receipt(request, pk: int):
 def bill_receipt_pdf(request, pk: int):
     ctx = _receipt_context(request, pk)
     html_str = render_to_string("billing/receipt_print.html", ctx)
-    pdf_bytes = HTML(string=html_str, base_url=request.build_absolute_uri("/")).write_pdf()
-    resp = HttpResponse(pdf_bytes, content_type="application/pdf")
-    resp["Content-Disposition"] = f'inline; filename="receipt-{pk}.pdf"'
-    return resp
+    resp = cached_pdf_response(request, html_str, f"receipt-{pk}.pdf", base_url=request.build_absolute_uri("/"))
+    return resp or HttpResponse("Could not generate the receipt, please try again.", status=503)
 
 
 
@@ -335,22 +333,18 @@ def finance_dashboard(request):
     if pay_type:
         txn_qs = txn_qs.filter(pay_type=pay_type)
 
-    # ----- Queue counts from AppointmentDetails -----
-    appt_qs = AppointmentDetails.objects.filter(
-        hospital=hospital,
-        appointment_on__range=(start, end)
-    )
+    # ----- Queue counts from AppointmentDetails + archive -----
+    appt_filters = {'doctor_id': doctor_id} if doctor_id else {}
     if doctor_id:
-        appt_qs = appt_qs.filter(doctor_id=doctor_id)
-        txn_qs  = txn_qs.filter(payment__appointmentdetails__doctor_id=doctor_id)
-
+        txn_qs  = txn_qs.filter(doctor_payments_q(doctor_id, field='payment'))
 
+    counts = status_counts(hospital, start, end, **appt_filters)
     queue_counts = {
-        'total':      appt_qs.count(),
-        'registered': appt_qs.filter(completed=AppointmentDetails.STATUS_REGISTERED).count(),
-        'in_queue':   appt_qs.filter(completed=AppointmentDetails.STATUS_IN_QUEUE).count(),
-        'done':       appt_qs.filter(completed=AppointmentDetails.STATUS_DONE).count(),
-        'no_show':    appt_qs.filter(completed=AppointmentDetails.STATUS_NO_SHOW).count(),
+        'total':      sum(counts.values()),
+        'registered': counts[AppointmentDetails.STATUS_REGISTERED],
+        'in_queue':   counts[AppointmentDetails.STATUS_IN_QUEUE],
+        'done':       counts[AppointmentDetails.STATUS_DONE],
+        'no_show':    counts[AppointmentDetails.STATUS_NO_SHOW],
     }
 
     # ----- Finance totals -----
@@ -370,24 +364,30 @@ def finance_dashboard(request):
 
 
     # ----- KPIs -----
-    total_op = appt_qs.values('patient_id').distinct().count()
+    total_op = distinct_patients(hospital, start, end, **appt_filters)
     procedures_cnt = txn_qs.filter(service__category__iexact='procedure').count() if service_id else 0
     consultations_cnt = txn_qs.filter(service__category__iexact='consultation').count() if service_id else 0
     lab_cnt = txn_qs.filter(service__category__iexact='lab').count() if service_id else 0
 
     # ----- Top doctors by revenue -----
-    top_doctors_qs = (
-    txn_qs.values(
-        doc_id=F('payment__appointmentdetails__doctor_id'),
-        doc_name=F('payment__appointmentdetails__doctor__doctor_name'),
-    )
-    .annotate(amount=Sum('amount'))
-    .filter(doc_id__isnull=False)
-    .order_by('-amount')[:10]
-    )
+    # a payment's appointment is either hot or archived, so sum per table and merge
+    doctor_totals = {}
+    for link in PAYMENT_LINKS:
+        rows = (
+            txn_qs.values(
+                doc_id=F(f'payment__{link}__doctor_id'),
+                doc_name=F(f'payment__{link}__doctor__doctor_name'),
+            )
+            .annotate(amount=Sum('amount'))
+            .filter(doc_id__isnull=False)
+        )
+        if doctor_id:
+            rows = rows.filter(doc_id=doctor_id)
+        for r in rows:
+            entry = doctor_totals.setdefault(r['doc_id'], {'id': r['doc_id'], 'name': r['doc_name'], 'amount': 0})
+            entry['amount'] += r['amount'] or 0
 
-    top_doctors = [{'id': r['doc_id'], 'name': r['doc_name'], 'amount': r['amount'] or 0}
-                   for r in top_doctors_qs]
+    top_doctors = sorted(doctor_totals.values(), key=lambda d: d['amount'], reverse=True)[:10]
 
     # ----- Top services by revenue -----
     top_services_qs = (
@@ -0,0 +1,206 @@
+# core/management/commands/archive_closed_days.py
+# usage: python manage.py archive_closed_days [--keep-days 30] [--batch-size 1000] [--hospital 4] [--dry-run]
+# Run nightly after build_service_stats, e.g. 03:00:
+#   0 3 * * * python manage.py archive_closed_days
+#
+# Moves closed days out of the hot tables (appointment_details and the rows
+# that grow with it) into *_history tables with the same primary keys, so
+# the queue screens keep working on small indexes. Old drug change log rows
+# (drugs.catalog) are deleted; browsers that far behind reload the catalog.
+# Sent and failed WhatsApp outbox rows that old are deleted too (the
+# message log keeps what was sent), and so are processed webhook events.
+# Reports read both through
+# appointments.history, and build_service_stats reads both tables too: its
+# --days window (default 90) is not cut short by a smaller --keep-days.
+
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+
+from appointments.models import (
+    AppointmentAuditLog, AppointmentAuditLogHistory,
+    AppointmentDetails, AppointmentHistory,
+)
+from drugs.catalog import prune_drug_changes
+from prescription.models import PrescriptionDraft, PrescriptionDraftHistory
+from whatsapp_notifications.models import (
+    WhatsappMessageLog, WhatsappMessageLogHistory, WhatsappOutbox, WhatsappWebhookEvent,
+)
+
+
+def _copy_fields(hot, cold):
+    """attnames present in both models (the cold one adds archived_at)."""
+    cold_names = {f.attname for f in cold._meta.concrete_fields}
+    return [f.attname for f in hot._meta.concrete_fields if f.attname in cold_names]
+
+
+def _raw_delete(model, field, ids):
+    """
+    Plain DELETE ... WHERE <field> IN (...).
+    Skips Django's collector on purpose: prescriptions, vitals and visit
+    notes keep pointing at the archived appointment id instead of being
+    set to NULL (those FKs are db_constraint=False).
+    """
+    if not ids:
+        return 0
+    column = model._meta.get_field(field).column
+    marks = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)} "
+            f"WHERE {connection.ops.quote_name(column)} IN ({marks})",
+            list(ids),
+        )
+        return cursor.rowcount
+
+
+def _detach_references(model, ids):
+    """
+    NULL the SET_NULL foreign keys that point at rows about to be raw-deleted
+    (WhatsappOutbox.log, WhatsappInboundMessage.in_reply_to), i.e. what
+    Django's collector would have done, in the same transaction.
+    """
+    for rel in model._meta.related_objects:
+        field = rel.field
+        if rel.on_delete is models.SET_NULL and field.db_constraint and not field.many_to_many:
+            rel.related_model.objects.filter(**{f"{field.name}__in": ids}).update(**{field.name: None})
+
+
+class Command(BaseCommand):
+    help = (
+        "Move appointments, audit logs, drafts and WhatsApp logs older than --keep-days into "
+        "history tables; delete drug change log rows, finished outbox rows and processed "
+        "webhook events as old"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-days", type=int, default=30,
+            help="Days kept in the hot tables (build_service_stats --days still sees older, archived days)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows moved per transaction")
+        parser.add_argument("--hospital", type=int, help="Only this hospital id")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would move")
+
+    def handle(self, *args, **options):
+        if options["keep_days"] < 1:
+            raise CommandError("--keep-days must be at least 1 (today is never archived)")
+
+        cutoff = date.today() - timedelta(days=options["keep_days"])
+        cutoff_dt = datetime.combine(cutoff, datetime.min.time())
+        self.batch_size = max(1, options["batch_size"])
+        self.dry_run = options["dry_run"]
+        scope = {"hospital_id": options["hospital"]} if options["hospital"] else {}
+
+        started = time.monotonic()
+        moved = {
+            "appointments": self._archive_appointments(cutoff, scope),
+            "drafts": self._archive_simple(
+                PrescriptionDraft, PrescriptionDraftHistory,
+                PrescriptionDraft.objects.filter(updated_at__lt=cutoff_dt, **scope),
+            ),
+            "whatsapp logs": self._archive_simple(
+                WhatsappMessageLog, WhatsappMessageLogHistory,
+                WhatsappMessageLog.objects.filter(created_at__lt=cutoff_dt, **scope),
+            ),
+        }
+        deleted = {
+            # global catalog changes have no hospital: only a full run prunes them
+            "drug change log rows": 0 if scope else prune_drug_changes(cutoff_dt, self.batch_size, self.dry_run),
+            "sent/failed outbox rows": self._purge(WhatsappOutbox.objects.filter(
+                status__in=[WhatsappOutbox.STATUS_SENT, WhatsappOutbox.STATUS_FAILED],
+                created_at__lt=cutoff_dt, **scope,
+            )),
+            # pending ones (receipts still waiting for their log) stay
+            "processed webhook events": self._purge(WhatsappWebhookEvent.objects.filter(
+                processed_at__lt=cutoff_dt, **scope,
+            )),
+        }
+        elapsed = time.monotonic() - started
+
+        total = sum(n for n, _ in moved.values())
+        summary = ", ".join(f"{n} {name}" for name, (n, _) in moved.items())
+        removed = ", ".join(f"{n} {name}" for name, n in deleted.items())
+        audits = moved["appointments"][1]
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING(
+                f"Dry run: would archive {summary} (+{audits} audit rows) and delete "
+                f"{removed} before {cutoff}"
+            ))
+            return
+
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Archived {summary} (+{audits} audit rows) before {cutoff} "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/s); deleted {removed}"
+        ))
+
+    # 1️⃣ appointments + their audit trail, one batch per transaction
+    def _archive_appointments(self, cutoff, scope):
+        qs = AppointmentDetails.objects.filter(appointment_on__lt=cutoff, **scope)
+        if self.dry_run:
+            ids = qs.values("appoint_id")
+            return qs.count(), AppointmentAuditLog.objects.filter(appointment_id__in=ids).count()
+
+        appt_fields = _copy_fields(AppointmentDetails, AppointmentHistory)
+        audit_fields = _copy_fields(AppointmentAuditLog, AppointmentAuditLogHistory)
+        moved = audits = 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    qs.order_by("appoint_id")
+                      .select_for_update()
+                      .values(*appt_fields)[:self.batch_size]
+                )
+                if not rows:
+                    break
+                ids = [r["appoint_id"] for r in rows]
+                AppointmentHistory.objects.bulk_create(
+                    [AppointmentHistory(**r) for r in rows], ignore_conflicts=True,
+                )
+
+                audit_rows = list(
+                    AppointmentAuditLog.objects.filter(appointment_id__in=ids).values(*audit_fields)
+                )
+                AppointmentAuditLogHistory.objects.bulk_create(
+                    [AppointmentAuditLogHistory(**r) for r in audit_rows],
+                    batch_size=self.batch_size, ignore_conflicts=True,
+                )
+
+                # children first, then the appointments themselves
+                audits += _raw_delete(AppointmentAuditLog, "appointment", ids)
+                moved += _raw_delete(AppointmentDetails, "appoint_id", ids)
+        return moved, audits
+
+    # 2️⃣ standalone tables: copy + delete by primary key
+    def _archive_simple(self, hot, cold, qs):
+        if self.dry_run:
+            return qs.count(), 0
+
+        fields = _copy_fields(hot, cold)
+        pk = hot._meta.pk.attname
+        moved = 0
+        while True:
+            with transaction.atomic():
+                rows = list(qs.order_by(pk).select_for_update().values(*fields)[:self.batch_size])
+                if not rows:
+                    break
+                ids = [r[pk] for r in rows]
+                cold.objects.bulk_create([cold(**r) for r in rows], ignore_conflicts=True)
+                _detach_references(hot, ids)
+                moved += _raw_delete(hot, pk, ids)
+        return moved, 0
+
+    # 3️⃣ rows nobody reads once done: delete in id batches, one transaction each
+    def _purge(self, qs):
+        if self.dry_run:
+            return qs.count()
+        removed = 0
+        while True:
+            ids = list(qs.order_by("pk").values_list("pk", flat=True)[:self.batch_size])
+            if not ids:
+                return removed
+            with transaction.atomic():
+                removed += qs.model.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,83 @@
+# core/management/commands/benchmark_doubletick.py
+# usage: python manage.py benchmark_doubletick [--count 500] [--concurrency 8] [--latency-ms 20]
+# Starts a local stub of the DoubleTick endpoint (or uses --url) and measures
+# messages/second for one-off requests.post calls vs the pooled client.
+# Nothing is written to the database.
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+from whatsapp_notifications.client import DOUBLETICK_HEADERS, DoubleTickClient
+from whatsapp_notifications.services import build_payload
+
+
+def _stub_server(latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"      # keep-alive, like the real provider
+        disable_nagle_algorithm = True
+        wbufsize = -1                      # headers + body in one write (no delayed-ACK stalls)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("content-length", 0)))
+            time.sleep(latency)
+            body = json.dumps({"messages": [{"messageId": f"stub-{time.monotonic_ns()}"}]}).encode()
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Command(BaseCommand):
+    help = "Benchmark DoubleTick sends (messages/second) against a local stub server"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500, help="Messages per run")
+        parser.add_argument("--concurrency", type=int, default=8, help="Sender threads")
+        parser.add_argument("--latency-ms", type=int, default=20, help="Stub response delay")
+        parser.add_argument("--url", help="Post to this endpoint instead of the built-in stub")
+
+    def handle(self, *args, **options):
+        server = None
+        url = options["url"]
+        if not url:
+            server = _stub_server(options["latency_ms"] / 1000)
+            url = f"http://127.0.0.1:{server.server_port}/send"
+
+        payload = build_payload("benchmark", "9000000000", ["Patient", "Dr", "1", "1"], phone_num="9000000001")
+        pooled = DoubleTickClient(pool_size=options["concurrency"])
+
+        def unpooled(_):
+            resp = requests.post(url, headers=DOUBLETICK_HEADERS, json=payload, timeout=pooled.timeout)
+            resp.raise_for_status()
+
+        def with_pool(_):
+            pooled.post_template(url, payload)
+
+        try:
+            self.stdout.write(f"{options['count']} messages, {options['concurrency']} threads → {url}")
+            for label, send in (("requests.post", unpooled), ("pooled client", with_pool)):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                    list(pool.map(send, range(options["count"])))
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f"  {label:<14} {options['count'] / elapsed:8.1f} msg/s  ({elapsed:.2f}s)"
+                ))
+        finally:
+            if server:
+                server.shutdown()
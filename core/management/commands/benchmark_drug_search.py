@@ -0,0 +1,108 @@
+# core/management/commands/benchmark_drug_search.py
+# usage: python manage.py benchmark_drug_search [--repeat 50] [--terms pa,para,cillin]
+# Times global drug lookups three ways over the same terms (1-5 letter
+# prefixes and mid-word substrings):
+#   db      – Drug.objects.filter(drug_name__icontains=...) (the old autocomplete)
+#   memory  – drugs.search with DRUG_SEARCH_BACKEND = "memory"
+#   fts5    – drugs.search with DRUG_SEARCH_BACKEND = "fts5" (the FTS file is
+#             built to a temp file if --path is not given)
+# and reports p50 / p95 per path plus the memory each index holds.
+# Short terms go through the search memo, as they do in production.
+# Nothing is written to the database.
+
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from drugs.fts import build_fts_file
+from drugs.models import Drug, drug_scope_key
+from drugs.search import ENTRY_FIELDS, DrugSearchIndex, normalize
+
+DEFAULT_TERMS = "p,pa,par,para,parac,am,amox,az,azi,dolo,cillin,mycin,zole,650,tab"
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples) * 1000, p95 * 1000
+
+
+class Command(BaseCommand):
+    help = "Benchmark global drug autocomplete: MySQL icontains vs in-memory index vs SQLite FTS5"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50, help="Lookups per term and path")
+        parser.add_argument("--limit", type=int, default=20, help="Results per lookup")
+        parser.add_argument("--terms", default=DEFAULT_TERMS, help="Comma-separated search terms")
+        parser.add_argument("--path", help="Use this FTS file instead of building a temporary one")
+
+    def handle(self, *args, **options):
+        terms = [normalize(t) for t in options["terms"].split(",") if t.strip()]
+        repeat, limit = options["repeat"], options["limit"]
+        global_drugs = Drug.objects.filter(scope_key=drug_scope_key())
+
+        path, tmp = options["path"], None
+        if not path:
+            tmp = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+            tmp.close()
+            path = tmp.name
+            rows = global_drugs.order_by().values_list(*ENTRY_FIELDS).iterator(chunk_size=2000)
+            build_fts_file((DrugSearchIndex._entry(row) for row in rows), path)
+        self.stdout.write(f"fts5 file: {os.path.getsize(path) / 1e6:.1f} MB on disk, shared by all workers (mmap)")
+
+        indexes = {}
+        for backend in ("memory", "fts5"):
+            with override_settings(DRUG_SEARCH_BACKEND=backend, DRUG_SEARCH_FTS_PATH=path):
+                tracemalloc.start()
+                started = time.perf_counter()
+                index = DrugSearchIndex()
+                drugs = index.build()
+                memory_mb = tracemalloc.get_traced_memory()[0] / 1e6
+                tracemalloc.stop()
+            indexes[backend] = index
+            self.stdout.write(
+                f"{backend} index: {drugs} drugs in memory, {time.perf_counter() - started:.1f}s, "
+                f"{memory_mb:.1f} MB per process"
+            )
+
+        def run_db(q):
+            return list(global_drugs.filter(drug_name__icontains=q).values_list("id", flat=True)[:limit])
+
+        def run_memory(q):
+            return indexes["memory"].search(q, limit=limit)
+
+        def run_fts(q):
+            with override_settings(DRUG_SEARCH_FTS_PATH=path):
+                return indexes["fts5"].search(q, limit=limit)
+
+        paths = (("db", run_db), ("memory", run_memory), ("fts5", run_fts))
+        header = f"{'term':<10}" + "".join(f"{name + ' p50/p95 ms':>24}" for name, _ in paths)
+        self.stdout.write(header)
+        totals = {name: [] for name, _ in paths}
+        try:
+            for q in terms:
+                line = f"{q:<10}"
+                for name, fn in paths:
+                    fn(q)                                    # warm up (connections, page cache)
+                    samples = []
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        fn(q)
+                        samples.append(time.perf_counter() - started)
+                    totals[name] += samples
+                    p50, p95 = _percentiles(samples)
+                    line += f"{p50:>15.3f} / {p95:<6.3f}"
+                self.stdout.write(line)
+        finally:
+            if tmp:
+                os.remove(path)
+
+        self.stdout.write("")
+        for name, _ in paths:
+            p50, p95 = _percentiles(totals[name])
+            self.stdout.write(self.style.SUCCESS(f"✅ {name:<7} p50 {p50:.3f} ms   p95 {p95:.3f} ms"))
@@ -0,0 +1,32 @@
+# core/management/commands/build_drug_fts.py
+# usage: python manage.py build_drug_fts [--path /srv/quelo/drug_search.sqlite3]
+# Writes the global drug library into the SQLite FTS5 file used when
+# DRUG_SEARCH_BACKEND = "fts5" (drugs.fts). import_drugs runs it after an
+# import; after admin edits of global drugs the workers rewrite it
+# themselves (drugs.search.refresh_fts_file).
+#
+# The file is built next to the old one and renamed over it, so running
+# workers keep answering and switch to the new file within a few seconds.
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from drugs.fts import build_lock, fts_path
+from drugs.search import write_global_fts
+
+
+class Command(BaseCommand):
+    help = "Build the SQLite FTS5 search file for global drugs (DRUG_SEARCH_BACKEND = 'fts5')"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Output file (default: settings.DRUG_SEARCH_FTS_PATH)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        path = options["path"] or fts_path()
+        with build_lock(path):           # not alongside a worker's refresh
+            count = write_global_fts(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {count} global drugs written to {path} in {time.perf_counter() - started:.1f}s"
+        ))
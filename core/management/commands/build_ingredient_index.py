@@ -0,0 +1,95 @@
+# core/management/commands/build_ingredient_index.py
+# usage: python manage.py build_ingredient_index [--catalog drugs.db] [--batch-size 1000] [--fill-composition]
+# Run once after migrating (and after bulk imports that bypass Drug.save).
+#
+# Parses every Drug.composition into Ingredient / DrugIngredient rows and
+# sets Drug.composition_key (drugs.composition). Drugs without a composition
+# can take it from the drugs.db catalog by name (--catalog); with
+# --fill-composition that text is also saved on the Drug.
+
+import sqlite3
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from drugs.catalog import log_drug_changes
+from drugs.composition import composition_key
+from drugs.ingredients import sync_drug_ingredients
+from drugs.models import Drug, drug_name_key
+
+
+def _load_catalog(path):
+    """{normalized drug name: composition} from the drugs.db SQLite catalog."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT drug_name, composition FROM drugs "
+            "WHERE drug_name IS NOT NULL AND composition IS NOT NULL AND TRIM(composition) != ''"
+        )
+        catalog = {}
+        for name, composition in rows:
+            catalog.setdefault(drug_name_key(name), composition.strip())
+        return catalog
+    finally:
+        conn.close()
+
+
+class Command(BaseCommand):
+    help = "Build the salt/strength ingredient index (DrugIngredient) and Drug.composition_key"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", help="drugs.db SQLite catalog for drugs without a composition")
+        parser.add_argument("--fill-composition", action="store_true",
+                            help="Save catalog compositions onto drugs that have none")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Drugs per transaction")
+
+    def handle(self, *args, **options):
+        catalog = {}
+        if options["catalog"]:
+            path = Path(options["catalog"]).expanduser().resolve()
+            if not path.exists():
+                raise CommandError(f"Catalog not found: {path}")
+            catalog = _load_catalog(path)
+            self.stdout.write(f"📚 {len(catalog)} catalog compositions loaded from {path}")
+
+        started = time.perf_counter()
+        last_id, drugs, links, filled = 0, 0, 0, 0
+        while True:
+            batch = list(
+                Drug.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .only("id", "name_key", "scope_key", "composition", "composition_key")[:options["batch_size"]]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            overrides, changed = {}, []
+            for drug in batch:
+                text = drug.composition
+                if not (text or "").strip() and catalog.get(drug.name_key):
+                    text = overrides[drug.id] = catalog[drug.name_key]
+                    if options["fill_composition"]:
+                        drug.composition = text.capitalize()
+                        filled += 1
+                key = composition_key(text)
+                if key != drug.composition_key or drug.id in overrides:
+                    drug.composition_key = key
+                    changed.append(drug)
+
+            with transaction.atomic():
+                links += sync_drug_ingredients(batch, compositions=overrides)
+                # bulk_update skips Drug.save(): no duplicate-name query per row
+                fields = ["composition_key"] + (["composition"] if options["fill_composition"] else [])
+                Drug.objects.bulk_update(changed, fields, batch_size=500)
+                if options["fill_composition"]:
+                    log_drug_changes([d for d in changed if d.id in overrides])
+            drugs += len(batch)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {drugs} drugs, {links} ingredient rows, {filled} compositions filled "
+            f"in {elapsed:.1f}s ({drugs / elapsed if elapsed else 0:.0f} drugs/s)"
+        ))
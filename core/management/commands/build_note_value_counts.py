@@ -0,0 +1,59 @@
+# core/management/commands/build_note_value_counts.py
+# usage: python manage.py build_note_value_counts [--hospital 4]
+# Run once after migrating; afterwards core.signals keeps the counts current.
+#
+# Recounts dosage / frequency / duration / food_order values of
+# PrescriptionDetails into NoteValueCount (drugs.presets).
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from drugs.models import NoteValueCount
+from drugs.presets import COUNTED_FIELDS, clear_note_caches
+from prescription.models import PrescriptionDetails
+
+
+class Command(BaseCommand):
+    help = "Rebuild the (hospital, field, value) usage counts behind notes autocomplete"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hospital", type=int, help="Only this hospital id")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        details = PrescriptionDetails.objects.all()
+        scope = NoteValueCount.objects.all()
+        if options["hospital"]:
+            details = details.filter(hospital_id=options["hospital"])
+            scope = scope.filter(hospital_id=options["hospital"])
+
+        counts = {}
+        for field in COUNTED_FIELDS:
+            rows = (
+                details.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+                .values_list("hospital_id", field)
+                .annotate(n=Count("id"))
+                .order_by()
+            )
+            for hospital_id, value, n in rows:
+                # same normalization as drugs.presets.note_values()
+                value = value.strip()[:100]
+                if value:
+                    key = (hospital_id, field, value)
+                    counts[key] = counts.get(key, 0) + n
+
+        with transaction.atomic():
+            scope.delete()
+            NoteValueCount.objects.bulk_create(
+                [NoteValueCount(hospital_id=h, field=f, value=v, count=n) for (h, f, v), n in counts.items()],
+                batch_size=1000,
+                ignore_conflicts=True,   # MySQL collation may fold case-only twins
+            )
+
+        clear_note_caches()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(counts)} note values counted in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,141 @@
+# core/management/commands/build_service_stats.py
+# usage: python manage.py build_service_stats [--days 90] [--hospital 4]
+# Run nightly (cron / EB scheduled task), e.g. 02:30:
+#   30 2 * * * python manage.py build_service_stats
+#
+# Reads appointment_details and its archive (archive_closed_days) together,
+# so --days may reach further back than archive_closed_days --keep-days:
+# the stats window wins, archiving never shortens it.
+
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from appointments.models import AppointmentDetails, AppointmentHistory, DoctorServiceStat
+from utils.eta_calculator import clear_service_stats_cache
+
+EPOCH = datetime(1970, 1, 1)   # naive, like the stored datetimes (USE_TZ=False)
+MIN_MINUTES = 0.5
+MAX_MINUTES = 120
+EWMA_ALPHA = 0.2
+
+
+def _seconds(values):
+    """Naive datetimes -> float seconds since EPOCH (NaN for None)."""
+    return np.array(
+        [(v - EPOCH).total_seconds() if v else np.nan for v in values],
+        dtype=float,
+    )
+
+
+def _ewma(x, alpha=EWMA_ALPHA):
+    """EWMA of a chronological series, seeded with its first value."""
+    n = x.size
+    weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1, dtype=float)
+    weights[0] = (1 - alpha) ** (n - 1)
+    return float(np.dot(weights, x))
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-doctor service-time stats (median / p90 / EWMA by weekday and hour)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90,
+                            help="History window in days (hot and archived appointments)")
+        parser.add_argument("--hospital", type=int, help="Only this hospital id")
+        parser.add_argument("--min-samples", type=int, default=3,
+                            help="Skip buckets with fewer consultations")
+
+    def handle(self, *args, **options):
+        since = date.today() - timedelta(days=options["days"])
+
+        lookup = dict(
+            completed=AppointmentDetails.STATUS_DONE,
+            completed_at__isnull=False,
+            appointment_on__gte=since,
+        )
+        if options["hospital"]:
+            lookup["hospital_id"] = options["hospital"]
+
+        # closed days older than archive_closed_days --keep-days live in the archive
+        hot, archived = (
+            model.objects.filter(**lookup).order_by()
+                 .values_list("hospital_id", "doctor_id", "queue_start_time", "completed_at")
+            for model in (AppointmentDetails, AppointmentHistory)
+        )
+        rows = list(
+            hot.union(archived, all=True)
+               .order_by("doctor_id", "completed_at")
+               .iterator(chunk_size=5000)
+        )
+        if not rows:
+            self.stdout.write(self.style.WARNING("No completed appointments in range."))
+            return
+
+        hospital_ids, doctor_ids, queued_at, done_at = zip(*rows)
+        hosp = np.array(hospital_ids, dtype=np.int64)
+        doc = np.array(doctor_ids, dtype=np.int64)
+        queued = _seconds(queued_at)
+        done = _seconds(done_at)
+        day = np.floor(done / 86400).astype(np.int64)
+
+        # A consultation starts once the patient is queued AND the
+        # doctor has finished the previous patient of the same day.
+        prev_done = np.roll(done, 1)
+        same_run = (doc == np.roll(doc, 1)) & (day == np.roll(day, 1))
+        same_run[0] = False
+        start = np.where(same_run, np.fmax(queued, prev_done), queued)
+
+        minutes = (done - start) / 60.0
+        ok = np.isfinite(minutes) & (minutes >= MIN_MINUTES) & (minutes <= MAX_MINUTES)
+        hosp, doc, start, done, minutes = hosp[ok], doc[ok], start[ok], done[ok], minutes[ok]
+        if not minutes.size:
+            self.stdout.write(self.style.WARNING("No usable consultation durations."))
+            return
+
+        start_day = np.floor(start / 86400).astype(np.int64)
+        weekday = (start_day + 3) % 7                      # 1970-01-01 was a Thursday
+        hour = ((start - start_day * 86400) // 3600).astype(np.int64)
+
+        # Group by (doctor, weekday, hour), chronological inside each group
+        order = np.lexsort((done, hour, weekday, doc))
+        hosp, doc, weekday, hour, minutes = (
+            hosp[order], doc[order], weekday[order], hour[order], minutes[order]
+        )
+        key = np.stack([doc, weekday, hour], axis=1)
+        bounds = np.flatnonzero(np.any(key[1:] != key[:-1], axis=1)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [minutes.size]))
+
+        stats = []
+        for lo, hi in zip(starts, ends):
+            if hi - lo < options["min_samples"]:
+                continue
+            x = minutes[lo:hi]
+            p50, p90 = np.percentile(x, [50, 90])
+            stats.append(DoctorServiceStat(
+                hospital_id=int(hosp[lo]),
+                doctor_id=int(doc[lo]),
+                weekday=int(weekday[lo]),
+                hour=int(hour[lo]),
+                samples=int(x.size),
+                median_minutes=round(float(p50), 2),
+                p90_minutes=round(float(p90), 2),
+                ewma_minutes=round(_ewma(x), 2),
+            ))
+
+        scope = DoctorServiceStat.objects.all()
+        if options["hospital"]:
+            scope = scope.filter(hospital_id=options["hospital"])
+
+        with transaction.atomic():
+            scope.delete()
+            DoctorServiceStat.objects.bulk_create(stats, batch_size=500)
+
+        clear_service_stats_cache()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(stats)} service-time buckets from {int(minutes.size)} consultations "
+            f"({len(set(doc.tolist()))} doctors, since {since})"
+        ))
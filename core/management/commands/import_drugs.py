@@ -1,11 +1,18 @@
 import csv
+import sqlite3
+import time
 from pathlib import Path
-from typing import Set
+from typing import Dict, Iterator, List, Optional
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import connection, transaction
 
-from drugs.models import Drug
+from drugs.catalog import log_drug_changes
+from drugs.composition import composition_key
+from drugs.fts import fts_enabled
+from drugs.ingredients import sync_drug_ingredients
+from drugs.models import Drug, drug_name_key, drug_scope_key
 
 
 REQUIRED_COLS = {"drug_name"}
@@ -14,100 +21,187 @@ OPTIONAL_COLS = {
     "composition", "uses", "side_effects", "manufacturer",
     "dosage", "frequency", "duration",
 }
+# drugs.db (SQLite catalog) has these columns
+SQLITE_COLS = ("drug_name", "composition", "uses", "side_effects", "manufacturer")
 
 
 class Command(BaseCommand):
-    help = "Import drugs from a CSV file into the global drug library (hospital=None, added_by_doctor=None)."
+    help = (
+        "Import drugs from a CSV file or the drugs.db SQLite catalog into the global drug library "
+        "(hospital=None, added_by_doctor=None), streaming in chunks with bulk inserts."
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument("--csv", required=True, help="Path to drugs.csv")
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument("--csv", help="Path to drugs.csv")
+        source.add_argument("--sqlite", help="Path to the drugs.db catalog (table `drugs`)")
         parser.add_argument("--encoding", default="utf-8", help="CSV encoding (default: utf-8)")
         parser.add_argument("--delimiter", default=",", help="CSV delimiter (default: ,)")
         parser.add_argument("--limit", type=int, default=None, help="Import at most N rows (useful for testing).")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per bulk INSERT / transaction.")
+        parser.add_argument("--update", action="store_true",
+                            help="Upsert: also update existing global drugs whose details changed.")
         parser.add_argument("--dry-run", action="store_true", help="Parse and validate, but do not write to DB.")
 
-    def handle(self, *args, **opts):
-        csv_path = Path(opts["csv"]).expanduser().resolve()
-        if not csv_path.exists():
-            raise CommandError(f"CSV file not found: {csv_path}")
+    # ------------------------------------------------------------------
+    # sources: plain dicts, one row at a time
+    # ------------------------------------------------------------------
+    def _csv_rows(self, path: Path, encoding: str, delimiter: str) -> Iterator[Dict[str, str]]:
+        with path.open("r", encoding=encoding, newline="") as f:
+            reader = csv.DictReader(f, delimiter=delimiter)
+            header = {h.strip() for h in reader.fieldnames or []}
+            missing = REQUIRED_COLS - header
+            if missing:
+                raise CommandError(f"CSV missing required columns: {', '.join(sorted(missing))}")
+            for row in reader:
+                yield {(k or "").strip(): v for k, v in row.items()}
+
+    def _sqlite_rows(self, path: Path, chunk: int) -> Iterator[Dict[str, str]]:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(
+                f"SELECT {', '.join(SQLITE_COLS)} FROM drugs "
+                "WHERE drug_name IS NOT NULL AND TRIM(drug_name) != '' ORDER BY id"
+            )
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(zip(SQLITE_COLS, row))
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    def _build(self, row: Dict[str, str]) -> Optional[Drug]:
+        """Normalize like Drug.save() does (bulk_create skips save())."""
+        raw_name = (row.get("drug_name") or "").strip()
+        if not raw_name:
+            return None
+        kwargs = {"drug_name": raw_name.title(), "hospital": None, "added_by_doctor": None}
+        for col in OPTIONAL_COLS:
+            if col in row:
+                kwargs[col] = (row.get(col) or "").strip() or None
+        if kwargs.get("composition"):
+            kwargs["composition"] = kwargs["composition"].capitalize()
+        drug = Drug(**kwargs)
+        drug.composition_key = composition_key(drug.composition)
+        drug.name_key = drug_name_key(drug.drug_name)
+        drug.scope_key = drug_scope_key()
+        return drug
+
+    def _flush(self, new: List[Drug], changed: List[Drug], fields: List[str], batch_size: int) -> None:
+        with transaction.atomic():
+            Drug.objects.bulk_create(new, batch_size=batch_size)
+            if changed:
+                Drug.objects.bulk_update(changed, fields, batch_size=batch_size)
+
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # MySQL: no ids back from bulk INSERT, read them by name
+                ids = dict(
+                    Drug.objects.filter(scope_key=drug_scope_key(), name_key__in=[d.name_key for d in new])
+                    .values_list("name_key", "id")
+                )
+                for d in new:
+                    d.pk = ids.get(d.name_key)
+            written = [d for d in new + changed if d.pk]
+            sync_drug_ingredients(written)
+            log_drug_changes(written)           # browser catalog deltas
 
-        encoding = opts["encoding"]
-        delimiter = opts["delimiter"]
+    def handle(self, *args, **opts):
+        batch_size = opts["batch_size"]
         limit = opts["limit"]
         dry_run = opts["dry_run"]
-
-        self.stdout.write(self.style.NOTICE(f"Reading: {csv_path}"))
-        self.stdout.write(self.style.NOTICE(f"Options: encoding={encoding}, delimiter='{delimiter}', dry_run={dry_run}, limit={limit}"))
-
-        # Load existing GLOBAL drugs (hospital=None & added_by_doctor=None) for fast duplicate checks.
-        existing: Set[str] = set(
-            Drug.objects.filter(hospital__isnull=True, added_by_doctor__isnull=True)
-                        .values_list("drug_name", flat=True)
-        )
-        existing = {(n or "").strip().lower() for n in existing}
-
-        inserted = 0
-        skipped  = 0
-        seen_in_batch: Set[str] = set()  # Avoid duplicates within the CSV itself
-
-        # Use a transaction for integrity; no commit if dry-run.
-        ctx = transaction.atomic
-        with ctx():
-            with csv_path.open("r", encoding=encoding, newline="") as f:
-                reader = csv.DictReader(f, delimiter=delimiter)
-
-                # Validate header
-                header = {h.strip() for h in reader.fieldnames or []}
-                missing = REQUIRED_COLS - header
-                if missing:
-                    raise CommandError(f"CSV missing required columns: {', '.join(sorted(missing))}")
-
-                count = 0
-                for row in reader:
-                    if limit is not None and count >= limit:
-                        break
-                    count += 1
-
-                    # Normalize name
-                    raw_name = (row.get("drug_name") or "").strip()
-                    if not raw_name:
-                        skipped += 1
-                        continue
-
-                    key = raw_name.lower()
-                    if key in existing or key in seen_in_batch:
-                        skipped += 1
-                        continue
-
-                    # Build Drug instance with optional fields if present
-                    kwargs = {
-                        "drug_name": raw_name,
-                        "hospital": None,
-                        "added_by_doctor": None,
-                    }
-                    for col in OPTIONAL_COLS:
-                        if col in row:
-                            val = (row.get(col) or "").strip() or None
-                            kwargs[col] = val
-
-                    d = Drug(**kwargs)
-
-                    try:
-                        # Your model's save() enforces scope-duplicate rules — keep per-row save.
-                        d.full_clean()
-                        if not dry_run:
-                            d.save()
-                        inserted += 1
-                        seen_in_batch.add(key)
-                    except ValueError:
-                        # Duplicate in scope or model-level guard tripped
-                        skipped += 1
-
-            if dry_run:
-                # Ensure nothing is written when --dry-run is used.
-                transaction.set_rollback(True)
-
+        update = opts["update"]
+
+        if opts["csv"]:
+            path = Path(opts["csv"]).expanduser().resolve()
+            if not path.exists():
+                raise CommandError(f"CSV file not found: {path}")
+            rows = self._csv_rows(path, opts["encoding"], opts["delimiter"])
+        else:
+            path = Path(opts["sqlite"]).expanduser().resolve()
+            if not path.exists():
+                raise CommandError(f"SQLite catalog not found: {path}")
+            rows = self._sqlite_rows(path, batch_size)
+
+        self.stdout.write(self.style.NOTICE(f"Reading: {path}"))
+        self.stdout.write(self.style.NOTICE(
+            f"Options: batch_size={batch_size}, update={update}, dry_run={dry_run}, limit={limit}"
+        ))
+
+        # One query: Drug.name_key -> existing GLOBAL drug (only the columns we may update)
+        fields = sorted(OPTIONAL_COLS) + ["composition_key"]
+        existing: Dict[str, Drug] = {
+            d.name_key: d
+            for d in Drug.objects.filter(scope_key=drug_scope_key())
+                                 .only("id", "drug_name", "name_key", *fields)
+        }
+
+        inserted = updated = skipped = count = 0
+        seen = set()                # name_keys already taken from this file: first row wins
+        duplicates: List[str] = []
+        new: List[Drug] = []
+        changed: List[Drug] = []
+        started = time.perf_counter()
+
+        for row in rows:
+            if limit is not None and count >= limit:
+                break
+            count += 1
+
+            drug = self._build(row)
+            if drug is None:
+                skipped += 1
+                continue
+            if drug.name_key in seen:
+                # same drug spelled twice in the file; applying both would flip the
+                # row back and forth on every --update run
+                duplicates.append(drug.drug_name)
+                skipped += 1
+                continue
+            seen.add(drug.name_key)
+
+            current = existing.get(drug.name_key)
+            if current is None:
+                new.append(drug)
+                inserted += 1
+            elif update and current.pk:
+                # only columns the source actually has
+                diff = [f for f in OPTIONAL_COLS if f in row and getattr(drug, f) != getattr(current, f)]
+                if diff:
+                    for f in diff:
+                        setattr(current, f, getattr(drug, f))
+                    current.composition_key = composition_key(current.composition)
+                    changed.append(current)
+                    updated += 1
+                else:
+                    skipped += 1
+            else:
+                skipped += 1
+
+            if len(new) + len(changed) >= batch_size:
+                if not dry_run:
+                    self._flush(new, changed, fields, batch_size)
+                new, changed = [], []
+
+        if (new or changed) and not dry_run:
+            self._flush(new, changed, fields, batch_size)
+
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
         self.stdout.write(self.style.SUCCESS(f"✅ Imported: {inserted}"))
+        if update:
+            self.stdout.write(self.style.SUCCESS(f"🔄 Updated:  {updated}"))
         self.stdout.write(self.style.WARNING(f"⏭️  Skipped:  {skipped}"))
+        if duplicates:
+            shown = duplicates if opts["verbosity"] > 1 else duplicates[:10]
+            more = f" (+{len(duplicates) - len(shown)} more, -v 2 to list)" if len(shown) < len(duplicates) else ""
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {len(duplicates)} duplicate names skipped (first row kept): {', '.join(shown)}{more}"
+            ))
+        self.stdout.write(f"⏱️  {count} rows in {elapsed:.1f}s ({rate:.0f} rows/s)")
         if dry_run:
             self.stdout.write(self.style.NOTICE("Dry run complete. No changes were committed."))
+        elif (inserted or updated) and fts_enabled():
+            call_command("build_drug_fts", stdout=self.stdout)
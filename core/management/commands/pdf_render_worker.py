@@ -0,0 +1,175 @@
+# core/management/commands/pdf_render_worker.py
+# usage: python manage.py pdf_render_worker [--workers 2] [--max-queued 8] [--socket /tmp/quelo-pdf-render.sock]
+# Long-running process (Procfile `pdf:` entry). Renders PDFs for the web
+# workers (utils.pdf_render.render_pdf):
+#   - listens on a Unix socket (settings.PDF_RENDER_SOCKET), one thread per
+#     connection,
+#   - renders on a process pool whose processes are warmed once (engines
+#     imported, fonts loaded, PDF_RENDER_PRELOAD_URLS fetched) and keep the
+#     fetched static assets between renders,
+#   - replaces the pool if a render process dies.
+# Render processes are forked from this one (Django already set up), so
+# they start and warm up as soon as the worker does. A replacement pool
+# (after a crash) is started while the handler threads run, when forking
+# could copy a lock another thread holds, so it comes from a forkserver and
+# sets Django up itself.
+# Each request carries the client's deadline (now + PDF_RENDER_TIMEOUT): a
+# job still waiting when it passes is cancelled or skipped, never rendered
+# for nobody. At most --max-queued renders are accepted at once (running
+# plus waiting); beyond that the client gets {"ok": false} straight away
+# and its view answers 503 instead of waiting out the timeout.
+
+import logging
+import multiprocessing
+import os
+import signal
+import socketserver
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError   # not the builtin before 3.11
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.pdf_render import ENGINES, PdfRenderError, read_message, render_local, send_message, warm_renderer
+
+logger = logging.getLogger(__name__)
+
+
+def _render(html, base_url, engine, deadline=None):
+    """Runs on the pool."""
+    if deadline is not None and time.time() >= deadline:
+        raise PdfRenderError("deadline passed while queued")
+    started = time.perf_counter()
+    pdf = render_local(html, base_url, engine)
+    return pdf, time.perf_counter() - started
+
+
+def _setup_and_warm():
+    """Initializer of a replacement pool: forkserver processes start without Django set up."""
+    import django
+
+    django.setup()
+    warm_renderer()
+
+
+class RenderPool:
+    def __init__(self, workers, max_queued):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_queued)
+        # no handler threads yet: forking is safe and the processes inherit the warm Django
+        self._pool = self._new_pool(multiprocessing.get_context("fork"), warm_renderer)
+        self._respawn_context = multiprocessing.get_context("forkserver")
+        self._respawn_context.set_forkserver_preload([__name__])
+
+    def _new_pool(self, context, initializer):
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=initializer)
+        pool.submit(time.sleep, 0)           # start + warm every process now, not on the first render
+        return pool
+
+    def render(self, html, base_url, engine, deadline=None):
+        if deadline is not None and time.time() >= deadline:
+            raise PdfRenderError("deadline passed before the render was queued")
+        if not self._slots.acquire(blocking=False):
+            raise PdfRenderError("render queue full")
+        pool = self._pool
+        try:
+            try:
+                future = pool.submit(_render, html, base_url, engine, deadline)
+            except BaseException:
+                self._slots.release()
+                raise
+            # the slot frees when the job ends (done, failed or cancelled), not when we stop waiting
+            future.add_done_callback(lambda _: self._slots.release())
+            timeout = None if deadline is None else max(deadline - time.time(), 0)
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                future.cancel()            # still waiting for a process: never starts
+                raise PdfRenderError("deadline passed")
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    logger.error("PDF render pool broke; starting a new one")
+                    self._pool = self._new_pool(self._respawn_context, _setup_and_warm)
+            raise PdfRenderError("render process died")
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class RenderHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            header, body = read_message(self.rfile)
+            engine = header.get("engine") or "weasyprint"
+            if engine not in ENGINES:
+                raise PdfRenderError(f"unknown PDF engine {engine!r}")
+            pdf, seconds = self.server.pool.render(
+                body.decode("utf-8"), header.get("base_url"), engine, header.get("deadline"),
+            )
+            logger.info("PDF rendered (%s): %s bytes in %.2fs", engine, len(pdf), seconds)
+            send_message(self.connection, {"ok": True}, pdf)
+        except (BrokenPipeError, ConnectionResetError):
+            pass                           # the web worker gave up (timeout)
+        except Exception as e:
+            if isinstance(e, PdfRenderError):
+                logger.warning("PDF render failed: %s", e)
+            else:
+                logger.exception("PDF render failed")
+            try:
+                send_message(self.connection, {"ok": False, "error": str(e)[:500]})
+            except OSError:
+                pass
+
+
+class RenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = "Serve PDF renders for the web workers from a warm process pool over a Unix socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Render processes")
+        parser.add_argument("--max-queued", type=int,
+                            help="Renders accepted at once, running or waiting (default: 4 per process)")
+        parser.add_argument("--socket", help="Socket path (default: settings.PDF_RENDER_SOCKET)")
+
+    def handle(self, *args, **options):
+        path = options["socket"] or getattr(settings, "PDF_RENDER_SOCKET", None)
+        if not path:
+            raise CommandError("Set PDF_RENDER_SOCKET or pass --socket")
+        path = str(path)
+        if os.path.exists(path):
+            os.remove(path)                # stale socket from a previous run
+
+        max_queued = options["max_queued"] or options["workers"] * 4
+        if max_queued < options["workers"]:
+            raise CommandError("--max-queued must be at least --workers")
+        pool = RenderPool(options["workers"], max_queued)
+        server = RenderServer(path, RenderHandler)
+        server.pool = pool
+        os.chmod(path, 0o660)
+
+        def _stop(*_):
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ PDF render worker listening on {path} "
+            f"({options['workers']} processes, up to {max_queued} renders accepted)"
+        ))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            pool.shutdown()
+            if os.path.exists(path):
+                os.remove(path)
+        self.stdout.write(self.style.SUCCESS("✅ PDF render worker stopped"))
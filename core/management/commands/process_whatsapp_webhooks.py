@@ -0,0 +1,45 @@
+# core/management/commands/process_whatsapp_webhooks.py
+# usage: python manage.py process_whatsapp_webhooks [--batch-size 500] [--poll 1] [--once]
+# Long-running process (Procfile `webhooks:` entry). Applies the raw events
+# the webhook views stored in WhatsappWebhookEvent, a batch at a time
+# (see whatsapp_notifications.webhooks).
+
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from whatsapp_notifications.webhooks import process_webhook_events
+
+
+class Command(BaseCommand):
+    help = "Apply staged DoubleTick webhook events (status receipts + inbound replies) in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Events per transaction")
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds to sleep when idle")
+        parser.add_argument("--once", action="store_true", help="Process what is pending and exit")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while not self.stopping:
+            close_old_connections()
+            counts = process_webhook_events(options["batch_size"])
+            if counts:
+                self.stdout.write(
+                    f"📥 {counts['claimed']} events: {counts['status']} receipts, "
+                    f"{counts['inbound']} inbound, {counts['waiting']} waiting for log, "
+                    f"{counts['errors']} errors, {counts['ignored']} ignored"
+                )
+            # receipts waiting for their outbox log are not due again for a while
+            if not counts:
+                if options["once"]:
+                    break
+                time.sleep(options["poll"])
+
+    def _stop(self, *_):
+        self.stopping = True
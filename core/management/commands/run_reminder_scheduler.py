@@ -0,0 +1,74 @@
+# core/management/commands/run_reminder_scheduler.py
+# usage: python manage.py run_reminder_scheduler [--lead-minutes 60] [--window-minutes 180] [--refresh 300]
+# Long-running process (Procfile `reminders:` entry). Queues a WhatsApp
+# "reminder" template --lead-minutes before each open appointment's ETA for
+# hospitals with WhatsappConfig.send_reminders and a reminder template.
+# Messages go through the outbox (whatsapp_outbox_worker). Safe to restart
+# at any time: already-reminded appointments are skipped (WhatsappReminder),
+# and reminders that fell due more than --catch-up-minutes before the start
+# are dropped. Walk-ins registered inside the lead time get no reminder.
+
+import signal
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from whatsapp_notifications.reminders import ReminderScheduler
+
+
+class Command(BaseCommand):
+    help = "Heap-based scheduler that queues appointment reminders before their ETA"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lead-minutes", type=int, default=60, help="Remind this long before the ETA")
+        parser.add_argument("--window-minutes", type=int, default=180,
+                            help="How far past the lead time to keep in memory")
+        parser.add_argument("--refresh", type=int, default=300,
+                            help="Seconds between window reloads (picks up moved ETAs and config)")
+        parser.add_argument("--tick", type=float, default=5.0, help="Max seconds between checks")
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows per indexed batch")
+        parser.add_argument("--catch-up-minutes", type=int, default=10,
+                            help="On start, still send reminders that fell due this recently")
+        parser.add_argument("--once", action="store_true", help="Load, send what is due now and exit")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        scheduler = ReminderScheduler(
+            lead_minutes=options["lead_minutes"],
+            window_minutes=options["window_minutes"],
+            batch_size=options["batch_size"],
+            catch_up_minutes=options["catch_up_minutes"],
+        )
+        last_refresh = None
+
+        while not self.stopping:
+            close_old_connections()
+            now = datetime.now()          # naive local time, like the stored ETAs (USE_TZ=False)
+
+            if last_refresh is None or time.monotonic() - last_refresh >= options["refresh"]:
+                loaded = scheduler.refresh(now)
+                last_refresh = time.monotonic()
+                self.stdout.write(f"⏰ {loaded} reminders scheduled up to {scheduler.horizon:%d-%m %H:%M}")
+            else:
+                scheduler.tail(now)
+
+            queued = scheduler.fire_due(now)
+            if queued:
+                self.stdout.write(self.style.SUCCESS(f"📨 {queued} reminders queued"))
+            if options["once"]:
+                break
+
+            # sleep until the next reminder is due, but keep tailing new registrations
+            next_due = scheduler.next_due()
+            wait = options["tick"]
+            if next_due is not None:
+                wait = min(wait, max(0.0, (next_due - datetime.now()).total_seconds()))
+            time.sleep(wait)
+
+    def _stop(self, *_):
+        self.stopping = True
@@ -34,8 +34,8 @@ class Command(BaseCommand):
         parser.add_argument(
             "--type",
             type=str,
-            choices=["confirmation", "reschedule", "followup"],
-            help="Template type (confirmation | reschedule | followup)",
+            choices=["confirmation", "reschedule", "followup", "reminder"],
+            help="Template type (confirmation | reschedule | followup | reminder)",
         )
         parser.add_argument(
             "--template-name",
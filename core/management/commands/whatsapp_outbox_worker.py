@@ -0,0 +1,259 @@
+# core/management/commands/whatsapp_outbox_worker.py
+# usage: python manage.py whatsapp_outbox_worker [--workers 8] [--rate 5] [--once]
+# Long-running process (Procfile `whatsapp:` entry). Drains WhatsappOutbox:
+#   - claims due rows in batches (SELECT ... FOR UPDATE SKIP LOCKED, so several
+#     workers can run side by side),
+#   - sends them on a bounded thread pool, at most --rate messages/second
+#     per hospital (token bucket, hospitals served round-robin),
+#   - retries transient failures with exponential backoff + jitter,
+#   - writes outbox + WhatsappMessageLog results back with bulk_update.
+
+import logging
+import random
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from whatsapp_notifications.client import get_client
+from whatsapp_notifications.models import WhatsappMessageLog, WhatsappOutbox
+from whatsapp_notifications.services import build_payload, post_template, resolve_template
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 30          # seconds before the first retry
+BACKOFF_CAP = 60 * 60      # never wait more than an hour between tries
+STALE_LOCK = timedelta(minutes=5)   # a worker died holding these rows
+FLUSH_EVERY = 20           # write results back at least this often
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait(self):
+        """Seconds until the next token."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+def _deliver(outbox_id, webhook_url, payload):
+    """Runs on the pool: HTTP only, no ORM. Returns (id, message_id, error, retryable)."""
+    try:
+        _, message_id = post_template(webhook_url, payload)
+        return outbox_id, message_id, None, False
+    except requests.HTTPError as e:
+        code = e.response.status_code if e.response is not None else 0
+        # 4xx is our fault (bad number / template) except throttling and timeouts
+        return outbox_id, None, str(e), code >= 500 or code in (408, 429) or not code
+    except requests.RequestException as e:
+        return outbox_id, None, str(e), True
+    except Exception as e:   # bad JSON from provider etc.
+        logger.exception("WhatsApp outbox %s failed", outbox_id)
+        return outbox_id, None, str(e), False
+
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter: ~30s, 1m, 2m, 4m ... capped at an hour."""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class Command(BaseCommand):
+    help = "Send queued WhatsApp messages (WhatsappOutbox) with a thread pool and per-hospital rate limits"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent HTTP sends")
+        parser.add_argument("--batch-size", type=int, default=100, help="Rows claimed per poll")
+        parser.add_argument("--rate", type=float, default=5.0, help="Messages per second per hospital")
+        parser.add_argument("--burst", type=int, default=10, help="Messages a hospital may send at once")
+        parser.add_argument("--max-attempts", type=int, default=5, help="Give up after this many tries")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds to sleep when idle")
+        parser.add_argument("--once", action="store_true", help="Drain what is due now and exit")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.buckets = {}
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        get_client(pool_size=options["workers"])   # one keep-alive connection per thread
+
+        totals = {"sent": 0, "retry": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=options["workers"], thread_name_prefix="wa-outbox") as pool:
+            while not self.stopping:
+                close_old_connections()
+                rows = self._claim(options["batch_size"])
+                if not rows:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+
+                started = time.monotonic()
+                counts = self._process(pool, rows)
+                for k, v in counts.items():
+                    totals[k] += v
+                self.stdout.write(
+                    f"📤 {counts['sent']} sent, {counts['retry']} to retry, {counts['failed']} failed "
+                    f"({len(rows)} in {time.monotonic() - started:.1f}s)"
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Outbox worker stopped: {totals['sent']} sent, {totals['retry']} retries, "
+            f"{totals['failed']} failed"
+        ))
+
+    def _stop(self, *_):
+        self.stopping = True
+
+    # 1️⃣ claim due rows (and rows left behind by a dead worker)
+    def _claim(self, limit):
+        now = timezone.now()
+        due = (
+            Q(status=WhatsappOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+            | Q(status=WhatsappOutbox.STATUS_SENDING, locked_at__lt=now - STALE_LOCK)
+        )
+        with transaction.atomic():
+            ids = list(
+                WhatsappOutbox.objects.select_for_update(skip_locked=True)
+                .filter(due)
+                .order_by("next_attempt_at", "id")
+                .values_list("id", flat=True)[:limit]
+            )
+            if not ids:
+                return []
+            WhatsappOutbox.objects.filter(id__in=ids).update(
+                status=WhatsappOutbox.STATUS_SENDING, locked_at=now,
+            )
+        return list(WhatsappOutbox.objects.filter(id__in=ids).select_related("hospital"))
+
+    # 2️⃣ send: per-hospital queues, round-robin, token bucket per hospital
+    def _process(self, pool, rows):
+        by_id = {row.id: row for row in rows}
+        results = []
+        templates = {}
+        queues = {}
+
+        for row in rows:
+            key = (row.hospital_id, row.template_type, row.template_name)
+            if key not in templates:
+                try:
+                    templates[key] = resolve_template(
+                        row.hospital, row.template_type or None, row.template_name or None,
+                    )
+                except Exception as e:   # missing template / webhook: retrying will not help
+                    templates[key] = e
+            tpl = templates[key]
+            if isinstance(tpl, Exception):
+                results.append((row.id, None, str(tpl), False))
+                continue
+            tpl_name, webhook_url = tpl
+            payload = build_payload(
+                tpl_name, row.recipient_number, row.placeholders,
+                phone_num=row.hospital.phone_num if row.buttons else None,
+            )
+            queues.setdefault(row.hospital_id, deque()).append((row.id, webhook_url, payload))
+
+        counts = {"sent": 0, "retry": 0, "failed": 0}
+        futures = []
+        while queues:
+            submitted = False
+            for hospital_id in list(queues):
+                bucket = self.buckets.setdefault(
+                    hospital_id, TokenBucket(self.options["rate"], self.options["burst"]),
+                )
+                if bucket.take():
+                    futures.append(pool.submit(_deliver, *queues[hospital_id].popleft()))
+                    submitted = True
+                    if not queues[hospital_id]:
+                        del queues[hospital_id]
+            if not submitted:
+                time.sleep(min(self.buckets[h].wait() for h in queues))
+
+            # flush finished sends while slow hospitals are still waiting for tokens;
+            # one pass, so a send finishing meanwhile lands in exactly one list
+            done, pending = [], []
+            for f in futures:
+                (done if f.done() else pending).append(f)
+            if len(done) >= FLUSH_EVERY:
+                futures = pending
+                results.extend(f.result() for f in done)
+                self._flush(by_id, results, counts)
+                results = []
+
+        results.extend(f.result() for f in as_completed(futures))
+        self._flush(by_id, results, counts)
+        return counts
+
+    # 3️⃣ write results back in two bulk_update calls
+    def _flush(self, by_id, results, counts):
+        if not results:
+            return
+        now = timezone.now()
+        outbox_rows, log_rows = [], []
+        log_ids = [by_id[r[0]].log_id for r in results if by_id[r[0]].log_id]
+        logs = WhatsappMessageLog.objects.in_bulk(log_ids)
+
+        for outbox_id, message_id, error, retryable in results:
+            row = by_id[outbox_id]
+            row.attempts += 1
+            row.locked_at = None
+            row.last_error = error
+            log = logs.get(row.log_id)
+
+            if error is None:
+                row.status = WhatsappOutbox.STATUS_SENT
+                row.sent_at = now
+                counts["sent"] += 1
+                if log:
+                    log.status, log.provider_message_id, log.error_message = "sent", message_id, None
+            elif retryable and row.attempts < self.options["max_attempts"]:
+                row.status = WhatsappOutbox.STATUS_PENDING
+                row.next_attempt_at = now + timedelta(seconds=backoff_seconds(row.attempts))
+                counts["retry"] += 1
+                if log:
+                    log.error_message = error
+            else:
+                row.status = WhatsappOutbox.STATUS_FAILED
+                counts["failed"] += 1
+                if log:
+                    log.status, log.error_message = "failed", error
+
+            outbox_rows.append(row)
+            if log:
+                log.updated_at = now       # bulk_update skips auto_now
+                log_rows.append(log)
+
+        with transaction.atomic():
+            WhatsappOutbox.objects.bulk_update(
+                outbox_rows,
+                ["status", "attempts", "next_attempt_at", "locked_at", "last_error", "sent_at"],
+            )
+            WhatsappMessageLog.objects.bulk_update(
+                log_rows, ["status", "provider_message_id", "error_message", "updated_at"],
+            )
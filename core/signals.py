@@ -1,10 +1,21 @@
 # core/signals.py
 
-from django.db.models.signals import post_save, post_migrate
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_migrate, pre_save
 from django.dispatch import receiver
 from django.conf import settings
 from core.models import Role, Hospital, HospitalUser
 from doctors.models import Doctor
+from billing.models import PaymentTransaction
+from queue_mgt.events import bump_queue_version
+from whatsapp_notifications.models import WhatsappTemplate
+from whatsapp_notifications.services import clear_template_cache
+from drugs.models import Drug
+from drugs.ingredients import sync_drug_ingredients
+from drugs.search import drug_index
+from drugs.presets import count_note_values, note_values
+from drugs.catalog import log_drug_changes
+from prescription.models import PrescriptionDetails
 
 
 # -------------------------------------------------------------
@@ -86,3 +97,119 @@ def create_or_update_doctor_user(sender, instance, created, **kwargs):
             if changed:
                 user.save(update_fields=["user_name", "hospital", "role", "doctor"])
                 print(f"🔄 Synced doctor user for {instance.doctor_name}")
+
+
+# -------------------------------------------------------------
+# 4️⃣ Queue snapshot shows a "Due" badge; refresh it on payment changes
+# -------------------------------------------------------------
+@receiver(post_save, sender=PaymentTransaction)
+@receiver(post_delete, sender=PaymentTransaction)
+def refresh_queue_on_payment_change(sender, instance, **kwargs):
+    if instance.hospital_id and instance.paid_on:
+        transaction.on_commit(
+            lambda: bump_queue_version(instance.hospital_id, instance.paid_on)
+        )
+
+
+# -------------------------------------------------------------
+# 5️⃣ Drop cached template lookups (webhook URL) when templates change
+# -------------------------------------------------------------
+@receiver(post_save, sender=WhatsappTemplate)
+@receiver(post_delete, sender=WhatsappTemplate)
+def refresh_whatsapp_template_cache(sender, instance, **kwargs):
+    clear_template_cache(instance.hospital_id)
+
+
+# -------------------------------------------------------------
+# 6️⃣ Keep the in-memory drug search index (drugs.search) current
+# -------------------------------------------------------------
+@receiver(post_save, sender=Drug)
+def refresh_drug_index_on_save(sender, instance, **kwargs):
+    transaction.on_commit(lambda: drug_index.upsert(instance))
+
+
+@receiver(post_delete, sender=Drug)
+def refresh_drug_index_on_delete(sender, instance, **kwargs):
+    drug_id = instance.pk
+    transaction.on_commit(lambda: drug_index.remove(drug_id))
+
+
+# -------------------------------------------------------------
+# 7️⃣ Re-parse the composition into the ingredient index
+# -------------------------------------------------------------
+@receiver(post_save, sender=Drug)
+def sync_drug_ingredient_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_drug_ingredients([instance])
+
+
+# -------------------------------------------------------------
+# 8️⃣ Notes autocomplete: keep the (hospital, field, value) counts current
+# -------------------------------------------------------------
+@receiver(pre_save, sender=PrescriptionDetails)
+def remember_note_values(sender, instance, raw=False, **kwargs):
+    instance._counted_notes = None
+    if instance.pk and not raw:
+        old = PrescriptionDetails.objects.filter(pk=instance.pk).first()
+        if old is not None:
+            instance._counted_notes = (old.hospital_id, note_values(old))
+
+
+@receiver(post_save, sender=PrescriptionDetails)
+def count_note_values_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_hospital, old = getattr(instance, "_counted_notes", None) or (None, {})
+    new = note_values(instance)
+    if old_hospital != instance.hospital_id:
+        removed, added = old, new
+    else:
+        removed = {f: v for f, v in old.items() if new.get(f) != v}
+        added = {f: v for f, v in new.items() if old.get(f) != v}
+    hospital_id = instance.hospital_id
+
+    def apply():
+        count_note_values(old_hospital, removed, -1)
+        count_note_values(hospital_id, added, +1)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=PrescriptionDetails)
+def count_note_values_on_delete(sender, instance, **kwargs):
+    hospital_id, values = instance.hospital_id, note_values(instance)
+    transaction.on_commit(lambda: count_note_values(hospital_id, values, -1))
+
+
+# -------------------------------------------------------------
+# 9️⃣ Drug change log: versions for the browser catalog (drugs.catalog)
+# -------------------------------------------------------------
+@receiver(pre_save, sender=Drug)
+def remember_drug_scope(sender, instance, raw=False, **kwargs):
+    instance._logged_scope = None
+    if instance.pk and not raw:
+        instance._logged_scope = (
+            Drug.objects.filter(pk=instance.pk).values_list("scope_key", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Drug)
+def log_drug_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    drug_id, scope_key = instance.pk, instance.scope_key
+    old_scope = getattr(instance, "_logged_scope", None)
+
+    def log():
+        log_drug_changes([(drug_id, scope_key)])
+        if old_scope and old_scope != scope_key:
+            # moved out of a scope: browsers holding that scope drop it
+            log_drug_changes([(drug_id, old_scope)], deleted=True)
+
+    transaction.on_commit(log)
+
+
+@receiver(post_delete, sender=Drug)
+def log_drug_delete(sender, instance, **kwargs):
+    drug_id, scope_key = instance.pk, instance.scope_key
+    transaction.on_commit(lambda: log_drug_changes([(drug_id, scope_key)], deleted=True))
@@ -1,3 +1,178 @@
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.http import Http404
 from django.test import TestCase
+from django.utils import timezone
+
+from appointments.history import (
+    attach_archived_appointments, distinct_patients, doctor_patients_q, doctor_payments_q,
+    get_appointment_or_404, latest_doctor_names, patient_appointments, status_counts,
+)
+from appointments.models import AppointmentDetails, AppointmentHistory, DoctorServiceStat
+from billing.models import PaymentMaster
+from core.models import Hospital
+from doctors.models import Doctor
+from patients.models import Contact, Patient
+from prescription.models import PrescriptionMaster
+from whatsapp_notifications.models import (
+    WhatsappInboundMessage, WhatsappMessageLog, WhatsappMessageLogHistory, WhatsappOutbox,
+    WhatsappWebhookEvent,
+)
+
+
+class ArchiveClosedDaysTests(TestCase):
+    """manage.py archive_closed_days: rows move to history without breaking what points at them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(
+            hospital_name="Archive Test", phone_num="9990002222",
+            email="archive@test.local", name="archive",
+        )
+        cls.doctor = Doctor.objects.create(
+            doctor_name="Dr Archive", doc_mobile_num="9800000200",
+            average_time_minutes=10, fees=100,
+            hospital=cls.hospital, start_time=time(9, 0),
+        )
+        contact = Contact.objects.create(mobile_num=9100000200, contact_name="C", hospital=cls.hospital)
+        cls.patient = Patient.objects.create(
+            contact=contact, patient_name="P", gender="M", hospital=cls.hospital,
+        )
+        cls.payment = PaymentMaster.objects.create(
+            mobile_num="9100000200", patient=cls.patient, total_amount=0,
+            collected_by="test", hospital=cls.hospital,
+        )
+
+    def archive(self, **options):
+        call_command("archive_closed_days", keep_days=30, stdout=StringIO(), **options)
+        # SQLite checks the deferred FKs only at commit; check them now
+        connection.check_constraints()
+
+    def _old_visit(self, days_ago, minutes=10):
+        day = date.today() - timedelta(days=days_ago)
+        queued = datetime.combine(day, time(10, 0))
+        return AppointmentDetails.objects.create(
+            appointment_on=day, doctor=self.doctor, patient=self.patient, payment=self.payment,
+            mobile_num="9100000200", token_num="T1", que_pos=1, hospital=self.hospital,
+            completed=AppointmentDetails.STATUS_DONE,
+            queue_start_time=queued, completed_at=queued + timedelta(minutes=minutes),
+        )
+
+    def _old_log(self, **extra):
+        log = WhatsappMessageLog.objects.create(
+            hospital=self.hospital, template_name="token", recipient_number="9100000000",
+            placeholders=[], status="sent", **extra,
+        )
+        WhatsappMessageLog.objects.filter(pk=log.pk).update(created_at=timezone.now() - timedelta(days=60))
+        return log
+
+    def test_archives_whatsapp_log_still_referenced(self):
+        log = self._old_log(provider_message_id="wamid.old")
+        outbox = WhatsappOutbox.objects.create(
+            hospital=self.hospital, recipient_number="9100000000", placeholders=[],
+            status=WhatsappOutbox.STATUS_SENT, log=log,
+        )
+        reply = WhatsappInboundMessage.objects.create(
+            hospital=self.hospital, provider_message_id="wamid.reply", from_number="9100000000",
+            message_text="ok", in_reply_to=log,
+        )
+        recent = WhatsappMessageLog.objects.create(
+            hospital=self.hospital, template_name="token", recipient_number="9100000000", placeholders=[],
+        )
+
+        self.archive()
+
+        self.assertFalse(WhatsappMessageLog.objects.filter(pk=log.pk).exists())
+        self.assertTrue(WhatsappMessageLogHistory.objects.filter(pk=log.pk).exists())
+        self.assertTrue(WhatsappMessageLog.objects.filter(pk=recent.pk).exists())
+        outbox.refresh_from_db()
+        reply.refresh_from_db()
+        self.assertIsNone(outbox.log_id)
+        self.assertIsNone(reply.in_reply_to_id)
+
+    def test_deletes_old_finished_outbox_rows(self):
+        def outbox(status, days_ago):
+            row = WhatsappOutbox.objects.create(
+                hospital=self.hospital, recipient_number="9100000000", placeholders=[], status=status,
+            )
+            WhatsappOutbox.objects.filter(pk=row.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+            return row.pk
+
+        gone = [outbox(WhatsappOutbox.STATUS_SENT, 60), outbox(WhatsappOutbox.STATUS_FAILED, 60)]
+        kept = [outbox(WhatsappOutbox.STATUS_PENDING, 60), outbox(WhatsappOutbox.STATUS_SENT, 2)]
+
+        self.archive(batch_size=1)
+        self.assertCountEqual(WhatsappOutbox.objects.values_list("pk", flat=True), kept)
+        self.assertFalse(WhatsappOutbox.objects.filter(pk__in=gone).exists())
+
+    def test_deletes_old_processed_webhook_events(self):
+        old = timezone.now() - timedelta(days=60)
+        done = WhatsappWebhookEvent.objects.create(source="whatsapp", payload={}, processed_at=old)
+        waiting = WhatsappWebhookEvent.objects.create(source="whatsapp", payload={}, next_attempt_at=old)
+        recent = WhatsappWebhookEvent.objects.create(source="whatsapp", payload={}, processed_at=timezone.now())
+
+        self.archive(batch_size=1)
+        self.assertCountEqual(WhatsappWebhookEvent.objects.values_list("pk", flat=True), [waiting.pk, recent.pk])
+        self.assertFalse(WhatsappWebhookEvent.objects.filter(pk=done.pk).exists())
+
+    def test_service_stats_read_archived_days(self):
+        # inside the 90-day stats window, outside the 30 days kept hot
+        for days_ago in (40, 47, 54):
+            self._old_visit(days_ago, minutes=12)
+
+        self.archive()
+        self.assertEqual(AppointmentHistory.objects.count(), 3)
+        call_command("build_service_stats", min_samples=3, stdout=StringIO())
+
+        stat = DoctorServiceStat.objects.get(doctor=self.doctor)
+        self.assertEqual(stat.samples, 3)
+        self.assertEqual(stat.median_minutes, 12)
+
+    def test_prescription_keeps_its_archived_appointment(self):
+        old = self._old_visit(45)
+        recent = self._old_visit(2)
+        rx = PrescriptionMaster.objects.create(
+            patient=self.patient, doctor=self.doctor, hospital=self.hospital, appointment=old,
+        )
+
+        self.archive()
+        rx = PrescriptionMaster.objects.select_related("appointment").get(pk=rx.pk)
+        self.assertEqual(rx.appointment_id, old.pk)
+        self.assertIsNone(rx.appointment)                  # hot row gone
+
+        attach_archived_appointments([rx])
+        self.assertIsInstance(rx.appointment, AppointmentHistory)
+        self.assertEqual(rx.appointment.doctor, self.doctor)
+
+        # token / receipt reprints and the patient's visit list
+        self.assertIsInstance(get_appointment_or_404(self.hospital, old.pk), AppointmentHistory)
+        self.assertIsInstance(get_appointment_or_404(self.hospital, recent.pk), AppointmentDetails)
+        with self.assertRaises(Http404):
+            get_appointment_or_404(self.hospital, old.pk + recent.pk + 1)
+        self.assertEqual([a.pk for a in patient_appointments(self.hospital, self.patient)], [recent.pk, old.pk])
+
+    def test_finance_dashboard_helpers_read_archived_days(self):
+        old = self._old_visit(45)
+        self.archive()
+        start = old.appointment_on - timedelta(days=1)
+
+        self.assertEqual(distinct_patients(self.hospital, start, date.today(), doctor_id=self.doctor.pk), 1)
+        self.assertEqual(status_counts(self.hospital, start, date.today())[AppointmentDetails.STATUS_DONE], 1)
+        self.assertTrue(PaymentMaster.objects.filter(doctor_payments_q(self.doctor.pk)).filter(pk=self.payment.pk).exists())
+
+    def test_patient_dashboard_helpers_read_archived_days(self):
+        self._old_visit(45)
+        self.archive()
+        self.assertEqual(list(Patient.objects.filter(doctor_patients_q(self.doctor.pk))), [self.patient])
+        self.assertEqual(latest_doctor_names(self.hospital, [self.patient.pk]), {self.patient.pk: "Dr Archive"})
 
-# Create your tests here.
+        other = Doctor.objects.create(
+            doctor_name="Dr Recent", doc_mobile_num="9800000201",
+            average_time_minutes=10, fees=100, hospital=self.hospital, start_time=time(9, 0),
+        )
+        visit = self._old_visit(2)
+        AppointmentDetails.objects.filter(pk=visit.pk).update(doctor=other)
+        self.assertEqual(latest_doctor_names(self.hospital, [self.patient.pk]), {self.patient.pk: "Dr Recent"})
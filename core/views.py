@@ -125,18 +125,13 @@ import json
 import logging
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from whatsapp_notifications.webhooks import ingest_webhook
 
 logger = logging.getLogger(__name__)
 
 @csrf_exempt
 def doubletick_webhook(request):
     if request.method == "POST":
-        try:
-            payload = json.loads(request.body.decode("utf-8"))
-            logger.info("DoubleTick Webhook: %s", payload)
-            print("🔥 Webhook received:", payload)  # also shows up in runserver console
-            return JsonResponse({"status": "ok"})
-        except Exception as e:
-            logger.error("Webhook error: %s", e)
-            return JsonResponse({"error": str(e)}, status=400)
+        # staged + acknowledged; process_whatsapp_webhooks applies it
+        return ingest_webhook(request, "doubletick")
     return JsonResponse({"detail": "Method not allowed"}, status=405)
@@ -0,0 +1,177 @@
+# drugs/catalog.py
+"""
+Drug catalog export so prescription screens can search in the browser.
+
+snapshot(doctor, hospital)        – every drug the doctor can see (global,
+                                    hospital, own) as columns:
+                                    {"id": [...], "name": [...], ...}, plus
+                                    the DoctorDrug selections and the
+                                    doctor's usage scores (drugs.ranking).
+delta(doctor, hospital, since)    – drugs written since `since`, and ids to
+                                    drop; {"reset": true} when too far behind.
+
+The catalog version is the last DrugChange id. core.signals logs every
+Drug save/delete after commit and the bulk import commands call
+log_drug_changes() themselves. Deltas re-read DELTA_OVERLAP entries
+before `since`, so a log row committed out of id order is not missed
+(upserts are idempotent).
+
+archive_closed_days prunes old log rows (prune_drug_changes(), always
+keeping the newest so the version stays put); a browser whose `since`
+predates the oldest row left gets a reset.
+
+The global part of the snapshot (nearly all of it) is built once per
+version per process; hospital and doctor drugs are read per request.
+"""
+import threading
+
+from django.db.models import Count, Max, Min
+
+from .models import DoctorDrug, Drug, DrugChange, drug_scope_key
+from .ranking import doctor_ranking, doctor_ranking_version
+from .search import SCOPE_DOCTOR, SCOPE_GLOBAL, SCOPE_HOSPITAL
+
+CATALOG_FIELDS = ("id", "drug_name", "composition", "dosage", "frequency", "duration")
+COLUMNS = ("id", "name", "composition", "dosage", "frequency", "duration")
+DELTA_MAX_CHANGES = 2000
+DELTA_OVERLAP = 20
+
+_global = {}                  # "rows" -> (version, [row, ...])
+_global_lock = threading.Lock()
+
+
+def log_drug_changes(drugs, deleted=False):
+    """Append DrugChange rows for Drug instances or (id, scope_key) pairs."""
+    rows = []
+    for d in drugs:
+        drug_id, scope_key = (d.pk, d.scope_key) if isinstance(d, Drug) else d
+        rows.append(DrugChange(drug_id=drug_id, scope_key=scope_key, deleted=deleted))
+    DrugChange.objects.bulk_create(rows, batch_size=1000)
+
+
+def catalog_version():
+    return DrugChange.objects.aggregate(v=Max("id"))["v"] or 0
+
+
+def prune_drug_changes(before, batch_size=5000, dry_run=False):
+    """Delete DrugChange rows logged before `before`, except the newest. Returns the number removed."""
+    qs = DrugChange.objects.filter(changed_at__lt=before, id__lt=catalog_version())
+    if dry_run:
+        return qs.count()
+    removed = 0
+    while True:
+        ids = list(qs.order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += DrugChange.objects.filter(id__in=ids).delete()[0]
+
+
+def _scopes(doctor, hospital):
+    """scope_key -> scope code, for the drugs this doctor may see (same split as the library)."""
+    scopes = {drug_scope_key(): SCOPE_GLOBAL}
+    if hospital:
+        scopes[drug_scope_key(hospital_id=hospital.id)] = SCOPE_HOSPITAL
+    if doctor:
+        scopes[drug_scope_key(doctor_id=doctor.id)] = SCOPE_DOCTOR
+    return scopes
+
+
+def _rows(scope_keys, ids=None):
+    qs = Drug.objects.filter(scope_key__in=scope_keys)
+    if ids is not None:
+        qs = qs.filter(id__in=ids)
+    return list(qs.order_by("id").values_list(*CATALOG_FIELDS, "scope_key"))
+
+
+def _global_rows(version):
+    cached = _global.get("rows")
+    if cached is None or cached[0] != version:
+        with _global_lock:
+            cached = _global.get("rows")
+            if cached is None or cached[0] != version:
+                cached = (version, _rows([drug_scope_key()]))
+                _global["rows"] = cached
+    return cached[1]
+
+
+def _columnar(rows, scopes):
+    out = {c: [] for c in COLUMNS}
+    out["scope"] = []
+    for *values, scope_key in rows:
+        for column, value in zip(COLUMNS, values):
+            out[column].append("" if value is None else value)
+        out["scope"].append(scopes[scope_key])
+    return out
+
+
+def selected_drug_ids(doctor):
+    if not doctor:
+        return []
+    return list(DoctorDrug.objects.filter(doctor=doctor).order_by("drug_id").values_list("drug_id", flat=True))
+
+
+def usage_scores(doctor, scopes):
+    """{drug id: usage score} for the doctor's ranked drugs (by name key, in the visible scopes)."""
+    ranking = doctor_ranking(getattr(doctor, "id", None))
+    if not ranking or not ranking.scores:
+        return {}
+    rows = Drug.objects.filter(scope_key__in=list(scopes), name_key__in=list(ranking.scores))
+    return {drug_id: round(ranking.scores[key], 3) for drug_id, key in rows.values_list("id", "name_key")}
+
+
+def catalog_etag(doctor, hospital):
+    """Changes with the catalog version, the doctor's selections and usage ranking."""
+    version = catalog_version()
+    picks = (
+        DoctorDrug.objects.filter(doctor=doctor).aggregate(n=Count("id"), last=Max("id"))
+        if doctor else {"n": 0, "last": 0}
+    )
+    doctor_id = getattr(doctor, "id", 0)
+    return (
+        f'"drugs-{version}-{getattr(hospital, "id", 0)}-{doctor_id}'
+        f'-{picks["n"]}-{picks["last"] or 0}-{doctor_ranking_version(doctor_id)}"'
+    )
+
+
+def snapshot(doctor, hospital):
+    version = catalog_version()
+    scopes = _scopes(doctor, hospital)
+    own = [k for k, code in scopes.items() if code != SCOPE_GLOBAL]
+    rows = _global_rows(version) + (_rows(own) if own else [])
+    return {
+        "version": version,
+        "scopes": {"doctor": SCOPE_DOCTOR, "hospital": SCOPE_HOSPITAL, "global": SCOPE_GLOBAL},
+        "drugs": _columnar(rows, scopes),
+        "selected": selected_drug_ids(doctor),
+        "usage": usage_scores(doctor, scopes),
+    }
+
+
+def delta(doctor, hospital, since):
+    version = catalog_version()
+    if since < 0 or since > version:
+        return {"version": version, "reset": True}
+    oldest = DrugChange.objects.aggregate(v=Min("id"))["v"]
+    if oldest is not None and since + 1 < oldest:
+        return {"version": version, "reset": True}       # the changes it missed were pruned
+    scopes = _scopes(doctor, hospital)
+
+    changed = list(
+        DrugChange.objects.filter(
+            scope_key__in=list(scopes), id__gt=max(since - DELTA_OVERLAP, 0), id__lte=version,
+        ).values_list("drug_id", flat=True)[:DELTA_MAX_CHANGES + 1]
+    )
+    if len(changed) > DELTA_MAX_CHANGES:
+        return {"version": version, "reset": True}
+
+    ids = set(changed)
+    rows = _rows(list(scopes), ids) if ids else []
+    live = {row[0] for row in rows}
+    return {
+        "version": version,
+        "reset": False,
+        "drugs": _columnar(rows, scopes),
+        "removed": sorted(ids - live),
+        "selected": selected_drug_ids(doctor),
+        "usage": usage_scores(doctor, scopes),
+    }
@@ -0,0 +1,91 @@
+# drugs/composition.py
+"""
+Parse free-text Drug.composition into (salt, strength) pairs.
+
+    "Amoxycillin  (250mg) +  clavulanic acid (125mg)"
+        -> [("amoxicillin", "250mg"), ("clavulanic acid", "125mg")]
+    "Mometasone (0.1% w/w) + Terbinafine (1% w/w)"
+        -> [("mometasone", "0.1%w/w"), ("terbinafine", "1%w/w")]
+
+composition_key() turns the parsed set into a short signature. Brands
+with the same salts at the same strengths share it, so "same composition"
+is one indexed equality lookup on Drug.composition_key.
+"""
+import hashlib
+import re
+
+# Indian / British / US spellings of the same salt
+SALT_ALIASES = {
+    "acetaminophen": "paracetamol",
+    "albuterol": "salbutamol",
+    "amoxycillin": "amoxicillin",
+    "cephalexin": "cefalexin",
+    "frusemide": "furosemide",
+    "glibenclamide": "glyburide",
+    "lignocaine": "lidocaine",
+    "levothyroxine sodium": "levothyroxine",
+    "ondansetron hydrochloride": "ondansetron",
+    "potassium clavulanate": "clavulanic acid",
+}
+
+_STRENGTH = re.compile(r"^\d+(?:\.\d+)?\s*(?:%|[a-zµμ])", re.I)
+_TRAILING_STRENGTH = re.compile(r"\s(\d+(?:\.\d+)?\s*(?:mg|mcg|µg|g|ml|iu|%)(?:\s*w/[wv])?)\s*$", re.I)
+_PARENS = re.compile(r"\(([^()]*)\)")
+_NON_WORD = re.compile(r"[^a-z0-9\- ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_salt(name):
+    name = _SPACES.sub(" ", _NON_WORD.sub(" ", (name or "").lower())).strip(" -")
+    return SALT_ALIASES.get(name, name)
+
+
+def normalize_strength(text):
+    s = _SPACES.sub("", (text or "").lower())
+    return s.replace("µg", "mcg").replace("μg", "mcg")
+
+
+def _split_parts(text):
+    """Split on '+' (and ',' / ';') outside parentheses."""
+    parts, depth, current = [], 0, []
+    for ch in text:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth = max(0, depth - 1)
+        if depth == 0 and ch in "+,;":
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append("".join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def parse_composition(text):
+    """[(salt, strength)] in the order written; strength is "" when not given."""
+    out = []
+    for part in _split_parts(text or ""):
+        strength = ""
+        for group in _PARENS.findall(part):
+            if _STRENGTH.match(group.strip()):
+                strength = normalize_strength(group)
+        name = _PARENS.sub(" ", part)             # drops "(hCG)"-style aliases too
+        if not strength:
+            m = _TRAILING_STRENGTH.search(name)   # "Paracetamol 500mg"
+            if m:
+                strength = normalize_strength(m.group(1))
+                name = name[:m.start()]
+        name = normalize_salt(name)
+        if name and (name, strength) not in out:
+            out.append((name, strength))
+    return out
+
+
+def composition_key(text):
+    """Order-independent signature of the parsed composition ("" when nothing parsed)."""
+    parts = parse_composition(text)
+    if not parts:
+        return ""
+    canonical = "|".join(sorted(f"{name}:{strength}" for name, strength in parts))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
@@ -0,0 +1,275 @@
+# drugs/fts.py
+"""
+Optional SQLite FTS5 backend for the global drug library.
+
+With DRUG_SEARCH_BACKEND = "fts5", `manage.py build_drug_fts` writes the
+global Drug rows (scope "g") into DRUG_SEARCH_FTS_PATH, a read-only file
+every worker opens with mmap; the pages are shared through the OS page
+cache instead of each worker holding its own copy. drugs.search then
+keeps only hospital and doctor drugs in memory and asks this file for
+the global scope.
+
+The file mirrors the in-memory tables, so results are the same:
+
+  drug          – the rows (same columns as drugs.search.DrugEntry)
+  drug_fts      – FTS5 trigram index on key / comp_key (substring match)
+  drug_prefix   – (word, id) for one- and two-letter terms
+  vocab, vocab_delete, word_drug
+                – drugs.fuzzy vocabulary: words, symmetric-delete
+                  variants, phonetic keys and word -> drug postings
+
+It is rebuilt into a temp file and renamed into place. Workers notice
+the new file (inode / mtime) within CHECK_SECONDS and reopen. meta holds
+the catalog_version it was built at; when a global drug changes after
+that (admin edits), drugs.search rewrites the file from a worker's
+background thread, one worker at a time under build_lock().
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:          # Windows dev boxes: no cross-process lock
+    fcntl = None
+
+from django.conf import settings
+
+from .fuzzy import LONG_WORD_LENGTH, MAX_DISTANCE, PHONETIC_SCORE, _deletes, edit_distance, phonetic_key
+
+logger = logging.getLogger(__name__)
+
+FTS_COLUMNS = ("id", "drug_name", "composition", "dosage", "frequency", "duration", "name_key", "key", "comp_key")
+MMAP_BYTES = 256 * 1024 * 1024
+CHECK_SECONDS = 2
+MAX_SQL_VARS = 900
+
+SCHEMA = """
+CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE drug (
+    id INTEGER PRIMARY KEY, drug_name TEXT, composition TEXT, dosage TEXT,
+    frequency TEXT, duration TEXT, name_key TEXT, key TEXT, comp_key TEXT
+);
+CREATE VIRTUAL TABLE drug_fts USING fts5(
+    key, comp_key, content='drug', content_rowid='id', tokenize='trigram'
+);
+CREATE TABLE drug_prefix (word TEXT, id INTEGER, PRIMARY KEY (word, id)) WITHOUT ROWID;
+CREATE TABLE vocab (word TEXT PRIMARY KEY, sound TEXT) WITHOUT ROWID;
+CREATE INDEX vocab_sound ON vocab (sound);
+CREATE TABLE vocab_delete (variant TEXT, word TEXT, PRIMARY KEY (variant, word)) WITHOUT ROWID;
+CREATE TABLE word_drug (
+    word TEXT, in_name INTEGER, id INTEGER, PRIMARY KEY (word, in_name, id)
+) WITHOUT ROWID;
+"""
+
+
+def fts_enabled():
+    return getattr(settings, "DRUG_SEARCH_BACKEND", "memory") == "fts5"
+
+
+def fts_path():
+    return str(getattr(settings, "DRUG_SEARCH_FTS_PATH", settings.BASE_DIR / "drug_search.sqlite3"))
+
+
+def _chunks(values, size=MAX_SQL_VARS):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def build_fts_file(entries, path=None, meta=None):
+    """
+    Write DrugEntry-like rows to a fresh FTS file and move it over `path`.
+    Returns the number of drugs written.
+    """
+    # imported here: drugs.search imports this module
+    from .fuzzy import fuzzy_words
+    from .search import _prefix_words
+
+    path = path or fts_path()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+        count = 0
+        prefixes, postings, words = set(), set(), set()
+        for e in entries:
+            conn.execute(
+                f"INSERT INTO drug ({', '.join(FTS_COLUMNS)}) VALUES ({', '.join('?' * len(FTS_COLUMNS))})",
+                [getattr(e, c) for c in FTS_COLUMNS],
+            )
+            prefixes.update((w, e.id) for w in _prefix_words(e.key))
+            for w in fuzzy_words(e.key):
+                postings.add((w, 1, e.id))
+                words.add(w)
+            for w in fuzzy_words(e.comp_key or ""):
+                postings.add((w, 0, e.id))
+                words.add(w)
+            count += 1
+
+        conn.execute("INSERT INTO drug_fts (drug_fts) VALUES ('rebuild')")
+        conn.executemany("INSERT INTO drug_prefix VALUES (?, ?)", sorted(prefixes))
+        conn.executemany("INSERT INTO word_drug VALUES (?, ?, ?)", sorted(postings))
+        conn.executemany("INSERT INTO vocab VALUES (?, ?)", [(w, phonetic_key(w)) for w in sorted(words)])
+        conn.executemany(
+            "INSERT INTO vocab_delete VALUES (?, ?)",
+            sorted({(v, w) for w in words for v in _deletes(w)}),
+        )
+        meta = dict(meta or {}, count=count, built_at=time.time())
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in meta.items()])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    os.replace(tmp, path)
+    return count
+
+
+@contextmanager
+def build_lock(path=None):
+    """Exclusive lock beside the file so one process writes it at a time (blocks)."""
+    with open(f"{path or fts_path()}.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class GlobalDrugFTS:
+    """Per-thread read-only connections to the FTS file, reopened when it is replaced."""
+
+    def __init__(self, path=None):
+        self._path = path
+        self._local = threading.local()
+        self.generation = 0          # bumps when a new file is opened (memo keys)
+        self._stamp = None
+        self._checked_at = 0.0
+
+    @property
+    def path(self):
+        return self._path or fts_path()
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def check(self):
+        """Notice a rebuilt file (at most every CHECK_SECONDS). Returns the generation."""
+        now = time.monotonic()
+        if now - self._checked_at >= CHECK_SECONDS or self._stamp is None:
+            self._checked_at = now
+            stamp = self._file_stamp()          # FileNotFoundError: run build_drug_fts
+            if stamp != self._stamp:
+                self._stamp = stamp
+                self.generation += 1
+                logger.info("Drug FTS file opened: %s", self.path)
+        return self.generation
+
+    def _conn(self):
+        self.check()
+        local = self._local
+        if getattr(local, "generation", None) != self.generation:
+            if getattr(local, "conn", None) is not None:
+                local.conn.close()
+            local.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            local.conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+            local.generation = self.generation
+        return local.conn
+
+    def available(self):
+        try:
+            self.check()
+            return True
+        except (OSError, sqlite3.Error):
+            return False
+
+    def meta(self):
+        return dict(self._conn().execute("SELECT name, value FROM meta"))
+
+    def built_version(self):
+        """
+        catalog_version the file was written at (0 if not recorded), None
+        without a file. Read on a fresh connection, not the cached one,
+        so a file replaced a moment ago is seen at once.
+        """
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE name = 'catalog_version'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        return int(row[0]) if row else 0
+
+    # ------------------------------------------------------------------
+    def _rows(self, sql, params=()):
+        return self._conn().execute(sql, params).fetchall()
+
+    def entries(self, ids):
+        """{id: row tuple in FTS_COLUMNS order}."""
+        out = {}
+        cols = ", ".join(FTS_COLUMNS)
+        for chunk in _chunks(ids):
+            for row in self._rows(f"SELECT {cols} FROM drug WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                out[row[0]] = row
+        return out
+
+    def prefix_rows(self, q):
+        """Drugs with a name word (or the whole name) starting with `q`."""
+        cols = ", ".join(f"d.{c}" for c in FTS_COLUMNS)
+        return self._rows(
+            f"SELECT DISTINCT {cols} FROM drug_prefix p JOIN drug d ON d.id = p.id "
+            "WHERE p.word >= ? AND p.word < ?",
+            (q, q + "\U0010ffff"),
+        )
+
+    def substring_rows(self, q, composition=False):
+        """Drugs whose name (or composition) contains `q`; q has 3+ characters."""
+        phrase = '"' + q.replace('"', '""') + '"'
+        match = f"{{key comp_key}} : {phrase}" if composition else f"key : {phrase}"
+        cols = ", ".join(f"d.{c}" for c in FTS_COLUMNS)
+        return self._rows(
+            f"SELECT {cols} FROM drug_fts JOIN drug d ON d.id = drug_fts.rowid WHERE drug_fts MATCH ?",
+            (match,),
+        )
+
+    def vocab_lookup(self, word):
+        """Same contract as drugs.fuzzy.FuzzyVocabulary.lookup()."""
+        limit = MAX_DISTANCE if len(word) >= LONG_WORD_LENGTH else 1
+        variants = list(_deletes(word))
+        found = {}
+        for chunk in _chunks(variants):
+            for (candidate,) in self._rows(
+                f"SELECT DISTINCT word FROM vocab_delete WHERE variant IN ({', '.join('?' * len(chunk))})", chunk,
+            ):
+                if candidate not in found:
+                    d = edit_distance(word, candidate, limit)
+                    if d <= limit:
+                        found[candidate] = d
+        for (candidate,) in self._rows("SELECT word FROM vocab WHERE sound = ?", (phonetic_key(word),)):
+            if candidate not in found and edit_distance(word, candidate, len(word) // 2) <= len(word) // 2:
+                found[candidate] = PHONETIC_SCORE
+        return found
+
+    def word_postings(self, words):
+        """[(word, in_name, id)] for vocabulary words."""
+        out = []
+        for chunk in _chunks(words):
+            out += self._rows(
+                f"SELECT word, in_name, id FROM word_drug WHERE word IN ({', '.join('?' * len(chunk))})", chunk,
+            )
+        return out
+
+
+global_fts = GlobalDrugFTS()
@@ -0,0 +1,134 @@
+# drugs/fuzzy.py
+"""
+Typo-tolerant word lookup for drug search (used by drugs.search).
+
+FuzzyVocabulary holds the distinct words of drug names and compositions
+in a symmetric-delete index: every word is stored under all strings
+reachable by deleting up to MAX_DISTANCE characters from its first
+PREFIX_LENGTH characters. A query generates the same deletes, so words
+within the distance share a key and are found with a few dict lookups
+instead of a scan. Candidates are confirmed with edit_distance().
+
+Words that sound alike but are further apart ("fenylefrin" /
+"phenylephrine") are found through a phonetic_key() bucket.
+"""
+import re
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+MIN_WORD_LENGTH = 4          # shorter words are too ambiguous to correct
+LONG_WORD_LENGTH = 6         # below this only one edit is allowed
+
+# score of a phonetic-only match: after every real edit-distance hit
+PHONETIC_SCORE = MAX_DISTANCE + 1
+
+_PHONETIC_RULES = (
+    ("ph", "f"), ("gh", "g"), ("ck", "k"), ("qu", "kw"), ("x", "ks"),
+    ("th", "t"), ("sch", "sk"), ("wh", "w"),
+)
+_SOFT_C = re.compile(r"c(?=[eiy])")
+_SILENT_H = re.compile(r"(?<=[^aeiou])h")
+_VOWELS = re.compile(r"[aeiouy]")
+_REPEATS = re.compile(r"(.)\1+")
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent swaps,
+    so "paracetmaol" is one edit from "paracetamol"). With `limit`, stops
+    as soon as the distance must exceed it and returns limit + 1.
+    """
+    if a == b:
+        return 0
+    if len(a) > len(b):
+        a, b = b, a
+    la, lb = len(a), len(b)
+    if limit is not None and lb - la > limit:
+        return limit + 1
+
+    before, prev = None, list(range(la + 1))
+    for j in range(1, lb + 1):
+        bj = b[j - 1]
+        cur = [j] + [0] * la
+        row_min = j
+        for i in range(1, la + 1):
+            ai = a[i - 1]
+            v = min(prev[i] + 1, cur[i - 1] + 1, prev[i - 1] + (ai != bj))
+            if i > 1 and j > 1 and ai == b[j - 2] and a[i - 2] == bj:
+                v = min(v, before[i - 2] + 1)
+            cur[i] = v
+            if v < row_min:
+                row_min = v
+        if limit is not None and row_min > limit:
+            return limit + 1
+        before, prev = prev, cur
+    return prev[la]
+
+
+def phonetic_key(word):
+    """Rough English/Latin sound key: spelling variants of a drug name collapse together."""
+    w = word.lower()
+    for src, dst in _PHONETIC_RULES:
+        w = w.replace(src, dst)
+    w = _SOFT_C.sub("s", w)
+    w = w.replace("c", "k").replace("q", "k").replace("z", "s").replace("w", "v")
+    w = _SILENT_H.sub("", w)
+    w = w[:1] + _VOWELS.sub("", w[1:])
+    return _REPEATS.sub(r"\1", w)
+
+
+def _deletes(word):
+    word = word[:PREFIX_LENGTH]
+    found, frontier = {word}, {word}
+    for _ in range(MAX_DISTANCE):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+def fuzzy_words(text):
+    """The words of `text` (already normalized) worth correcting."""
+    return {w for w in re.findall(r"[a-z]+", text) if len(w) >= MIN_WORD_LENGTH}
+
+
+class FuzzyVocabulary:
+    def __init__(self):
+        self.words = set()
+        self.deletes = {}        # delete variant -> [words]
+        self.sounds = {}         # phonetic key -> {words}
+
+    def add(self, word):
+        if word in self.words:
+            return
+        self.words.add(word)
+        for key in _deletes(word):
+            self.deletes.setdefault(key, []).append(word)
+        self.sounds.setdefault(phonetic_key(word), set()).add(word)
+
+    def discard(self, word):
+        # delete-variant lists are left alone; lookup() skips words no longer here
+        self.words.discard(word)
+        bucket = self.sounds.get(phonetic_key(word))
+        if bucket is not None:
+            bucket.discard(word)
+
+    def lookup(self, word):
+        """{vocabulary word: score} for words within MAX_DISTANCE edits or sounding alike."""
+        limit = MAX_DISTANCE if len(word) >= LONG_WORD_LENGTH else 1
+        found = {}
+        seen = set()
+        for key in _deletes(word):
+            for candidate in self.deletes.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if candidate not in self.words:
+                    continue
+                d = edit_distance(word, candidate, limit)
+                if d <= limit:
+                    found[candidate] = d
+
+        for candidate in self.sounds.get(phonetic_key(word), ()):
+            if candidate not in found and edit_distance(word, candidate, len(word) // 2) <= len(word) // 2:
+                found[candidate] = PHONETIC_SCORE
+        return found
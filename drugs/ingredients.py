@@ -0,0 +1,101 @@
+# drugs/ingredients.py
+"""
+Salt -> brand lookups over the DrugIngredient inverted index.
+
+sync_drug_ingredients()  – (re)write the ingredient rows for some drugs
+                           from their composition text (bulk queries).
+brands_containing()      – drugs containing a salt, optionally at a
+                           strength, via the (ingredient, strength) index.
+same_composition()       – drugs with an equal Drug.composition_key.
+
+Both lookups are scoped like the autocomplete: global library, the
+user's hospital and the doctor's own drugs.
+"""
+from django.db.models import Q
+
+from .composition import composition_key, normalize_salt, normalize_strength, parse_composition
+from .models import Drug, DrugIngredient, Ingredient
+
+
+def visible_drugs_q(doctor=None, hospital=None, prefix=""):
+    q = Q(**{f"{prefix}hospital__isnull": True, f"{prefix}added_by_doctor__isnull": True})
+    if hospital:
+        q |= Q(**{f"{prefix}hospital": hospital, f"{prefix}added_by_doctor__isnull": True})
+    if doctor:
+        q |= Q(**{f"{prefix}added_by_doctor": doctor})
+    return q
+
+
+def ingredient_ids(names):
+    """{name: Ingredient id}, creating the missing ones."""
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(Ingredient.objects.filter(name__in=names).values_list("name", "id"))
+    missing = names - ids.keys()
+    if missing:
+        Ingredient.objects.bulk_create([Ingredient(name=n) for n in missing], ignore_conflicts=True)
+        ids.update(Ingredient.objects.filter(name__in=missing).values_list("name", "id"))
+    return ids
+
+
+def sync_drug_ingredients(drugs, compositions=None):
+    """
+    Replace the DrugIngredient rows of `drugs` (Drug instances or
+    (id, composition) pairs) with what their composition parses to.
+    `compositions` may override the text per drug id (catalog fill-in).
+    Returns the number of rows written.
+    """
+    compositions = compositions or {}
+    parsed = {}
+    for d in drugs:
+        drug_id, text = (d.pk, d.composition) if isinstance(d, Drug) else d
+        parsed[drug_id] = parse_composition(compositions.get(drug_id) or text)
+
+    ids = ingredient_ids(name for parts in parsed.values() for name, _ in parts)
+    DrugIngredient.objects.filter(drug_id__in=list(parsed)).delete()
+    rows = [
+        DrugIngredient(drug_id=drug_id, ingredient_id=ids[name], strength=strength[:50])
+        for drug_id, parts in parsed.items()
+        for name, strength in parts
+    ]
+    DrugIngredient.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    return len(rows)
+
+
+def match_ingredients(term, limit=20):
+    """Ingredients whose normalized name starts with `term` (unique-index range scan)."""
+    name = normalize_salt(term)
+    if not name:
+        return Ingredient.objects.none()
+    return Ingredient.objects.filter(name__startswith=name).order_by("name")[:limit]
+
+
+def brands_containing(term, strength=None, doctor=None, hospital=None, limit=50):
+    """
+    Drugs with an ingredient matching `term` (and `strength`, if given).
+    Returns (ingredients, [DrugIngredient with .drug and .ingredient loaded]).
+    """
+    ingredients = list(match_ingredients(term))
+    if not ingredients:
+        return [], []
+    links = DrugIngredient.objects.filter(ingredient__in=ingredients)
+    if strength:
+        links = links.filter(strength=normalize_strength(strength))
+    links = (
+        links.filter(visible_drugs_q(doctor, hospital, prefix="drug__"))
+        .select_related("drug", "ingredient")
+        .order_by("drug__drug_name", "drug_id")[:limit]
+    )
+    return ingredients, list(links)
+
+
+def same_composition(drug=None, composition=None, doctor=None, hospital=None, limit=30):
+    """Other drugs with exactly the same salts and strengths as `drug` (or a composition text)."""
+    key = drug.composition_key if drug is not None else composition_key(composition)
+    if not key:
+        return Drug.objects.none()
+    qs = Drug.objects.filter(composition_key=key).filter(visible_drugs_q(doctor, hospital))
+    if drug is not None:
+        qs = qs.exclude(pk=drug.pk)
+    return qs.order_by("drug_name")[:limit]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drugs', '0007_remove_drugtemplate_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, unique=True)),
+            ],
+            options={
+                'db_table': 'drug_ingredient',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='drug',
+            name='composition_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=40),
+        ),
+        migrations.CreateModel(
+            name='DrugIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strength', models.CharField(blank=True, default='', max_length=50)),
+                ('drug', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_links', to='drugs.drug')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drug_links', to='drugs.ingredient')),
+            ],
+            options={
+                'db_table': 'drug_ingredient_link',
+                'indexes': [models.Index(fields=['ingredient', 'strength'], name='drug_ingr_strength_idx')],
+                'unique_together': {('drug', 'ingredient', 'strength')},
+            },
+        ),
+    ]
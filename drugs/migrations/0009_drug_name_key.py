@@ -0,0 +1,92 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:27
+
+import re
+
+from django.db import migrations, models
+
+_NAME_PUNCT = re.compile(r"[\W_]+")
+
+
+def _name_key(name):
+    # same as drugs.models.drug_name_key at the time of writing
+    return " ".join(_NAME_PUNCT.sub(" ", (name or "").casefold()).split())
+
+
+def populate_keys(apps, schema_editor):
+    Drug = apps.get_model("drugs", "Drug")
+    DoctorDrugUsage = apps.get_model("drugs", "DoctorDrugUsage")
+
+    # Drugs: duplicates within a scope get "#<id>" so the unique index can be built;
+    # the oldest row keeps the plain key and nothing is deleted.
+    seen, batch = set(), []
+    for d in Drug.objects.order_by("id").only("id", "drug_name", "hospital_id", "added_by_doctor_id").iterator(chunk_size=2000):
+        if d.added_by_doctor_id:
+            d.scope_key = f"d{d.added_by_doctor_id}"
+        elif d.hospital_id:
+            d.scope_key = f"h{d.hospital_id}"
+        else:
+            d.scope_key = "g"
+        d.name_key = _name_key(d.drug_name)
+        if (d.scope_key, d.name_key) in seen:
+            d.name_key = f"{d.name_key[:240]}#{d.id}"
+        seen.add((d.scope_key, d.name_key))
+        batch.append(d)
+        if len(batch) >= 1000:
+            Drug.objects.bulk_update(batch, ["scope_key", "name_key"])
+            batch = []
+    Drug.objects.bulk_update(batch, ["scope_key", "name_key"])
+
+    # Usage counters: rows that now share a key are merged into the oldest one
+    groups = {}
+    for u in DoctorDrugUsage.objects.order_by("id"):
+        groups.setdefault((u.doctor_id, _name_key(u.drug_name)[:255]), []).append(u)
+    keep, extra = [], []
+    for (_doctor_id, key), rows in groups.items():
+        first = rows[0]
+        first.drug_key = key
+        if len(rows) > 1:
+            first.usage_count = sum(r.usage_count for r in rows)
+            first.last_used_on = max(r.last_used_on for r in rows)
+            extra.extend(r.id for r in rows[1:])
+        keep.append(first)
+    DoctorDrugUsage.objects.filter(pk__in=extra).delete()
+    DoctorDrugUsage.objects.bulk_update(keep, ["drug_key", "usage_count", "last_used_on"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0003_doctor_consult_message_template_and_more'),
+        ('drugs', '0008_drug_ingredients'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='doctordrugusage',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='doctordrugusage',
+            name='drug_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='drug',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='drug',
+            name='scope_key',
+            field=models.CharField(default='g', editable=False, max_length=24),
+        ),
+        migrations.RunPython(populate_keys, reverse_code=migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='doctordrugusage',
+            unique_together={('doctor', 'drug_key')},
+        ),
+        migrations.AddConstraint(
+            model_name='drug',
+            constraint=models.UniqueConstraint(fields=('scope_key', 'name_key'), name='drug_scope_name_uniq'),
+        ),
+    ]
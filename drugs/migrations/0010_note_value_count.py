@@ -0,0 +1,30 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_alter_role_role_name'),
+        ('drugs', '0009_drug_name_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteValueCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'db_table': 'drug_note_value_count',
+                'indexes': [models.Index(fields=['hospital', 'field', '-count'], name='note_value_top_idx')],
+                'unique_together': {('hospital', 'field', 'value')},
+            },
+        ),
+    ]
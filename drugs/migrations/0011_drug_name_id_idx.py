@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drugs', '0010_note_value_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='drug',
+            index=models.Index(fields=['drug_name', 'id'], name='drug_name_id_idx'),
+        ),
+    ]
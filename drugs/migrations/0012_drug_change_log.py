@@ -0,0 +1,27 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drugs', '0011_drug_name_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrugChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('drug_id', models.IntegerField()),
+                ('scope_key', models.CharField(max_length=24)),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'drug_change_log',
+                'indexes': [models.Index(fields=['scope_key', 'id'], name='drug_change_scope_idx')],
+            },
+        ),
+    ]
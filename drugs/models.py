@@ -1,7 +1,29 @@
-from django.db import models
+import re
+
+from django.db import IntegrityError, models, transaction
 from core.models import Hospital
 from doctors.models import Doctor  # ✅ Make sure this import is correct
 from django.conf import settings
+from .composition import composition_key
+
+
+_NAME_PUNCT = re.compile(r"[\W_]+")
+
+
+def drug_name_key(name):
+    """Comparison form of a drug name: casefolded, punctuation stripped, single spaces."""
+    return " ".join(_NAME_PUNCT.sub(" ", (name or "").casefold()).split())
+
+
+def drug_scope_key(hospital_id=None, doctor_id=None):
+    """Uniqueness scope: the doctor's own list, else the hospital's, else the global library."""
+    if doctor_id:
+        return f"d{doctor_id}"
+    if hospital_id:
+        return f"h{hospital_id}"
+    return "g"
+
+
 class Drug(models.Model):
     drug_name = models.CharField(max_length=255)
     composition = models.TextField(blank=True, null=True)
@@ -20,6 +42,22 @@ class Drug(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Signature of the parsed composition (drugs.composition); equal keys = same salts + strengths
+    composition_key = models.CharField(max_length=40, blank=True, default="", db_index=True)
+
+    # drug_name_key() / drug_scope_key(); unique together, so duplicate checks are index lookups
+    name_key = models.CharField(max_length=255, default="", editable=False)
+    scope_key = models.CharField(max_length=24, default="g", editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope_key", "name_key"], name="drug_scope_name_uniq"),
+        ]
+        indexes = [
+            # keyset pagination of the library (drugs.pagination)
+            models.Index(fields=["drug_name", "id"], name="drug_name_id_idx"),
+        ]
+
     def save(self, *args, **kwargs):
         # Normalize casing
         if self.drug_name:
@@ -28,16 +66,18 @@ class Drug(models.Model):
         if self.composition:
             # Proper-style: first letter uppercase, rest same
             self.composition = self.composition.strip().capitalize()
+        self.composition_key = composition_key(self.composition)
 
-        # Prevent duplicates
-        query = Drug.objects.filter(drug_name__iexact=self.drug_name.strip())
-
-        if self.hospital:
-            query = query.filter(hospital=self.hospital, added_by_doctor__isnull=True)
-        elif self.added_by_doctor:
-            query = query.filter(added_by_doctor=self.added_by_doctor)
-        else:
-            query = query.filter(hospital__isnull=True, added_by_doctor__isnull=True)
+        # Prevent duplicates (indexed: scope_key + name_key)
+        name_key = drug_name_key(self.drug_name)
+        scope_key = drug_scope_key(self.hospital_id, self.added_by_doctor_id)
+        legacy_key = f"{name_key[:240]}#{self.pk}"
+        if self.pk and self.name_key == legacy_key and self.scope_key == scope_key:
+            # duplicate left by migration 0009: keeps its "#<id>" key until renamed or moved
+            name_key = legacy_key
+        self.name_key = name_key
+        self.scope_key = scope_key
+        query = Drug.objects.filter(scope_key=self.scope_key, name_key=self.name_key)
 
         if self.pk:
             query = query.exclude(pk=self.pk)
@@ -45,7 +85,12 @@ class Drug(models.Model):
         if query.exists():
             raise ValueError("Duplicate drug detected in the same scope.")
 
-        super().save(*args, **kwargs)
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError:
+            # a concurrent save won the unique index
+            raise ValueError("Duplicate drug detected in the same scope.")
 
 
     def __str__(self):
@@ -68,6 +113,51 @@ class UserPreset(models.Model):
         unique_together = ('user', 'field_name', 'value')
 
 
+class DrugChange(models.Model):
+    """
+    Append-only log of Drug writes; its id is the catalog version that
+    browsers sync against (drugs.catalog). Written by core.signals and by
+    the bulk import commands. No FK: deleted drugs keep their entries.
+    """
+    id = models.BigAutoField(primary_key=True)
+    drug_id = models.IntegerField()
+    scope_key = models.CharField(max_length=24)     # Drug.scope_key at the time
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "drug_change_log"
+        indexes = [
+            models.Index(fields=["scope_key", "id"], name="drug_change_scope_idx"),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} drug {self.drug_id} {'deleted' if self.deleted else 'saved'} ({self.scope_key})"
+
+
+class NoteValueCount(models.Model):
+    """
+    How often a dosage / frequency / duration / food_order value was
+    prescribed in a hospital. Kept current by core.signals on
+    PrescriptionDetails changes; `manage.py build_note_value_counts`
+    rebuilds it. Read by drugs.presets for notes autocomplete.
+    """
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    field = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "drug_note_value_count"
+        unique_together = ("hospital", "field", "value")
+        indexes = [
+            models.Index(fields=["hospital", "field", "-count"], name="note_value_top_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.hospital_id} {self.field}={self.value} ({self.count})"
+
+
 class DoctorDrug(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='selected_drugs')
     drug = models.ForeignKey(Drug, on_delete=models.CASCADE, related_name='selected_by_doctors')
@@ -116,16 +206,55 @@ class DoctorDrugUsage(models.Model):
     # We intentionally use drug_name (string) for now
     # to avoid refactoring Drug FK at this stage
     drug_name = models.CharField(max_length=255)
+    drug_key = models.CharField(max_length=255, default="", editable=False)   # drug_name_key(drug_name)
 
     usage_count = models.PositiveIntegerField(default=0)
     last_used_on = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ("doctor", "drug_name")
+        unique_together = ("doctor", "drug_key")
         indexes = [
             models.Index(fields=["doctor", "-usage_count"]),
             models.Index(fields=["doctor", "-last_used_on"]),
         ]
 
+    def save(self, *args, **kwargs):
+        self.drug_key = drug_name_key(self.drug_name)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.doctor.doctor_name} → {self.drug_name} ({self.usage_count})"
+
+
+class Ingredient(models.Model):
+    """Normalized active ingredient (salt), e.g. "amoxicillin" (see drugs.composition)."""
+    name = models.CharField(max_length=150, unique=True)
+
+    class Meta:
+        db_table = "drug_ingredient"
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class DrugIngredient(models.Model):
+    """
+    One salt + strength of a Drug's composition. Rebuilt from
+    Drug.composition on save (core.signals) and by
+    `manage.py build_ingredient_index`; (ingredient, strength) is the
+    inverted index from salt to brands.
+    """
+    drug = models.ForeignKey(Drug, on_delete=models.CASCADE, related_name="ingredient_links")
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name="drug_links")
+    strength = models.CharField(max_length=50, blank=True, default="")
+
+    class Meta:
+        db_table = "drug_ingredient_link"
+        unique_together = ("drug", "ingredient", "strength")
+        indexes = [
+            models.Index(fields=["ingredient", "strength"], name="drug_ingr_strength_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.drug.drug_name} → {self.ingredient.name} {self.strength}".strip()
@@ -0,0 +1,121 @@
+# drugs/pagination.py
+"""
+Keyset (cursor) pagination for the drug library pages.
+
+Pages are read in (drug_name, id) order with `WHERE (drug_name, id) > cursor
+LIMIT n + 1` (or `<`, reversed, for the previous page), so every page is
+one range scan on the drug_name_id_idx index, however deep. The cursor is
+the (drug_name, id) of the first/last row, base64-encoded for the URL.
+
+The total is only for the "page N of ~M" label. It is cached per filter
+and keyed by the drug index version (the last DrugChange id), so any Drug
+change recounts, whichever process made it.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+
+from .search import drug_index_version
+
+PER_PAGE = 50
+COUNT_CACHE_SECONDS = 600
+
+
+def encode_cursor(drug):
+    raw = json.dumps([drug.drug_name, drug.pk], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(value):
+    """(drug_name, id) or None for a missing / garbled cursor."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        name, pk = json.loads(raw.decode("utf-8"))
+        return str(name), int(pk)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """The bits of django.core.paginator.Page the library templates use."""
+
+    def __init__(self, object_list, number, has_previous, has_next, count, per_page):
+        self.object_list = object_list
+        self.number = number
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.count = count
+        self.num_pages = max(1, math.ceil(count / per_page)) if count is not None else None
+        self.next_cursor = encode_cursor(object_list[-1]) if has_next else ""
+        self.previous_cursor = encode_cursor(object_list[0]) if has_previous else ""
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def previous_page_number(self):
+        return max(1, self.number - 1)
+
+    def next_page_number(self):
+        return self.number + 1
+
+
+def keyset_page(qs, after=None, before=None, number=1, per_page=PER_PAGE, count=None):
+    """
+    One page of `qs` in (drug_name, id) order, after or before the given
+    cursor strings (first page when neither decodes). `number` is only
+    carried for display.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+
+    if before:
+        name, pk = before
+        rows = list(
+            qs.filter(Q(drug_name__lt=name) | Q(drug_name=name, id__lt=pk))
+            .order_by("-drug_name", "-id")[:per_page + 1]
+        )
+        if rows:
+            has_previous = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            return KeysetPage(rows, number if has_previous else 1, has_previous, True, count, per_page)
+        after = None             # nothing before it any more: show the first page
+
+    if after:
+        name, pk = after
+        qs = qs.filter(Q(drug_name__gt=name) | Q(drug_name=name, id__gt=pk))
+    else:
+        number = 1
+    rows = list(qs.order_by("drug_name", "id")[:per_page + 1])
+    has_next = len(rows) > per_page
+    return KeysetPage(rows[:per_page], max(1, number), bool(after), has_next, count, per_page)
+
+
+def cached_count(qs, *key_parts):
+    """qs.count(), cached per `key_parts` until drugs change (or COUNT_CACHE_SECONDS)."""
+    version = drug_index_version()
+    if version is None:
+        return qs.count()
+    digest = hashlib.md5(repr(key_parts).encode("utf-8")).hexdigest()
+    key = f"drug_library_count:{version}:{digest}"
+    cache = caches[getattr(settings, "DRUG_SEARCH_CACHE", "default")]
+    count = cache.get(key)
+    if count is None:
+        count = qs.count()
+        cache.set(key, count, COUNT_CACHE_SECONDS)
+    return count
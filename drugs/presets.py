@@ -0,0 +1,108 @@
+# drugs/presets.py
+"""
+Notes autocomplete (dosage / frequency / duration ...) without scanning
+PrescriptionDetails.
+
+NoteValueCount holds (hospital, field, value) -> count and is bumped by
+count_note_values() as detail rows are saved, edited or deleted
+(core.signals). The top values and each user's UserPreset rows are
+cached per process for a short while; note_suggestions() merges them
+with the PRESETS defaults.
+"""
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .constants import PRESETS
+from .models import NoteValueCount, UserPreset
+
+# PrescriptionDetails columns that feed the "frequently used" suggestions
+COUNTED_FIELDS = ("dosage", "frequency", "duration", "food_order")
+TOP_NOTE_VALUES = 10
+NOTE_CACHE_TTL = 60     # seconds; other workers see new counts / presets within this
+
+_top_values = {}        # (hospital_id, field) -> (expires_at, [value, ...])
+_user_presets = {}      # (user_id, field) -> (expires_at, [value, ...])
+
+
+def note_values(detail):
+    """{field: value} of the non-blank counted columns of a PrescriptionDetails row."""
+    out = {}
+    for field in COUNTED_FIELDS:
+        value = (getattr(detail, field, None) or "").strip()[:100]
+        if value:
+            out[field] = value
+    return out
+
+
+def count_note_values(hospital_id, values, delta=1):
+    """Add `delta` to the count of each {field: value} (one UPDATE each, INSERT on first use)."""
+    if not hospital_id:
+        return
+    for field, value in values.items():
+        rows = NoteValueCount.objects.filter(hospital_id=hospital_id, field=field, value=value)
+        if delta < 0:
+            rows.filter(count__gte=-delta).update(count=F("count") + delta)
+        elif not rows.update(count=F("count") + delta):
+            try:
+                with transaction.atomic():
+                    NoteValueCount.objects.create(
+                        hospital_id=hospital_id, field=field, value=value, count=delta,
+                    )
+            except IntegrityError:
+                # created concurrently (or a case-insensitive twin on MySQL)
+                rows.update(count=F("count") + delta)
+        _top_values.pop((hospital_id, field), None)
+
+
+def _cached(store, key, load):
+    entry = store.get(key)
+    if entry is None or entry[0] < time.monotonic():
+        entry = (time.monotonic() + NOTE_CACHE_TTL, load())
+        store[key] = entry
+    return entry[1]
+
+
+def top_note_values(hospital_id, field):
+    """Most used values of `field` in the hospital (index range scan on NoteValueCount)."""
+    if not hospital_id or field not in COUNTED_FIELDS:
+        return []
+    return _cached(_top_values, (hospital_id, field), lambda: list(
+        NoteValueCount.objects.filter(hospital_id=hospital_id, field=field, count__gt=0)
+        .order_by("-count", "value")
+        .values_list("value", flat=True)[:TOP_NOTE_VALUES]
+    ))
+
+
+def user_presets(user_id, field):
+    return _cached(_user_presets, (user_id, field), lambda: list(
+        UserPreset.objects.filter(user_id=user_id, field_name=field).values_list("value", flat=True)
+    ))
+
+
+def clear_user_presets(user_id):
+    for key in [k for k in _user_presets if k[0] == user_id]:
+        _user_presets.pop(key, None)
+
+
+def clear_note_caches():
+    _top_values.clear()
+    _user_presets.clear()
+
+
+def note_suggestions(user, field, term="", limit=10):
+    """User presets, then PRESETS defaults, then the hospital's most used values; filtered by `term`."""
+    if field not in PRESETS:
+        return []
+    term = (term or "").strip().lower()
+
+    mine = user_presets(user.pk, field)
+    combined = list(mine)
+    seen = set(combined)
+    for value in list(PRESETS[field]) + top_note_values(getattr(user, "hospital_id", None), field):
+        if value not in seen:
+            seen.add(value)
+            combined.append(value)
+
+    return [v for v in combined if term in v.lower()][:limit]
@@ -0,0 +1,116 @@
+# drugs/ranking.py
+"""
+Per-doctor drug preference from DoctorDrugUsage, for the autocomplete.
+
+    score = usage_count * 0.5 ** (days since last_used_on / USAGE_HALF_LIFE_DAYS)
+
+A doctor's top DOCTOR_TOP_DRUGS scores (keyed by Drug.name_key /
+DoctorDrugUsage.drug_key) are read once and held in process memory;
+drugs.search puts those drugs first, so the usual ones show up after a
+single keystroke without touching the database.
+
+A doctor's version is read from their DoctorDrugUsage rows (total
+usage and last use), so a prescription finalized in any process moves it;
+every process compares it at most every RANKING_CHECK_SECONDS and
+re-reads the scores. ai_finalize also calls bump_doctor_ranking() after
+commit so the process that wrote the usage drops its copy at once. The
+scores are recomputed after RANKING_MAX_AGE seconds so the decay keeps
+moving.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from django.db import DatabaseError
+from django.db.models import Max, Sum
+
+from .models import DoctorDrugUsage
+
+logger = logging.getLogger(__name__)
+
+USAGE_HALF_LIFE_DAYS = 30
+DOCTOR_TOP_DRUGS = 200
+RANKING_MAX_AGE = 3600          # seconds
+RANKING_CHECK_SECONDS = 2       # how often a process compares the version with the database
+
+DoctorRanking = namedtuple("DoctorRanking", "generation version loaded_at scores")
+
+_rankings = {}                  # doctor_id -> (checked_at, DoctorRanking)
+_generation = itertools.count(1)
+_lock = threading.Lock()
+
+
+def _shared_version(doctor_id):
+    """'<total usage>.<last use>' for the doctor (None if the query failed)."""
+    try:
+        usage = DoctorDrugUsage.objects.filter(doctor_id=doctor_id).aggregate(
+            total=Sum("usage_count"), last=Max("last_used_on"),
+        )
+    except DatabaseError:
+        logger.exception("Drug ranking: version lookup failed")
+        return None
+    last = usage["last"]
+    return f"{usage['total'] or 0}.{last.strftime('%Y%m%d%H%M%S%f') if last else 0}"
+
+
+def doctor_ranking_version(doctor_id):
+    return _shared_version(doctor_id) if doctor_id else 0
+
+
+def bump_doctor_ranking(doctor_id):
+    """The doctor's usage changed: drop this process' scores now (others notice the new version)."""
+    _rankings.pop(doctor_id, None)
+
+
+def usage_score(usage_count, last_used_on, now):
+    if not usage_count:
+        return 0.0
+    if last_used_on is None:
+        return float(usage_count)
+    days = max((now - last_used_on).total_seconds(), 0) / 86400
+    return usage_count * 0.5 ** (days / USAGE_HALF_LIFE_DAYS)
+
+
+def _load(doctor_id, version):
+    now = datetime.now()          # naive, like last_used_on (USE_TZ=False)
+    rows = DoctorDrugUsage.objects.filter(doctor_id=doctor_id, usage_count__gt=0).values_list(
+        "drug_key", "usage_count", "last_used_on",
+    )
+    scored = ((usage_score(count, used_on, now), key) for key, count, used_on in rows)
+    top = heapq.nlargest(DOCTOR_TOP_DRUGS, scored)
+    return DoctorRanking(
+        generation=next(_generation),
+        version=version,
+        loaded_at=time.monotonic(),
+        scores={key: score for score, key in top if score > 0},
+    )
+
+
+def doctor_ranking(doctor_id):
+    """The doctor's cached DoctorRanking (scores: name key -> score), or None without a doctor."""
+    if not doctor_id:
+        return None
+    now = time.monotonic()
+    cached = _rankings.get(doctor_id)
+    if cached is not None:
+        checked_at, ranking = cached
+        if now - ranking.loaded_at < RANKING_MAX_AGE:
+            if now - checked_at < RANKING_CHECK_SECONDS:
+                return ranking
+            version = _shared_version(doctor_id)
+            if version is None or version == ranking.version:
+                _rankings[doctor_id] = (now, ranking)
+                return ranking
+
+    with _lock:
+        ranking = _load(doctor_id, _shared_version(doctor_id))
+        _rankings[doctor_id] = (now, ranking)
+    return ranking
+
+
+def clear_doctor_rankings():
+    _rankings.clear()
@@ -0,0 +1,580 @@
+# drugs/search.py
+"""
+Per-process drug search index for the autocomplete views.
+
+Every Drug row (global, hospital and doctor scoped) is held in memory as a
+small DrugEntry tuple, with two lookup structures:
+
+- a prefix table: sorted (word, drug id) pairs for every word of the name
+  plus the whole name, searched with bisect (a flat prefix trie). Used for
+  terms shorter than three characters;
+- trigram postings: trigram -> set of drug ids for drug_name, and
+  trigram -> set of distinct compositions for composition (many brands
+  share one). A term of three or more characters takes the smallest
+  posting list of its trigrams and confirms each candidate with a
+  substring check, so results match the old `icontains` queries.
+
+Scope filtering and ranking (doctor, then hospital, then global; name
+prefix before word prefix before substring) happen on the candidates.
+Drugs the doctor prescribes often (drugs.ranking, from DoctorDrugUsage)
+go first when their name matches, highest usage score first.
+One- and two-letter terms match thousands of drugs, so their results are
+memoised until the index next changes.
+
+fuzzy_search() / closest() tolerate typos: the words of names and
+compositions also feed a drugs.fuzzy.FuzzyVocabulary (symmetric-delete
+index + phonetic key), with word -> drug postings to map corrections back.
+
+The index is built on first use (or by warm_drug_index() when a worker
+starts). core.signals applies Drug post_save/post_delete to this process'
+index at once. Every process also compares, every VERSION_CHECK_SECONDS,
+its version with the last DrugChange id (drugs.catalog; every Drug write,
+bulk imports included, logs one) and, when it moved or the index is older
+than DRUG_SEARCH_MAX_AGE, rebuilds in a background thread and swaps the
+new tables in. Lookups keep answering from the old index meanwhile; only
+the very first build runs on the request.
+
+With DRUG_SEARCH_BACKEND = "fts5" (and the file built by
+`manage.py build_drug_fts`) global drugs are not loaded: their matches
+come from the shared, mmapped SQLite file in drugs.fts and are ranked
+together with the in-memory hospital and doctor drugs. A global drug
+changed after the file was written makes the background rebuild rewrite
+the file first (refresh_fts_file()).
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Max
+
+from .fuzzy import FuzzyVocabulary, edit_distance, fuzzy_words
+from .fts import build_fts_file, build_lock, fts_enabled, global_fts
+from .models import Drug, DrugChange, drug_scope_key
+from .ranking import doctor_ranking
+
+logger = logging.getLogger(__name__)
+
+DrugEntry = namedtuple(
+    "DrugEntry",
+    "id drug_name composition dosage frequency duration hospital_id added_by_doctor_id name_key key comp_key",
+)
+
+ENTRY_FIELDS = ("id", "drug_name", "composition", "dosage", "frequency", "duration",
+                "hospital_id", "added_by_doctor_id", "name_key")
+
+SCOPE_DOCTOR, SCOPE_HOSPITAL, SCOPE_GLOBAL = 0, 1, 2
+SCOPE_LABELS = {SCOPE_DOCTOR: "doctor", SCOPE_HOSPITAL: "hospital", SCOPE_GLOBAL: "global"}
+
+# how often a lookup compares its version with the database
+VERSION_CHECK_SECONDS = 2
+SHORT_TERM_CACHE_SIZE = 2048
+
+# a fuzzy hit on the composition ranks just below the same hit on the name
+COMP_MATCH_PENALTY = 0.5
+NO_MATCH = float("inf")
+
+_WORD_SPLIT = re.compile(r"[^a-z0-9]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Lowercase, trim, single spaces."""
+    return _SPACES.sub(" ", (text or "").strip().lower())
+
+
+def _trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def _prefix_words(key):
+    words = {w for w in _WORD_SPLIT.split(key) if w}
+    words.add(key)
+    return words
+
+
+def drug_index_version():
+    """Last DrugChange id: moves on every Drug change, in any process (None if the query failed)."""
+    try:
+        return DrugChange.objects.aggregate(v=Max("id"))["v"] or 0
+    except DatabaseError:
+        logger.exception("Drug search: version lookup failed")
+        return None
+
+
+def global_drugs_version():
+    """Last DrugChange id of a global drug (None if the query failed)."""
+    try:
+        return DrugChange.objects.filter(scope_key=drug_scope_key()).aggregate(v=Max("id"))["v"] or 0
+    except DatabaseError:
+        logger.exception("Drug search: version lookup failed")
+        return None
+
+
+def fts_file_behind():
+    """True when a global drug changed after the FTS file was built."""
+    built = global_fts.built_version()
+    newest = global_drugs_version()
+    return built is not None and newest is not None and newest > built
+
+
+class _Tables:
+    """Everything one build produces; swapped in as a whole."""
+
+    def __init__(self):
+        self.entries = {}            # id -> DrugEntry
+        self.prefixes = []           # sorted (word, id)
+        self.name_grams = {}         # trigram -> {id}
+        self.comp_grams = {}         # trigram -> {composition key}
+        self.comp_ids = {}           # composition key -> {id}
+        self.name_words = {}         # name word -> {id}            (fuzzy)
+        self.comp_words = {}         # composition word -> {composition key}
+        self.vocab = FuzzyVocabulary()
+
+    def add(self, entry, sorted_prefixes=True):
+        self.entries[entry.id] = entry
+        for w in _prefix_words(entry.key):
+            if sorted_prefixes:
+                insort(self.prefixes, (w, entry.id))
+            else:
+                self.prefixes.append((w, entry.id))
+        for g in _trigrams(entry.key):
+            self.name_grams.setdefault(g, set()).add(entry.id)
+        for w in fuzzy_words(entry.key):
+            self.name_words.setdefault(w, set()).add(entry.id)
+            self.vocab.add(w)
+        if entry.comp_key:
+            if entry.comp_key not in self.comp_ids:
+                for g in _trigrams(entry.comp_key):
+                    self.comp_grams.setdefault(g, set()).add(entry.comp_key)
+                for w in fuzzy_words(entry.comp_key):
+                    self.comp_words.setdefault(w, set()).add(entry.comp_key)
+                    self.vocab.add(w)
+            self.comp_ids.setdefault(entry.comp_key, set()).add(entry.id)
+
+    def discard(self, drug_id):
+        entry = self.entries.pop(drug_id, None)
+        if entry is None:
+            return
+        for w in _prefix_words(entry.key):
+            i = bisect_left(self.prefixes, (w, drug_id))
+            if i < len(self.prefixes) and self.prefixes[i] == (w, drug_id):
+                del self.prefixes[i]
+        _unpost(self.name_grams, _trigrams(entry.key), drug_id)
+        gone = _unpost(self.name_words, fuzzy_words(entry.key), drug_id)
+        if entry.comp_key:
+            ids = self.comp_ids[entry.comp_key]
+            ids.discard(drug_id)
+            if not ids:                    # last drug with this composition
+                del self.comp_ids[entry.comp_key]
+                _unpost(self.comp_grams, _trigrams(entry.comp_key), entry.comp_key)
+                gone |= _unpost(self.comp_words, fuzzy_words(entry.comp_key), entry.comp_key)
+        for w in gone:
+            if w not in self.name_words and w not in self.comp_words:
+                self.vocab.discard(w)
+
+
+def _unpost(postings, keys, value):
+    """Remove `value` from each key's posting set; returns the keys left empty."""
+    emptied = set()
+    for k in keys:
+        values = postings.get(k)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del postings[k]
+                emptied.add(k)
+    return emptied
+
+
+class DrugSearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self._rebuilding = False
+        self.version = None
+        self.tables = _Tables()
+        self.short_results = {}      # (term, scope, limit, composition) -> results
+        self.fts = False             # global drugs come from drugs.fts, not self.tables
+
+    # ------------------------------------------------------------------
+    # build / maintain
+    # ------------------------------------------------------------------
+    def build(self):
+        version = drug_index_version()       # before the rows: a change made meanwhile rebuilds again
+        fts = fts_enabled() and global_fts.available()
+        if fts_enabled() and not fts:
+            logger.warning("Drug search: FTS file %s missing, loading global drugs into memory", global_fts.path)
+        drugs = Drug.objects.order_by()
+        if fts:
+            drugs = drugs.exclude(scope_key=drug_scope_key())
+        tables = _Tables()
+        for row in drugs.values_list(*ENTRY_FIELDS).iterator(chunk_size=2000):
+            tables.add(self._entry(row), sorted_prefixes=False)
+        tables.prefixes.sort()
+
+        with self._lock:
+            self.tables = tables
+            self.short_results = {}
+            self.version = version
+            self.fts = fts
+            self._built = True
+            self._built_at = self._checked_at = time.monotonic()
+        logger.info("Drug search index built: %s drugs", len(tables.entries))
+        return len(tables.entries)
+
+    @staticmethod
+    def _entry(row):
+        values = dict(zip(ENTRY_FIELDS, row))
+        return DrugEntry(
+            key=normalize(values["drug_name"]),
+            comp_key=normalize(values["composition"]),
+            **values,
+        )
+
+    def upsert(self, drug):
+        """Apply a saved Drug to this process' index (no-op until built)."""
+        with self._lock:
+            if not self._built:
+                return
+            self.tables.discard(drug.pk)
+            if not (self.fts and drug.hospital_id is None and drug.added_by_doctor_id is None):
+                self.tables.add(self._entry([getattr(drug, f) for f in ENTRY_FIELDS]))
+            self.short_results = {}
+
+    def remove(self, drug_id):
+        with self._lock:
+            if not self._built:
+                return
+            self.tables.discard(drug_id)
+            self.short_results = {}
+
+    def _stale(self, now):
+        max_age = getattr(settings, "DRUG_SEARCH_MAX_AGE", 3600)
+        if max_age and now - self._built_at > max_age:
+            return True
+        version = drug_index_version()
+        if version is not None and version != self.version:
+            return True
+        # build_drug_fts wrote (or someone removed) the global drugs file
+        if fts_enabled() and self.fts != global_fts.available():
+            return True
+        # admin edits of global drugs since the file was built
+        return self.fts and fts_file_behind()
+
+    def _ensure_fresh(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        if self._stale(now):
+            self._rebuild_in_background()
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name="drug-index-rebuild", daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            if self.fts:
+                refresh_fts_file()
+            self.build()
+        except Exception:
+            logger.exception("Drug search: rebuild failed; keeping the current index")
+        finally:
+            self._rebuilding = False
+            connection.close()             # this thread's own connection
+
+    # ------------------------------------------------------------------
+    # lookup
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _prefix_ids(t, q):
+        ids = set()
+        prefixes = t.prefixes
+        i = bisect_left(prefixes, (q,))
+        while i < len(prefixes) and prefixes[i][0].startswith(q):
+            ids.add(prefixes[i][1])
+            i += 1
+        return ids
+
+    @staticmethod
+    def _substring_matches(q, grams, check):
+        postings = []
+        for g in _trigrams(q):
+            values = grams.get(g)
+            if not values:
+                return ()
+            postings.append(values)
+        return [v for v in min(postings, key=len) if q in check(v)]
+
+    def _name_ids(self, t, q):
+        entries = t.entries
+        return set(self._substring_matches(q, t.name_grams, lambda i: entries[i].key))
+
+    def _composition_ids(self, t, q):
+        ids = set()
+        for comp_key in self._substring_matches(q, t.comp_grams, lambda c: c):
+            ids |= t.comp_ids[comp_key]
+        return ids
+
+    @staticmethod
+    def _fts_entry(row):
+        # drugs.fts.FTS_COLUMNS order; the file only holds global drugs
+        drug_id, drug_name, composition, dosage, frequency, duration, name_key, key, comp_key = row
+        return DrugEntry(
+            id=drug_id, drug_name=drug_name, composition=composition, dosage=dosage,
+            frequency=frequency, duration=duration, hospital_id=None, added_by_doctor_id=None,
+            name_key=name_key, key=key, comp_key=comp_key,
+        )
+
+    @staticmethod
+    def _fts_word_scores(word, composition):
+        """{global drug id: best score of `word`}, like the vocab loop in fuzzy_search()."""
+        matches = global_fts.vocab_lookup(word)
+        best = {}
+        for match, in_name, i in global_fts.word_postings(matches):
+            if not in_name and not composition:
+                continue
+            score = matches[match] + (0 if in_name else COMP_MATCH_PENALTY)
+            if score < best.get(i, NO_MATCH):
+                best[i] = score
+        return best
+
+    def _fts_matches(self, q, composition):
+        if len(q) < 3:
+            rows = global_fts.prefix_rows(q)
+        else:
+            rows = global_fts.substring_rows(q, composition)
+        return [self._fts_entry(row) for row in rows]
+
+    @staticmethod
+    def _scope(entry, doctor_id, hospital_id):
+        if doctor_id and entry.added_by_doctor_id == doctor_id:
+            return SCOPE_DOCTOR
+        if hospital_id and entry.hospital_id == hospital_id and entry.added_by_doctor_id is None:
+            return SCOPE_HOSPITAL
+        if entry.hospital_id is None and entry.added_by_doctor_id is None:
+            return SCOPE_GLOBAL
+        return None           # another hospital's / doctor's private drug
+
+    @staticmethod
+    def _match_rank(entry, q):
+        if entry.key.startswith(q):
+            return 0
+        if any(w.startswith(q) for w in _WORD_SPLIT.split(entry.key)):
+            return 1
+        if q in entry.key:
+            return 2
+        return 3               # composition only
+
+    @staticmethod
+    def _dedupe(ranked, limit):
+        # ranked: sorted (..., name_key, id, entry, scope) tuples; one entry per Drug.name_key
+        out, seen = [], set()
+        for row in ranked:
+            key, entry, scope = row[-4], row[-2], row[-1]
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append((entry, SCOPE_LABELS[scope]))
+            if len(out) >= limit:
+                break
+        return out
+
+    def search(self, term, doctor_id=None, hospital_id=None, limit=60, composition=False):
+        """
+        Drugs visible to this doctor/hospital whose name (and, with
+        composition=True, composition) contains `term`, best first,
+        de-duplicated by name. Returns [(DrugEntry, scope_label)].
+        """
+        q = normalize(term)
+        if not q:
+            return []
+        self._ensure_fresh()
+
+        ranking = doctor_ranking(doctor_id)
+        usage = ranking.scores if ranking else {}
+
+        short_key = None
+        if len(q) < 3:
+            short_key = (q, doctor_id, hospital_id, limit, composition, ranking and ranking.generation,
+                         self.fts and global_fts.check())
+            cached = self.short_results.get(short_key)
+            if cached is not None:
+                return cached
+
+        with self._lock:
+            t, short_results = self.tables, self.short_results
+            if len(q) < 3:
+                ids = self._prefix_ids(t, q)
+            else:
+                ids = self._name_ids(t, q)
+                if composition:
+                    ids |= self._composition_ids(t, q)
+
+            candidates = [t.entries[i] for i in ids]
+        if self.fts:
+            candidates += self._fts_matches(q, composition)
+
+        ranked = []
+        for entry in candidates:
+            scope = self._scope(entry, doctor_id, hospital_id)
+            if scope is None:
+                continue
+            rank = self._match_rank(entry, q)
+            score = usage.get(entry.name_key)
+            if score and rank < 3:
+                # the doctor's usual drugs first, by usage score
+                ranked.append((0, -score, scope, entry.name_key, entry.id, entry, scope))
+            else:
+                ranked.append((1, scope, rank, entry.name_key, entry.id, entry, scope))
+        ranked.sort()
+        out = self._dedupe(ranked, limit)
+
+        if short_key is not None:
+            if len(short_results) >= SHORT_TERM_CACHE_SIZE:
+                short_results.clear()
+            short_results[short_key] = out
+        return out
+
+    def fuzzy_search(self, term, doctor_id=None, hospital_id=None, limit=20, composition=True):
+        """
+        Typo-tolerant search: every word of `term` with four or more letters
+        may be up to two edits (or a phonetic match) away from a word of the
+        drug name or composition. Digits and short words must appear as
+        typed ("paracetmol 500" finds "Paracetamol 500Mg Tablet"). Best
+        total score first, then the doctor's usage, scope and name.
+        Returns [(DrugEntry, scope_label)].
+        """
+        q = normalize(term)
+        words = [w for w in _WORD_SPLIT.split(q) if w]
+        loose = fuzzy_words(q)
+        exact = [w for w in words if w not in loose]
+        if not loose:
+            return []
+        self._ensure_fresh()
+        ranking = doctor_ranking(doctor_id)
+        usage = ranking.scores if ranking else {}
+        fts_best = {w: self._fts_word_scores(w, composition) for w in loose} if self.fts else {}
+
+        with self._lock:
+            t = self.tables
+            scores = None                  # drug id -> summed word score
+            for word in loose:
+                best = dict(fts_best.get(word, ()))      # global drug ids (disjoint from t.entries)
+                for match, score in t.vocab.lookup(word).items():
+                    for i in t.name_words.get(match, ()):
+                        if score < best.get(i, NO_MATCH):
+                            best[i] = score
+                    if composition:
+                        comp_score = score + COMP_MATCH_PENALTY
+                        for comp_key in t.comp_words.get(match, ()):
+                            for i in t.comp_ids[comp_key]:
+                                if comp_score < best.get(i, NO_MATCH):
+                                    best[i] = comp_score
+                if scores is None:
+                    scores = best
+                else:
+                    scores = {i: s + best[i] for i, s in scores.items() if i in best}
+                if not scores:
+                    return []
+
+            entries = {i: t.entries[i] for i in scores if i in t.entries}
+        if len(entries) < len(scores):
+            entries.update(
+                (i, self._fts_entry(row)) for i, row in global_fts.entries(scores.keys() - entries.keys()).items()
+            )
+
+        ranked = []
+        for i, score in scores.items():
+            entry = entries[i]
+            if exact and not all(w in entry.key or w in entry.comp_key for w in exact):
+                continue
+            scope = self._scope(entry, doctor_id, hospital_id)
+            if scope is not None:
+                ranked.append((score, -usage.get(entry.name_key, 0), scope, entry.name_key, entry.id, entry, scope))
+        ranked.sort()
+        return self._dedupe(ranked, limit)
+
+    def closest(self, name, doctor_id=None, hospital_id=None, max_distance=2):
+        """The visible drug whose whole name is nearest `name` (within max_distance edits), or None."""
+        q = normalize(name)
+        best = None
+        for entry, scope in self.fuzzy_search(q, doctor_id, hospital_id, limit=10, composition=False):
+            d = edit_distance(q, entry.key, max_distance)
+            if d <= max_distance and (best is None or d < best[0]):
+                best = (d, entry)
+        return best[1] if best else None
+
+
+drug_index = DrugSearchIndex()
+
+
+def search_drugs(term, doctor=None, hospital=None, limit=60, composition=False, fuzzy=False):
+    search = drug_index.fuzzy_search if fuzzy else drug_index.search
+    return search(
+        term,
+        doctor_id=getattr(doctor, "id", None),
+        hospital_id=getattr(hospital, "id", None),
+        limit=limit,
+        composition=composition,
+    )
+
+
+def closest_drug(name, doctor=None, hospital=None, max_distance=2):
+    return drug_index.closest(
+        name,
+        doctor_id=getattr(doctor, "id", None),
+        hospital_id=getattr(hospital, "id", None),
+        max_distance=max_distance,
+    )
+
+
+def write_global_fts(path=None):
+    """Write the global drugs (scope "g") to the FTS file. Returns the count."""
+    version = drug_index_version() or 0     # before the rows: a change made meanwhile rewrites again
+    rows = (
+        Drug.objects.filter(scope_key=drug_scope_key()).order_by()
+        .values_list(*ENTRY_FIELDS).iterator(chunk_size=2000)
+    )
+    return build_fts_file(
+        (DrugSearchIndex._entry(row) for row in rows), path, meta={"catalog_version": version},
+    )
+
+
+def refresh_fts_file():
+    """
+    Rewrite the FTS file if global drugs changed since it was built.
+    Every worker notices; the first one writes and the others wait on
+    the lock, then find the file current.
+    """
+    if not fts_file_behind():
+        return
+    with build_lock(global_fts.path):
+        if fts_file_behind():
+            count = write_global_fts(global_fts.path)
+            logger.info("Drug FTS file rewritten after global drug changes: %s drugs", count)
+
+
+def warm_drug_index():
+    """Build the index now (worker start) instead of on the first keystroke."""
+    try:
+        return drug_index.build()
+    except Exception:
+        logger.exception("Drug search index warm-up failed; will build on first lookup")
+        return 0
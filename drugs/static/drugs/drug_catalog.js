@@ -0,0 +1,161 @@
+// static/drugs/drug_catalog.js
+// Local copy of the doctor's drug catalog (drugs.catalog) for autocomplete.
+//
+//   DrugCatalog.init({ url, deltaUrl, storageKey });
+//   DrugCatalog.search("amox", 20)  -> [] until loaded, then items shaped
+//                                      like drugs.views.drug_autocomplete
+//
+// The snapshot is kept in localStorage with its version; later page loads
+// only fetch /delta/?since=<version>. The server answers {"reset": true}
+// when the browser is too far behind, and we download the snapshot again.
+
+(function (window) {
+  'use strict';
+
+  const COLUMNS = ['id', 'name', 'composition', 'dosage', 'frequency', 'duration', 'scope'];
+  const SCOPE_LABELS = ['doctor', 'hospital', 'global'];
+
+  let opts = null;
+  let state = null;          // { version, byId: Map(id -> drug), selected: Set, usage: {} }
+  let list = [];             // drugs sorted by name, rebuilt after each sync
+
+  function normalize(s) {
+    return (s || '').toLowerCase().replace(/\s+/g, ' ').trim();
+  }
+
+  function rows(columns) {
+    const out = [];
+    const ids = columns.id || [];
+    for (let i = 0; i < ids.length; i++) {
+      const d = {};
+      COLUMNS.forEach(c => { d[c] = columns[c][i]; });
+      d.key = normalize(d.name);
+      d.compKey = normalize(d.composition);
+      out.push(d);
+    }
+    return out;
+  }
+
+  function rebuild() {
+    list = Array.from(state.byId.values()).sort((a, b) => (a.key < b.key ? -1 : a.key > b.key ? 1 : a.id - b.id));
+  }
+
+  function save() {
+    try {
+      localStorage.setItem(opts.storageKey, JSON.stringify({
+        version: state.version,
+        drugs: list.map(d => COLUMNS.map(c => d[c])),
+        selected: Array.from(state.selected),
+        usage: state.usage,
+      }));
+    } catch (e) {
+      // quota / private mode: keep it in memory only
+    }
+  }
+
+  function load() {
+    try {
+      const raw = JSON.parse(localStorage.getItem(opts.storageKey) || 'null');
+      if (!raw || typeof raw.version !== 'number') return false;
+      const columns = {};
+      COLUMNS.forEach((c, i) => { columns[c] = raw.drugs.map(r => r[i]); });
+      state = { version: raw.version, byId: new Map(), selected: new Set(raw.selected || []), usage: raw.usage || {} };
+      rows(columns).forEach(d => state.byId.set(d.id, d));
+      rebuild();
+      return true;
+    } catch (e) {
+      return false;
+    }
+  }
+
+  async function fetchSnapshot() {
+    const res = await fetch(opts.url, { credentials: 'same-origin' });
+    if (!res.ok) throw new Error('catalog ' + res.status);
+    const data = await res.json();
+    state = { version: data.version, byId: new Map(), selected: new Set(data.selected), usage: data.usage || {} };
+    rows(data.drugs).forEach(d => state.byId.set(d.id, d));
+    rebuild();
+    save();
+  }
+
+  async function fetchDelta() {
+    const res = await fetch(opts.deltaUrl + '?since=' + state.version, { credentials: 'same-origin' });
+    if (!res.ok) throw new Error('catalog delta ' + res.status);
+    const data = await res.json();
+    if (data.reset) return fetchSnapshot();
+    (data.removed || []).forEach(id => state.byId.delete(id));
+    rows(data.drugs).forEach(d => state.byId.set(d.id, d));
+    state.version = data.version;
+    state.selected = new Set(data.selected);
+    state.usage = data.usage || {};
+    rebuild();
+    save();
+  }
+
+  function init(options) {
+    opts = options;
+    const sync = load() ? fetchDelta() : fetchSnapshot();
+    DrugCatalog.loaded = sync.then(() => true).catch(err => {
+      console.warn('[drug-catalog] sync failed, using server search', err);
+      return Boolean(state);
+    });
+    return DrugCatalog.loaded;
+  }
+
+  function matchRank(d, q) {
+    if (d.key.startsWith(q)) return 0;
+    if (d.key.split(/[^a-z0-9]+/).some(w => w.startsWith(q))) return 1;
+    if (d.key.includes(q)) return 2;
+    if (d.compKey.includes(q)) return 3;
+    return -1;
+  }
+
+  // Same order as drugs.search: the doctor's usual drugs, then scope, match, name
+  function search(term, limit) {
+    const q = normalize(term);
+    if (!state || !q) return [];
+    limit = limit || 20;
+
+    const hits = [];
+    for (const d of list) {
+      const rank = matchRank(d, q);
+      if (rank >= 0) hits.push([d, rank, state.usage[d.id] || 0]);
+    }
+    hits.sort((a, b) => {
+      const ua = a[1] < 3 ? a[2] : 0, ub = b[1] < 3 ? b[2] : 0;
+      if (ua !== ub) return ub - ua;
+      if (a[0].scope !== b[0].scope) return a[0].scope - b[0].scope;
+      if (a[1] !== b[1]) return a[1] - b[1];
+      return a[0].key < b[0].key ? -1 : a[0].key > b[0].key ? 1 : a[0].id - b[0].id;
+    });
+
+    const out = [];
+    const seen = new Set();
+    for (const [d] of hits) {
+      if (seen.has(d.key)) continue;
+      seen.add(d.key);
+      out.push({
+        id: d.id,
+        label: d.name,
+        value: d.name,
+        composition: d.composition,
+        dosage: d.dosage,
+        frequency: d.frequency,
+        duration: d.duration,
+        scope: SCOPE_LABELS[d.scope],
+        selected: state.selected.has(d.id),
+      });
+      if (out.length >= limit) break;
+    }
+    return out;
+  }
+
+  const DrugCatalog = {
+    init,
+    search,
+    loaded: Promise.resolve(false),
+    get ready() { return Boolean(state); },
+    get version() { return state ? state.version : null; },
+  };
+  window.DrugCatalog = DrugCatalog;
+})(window);
@@ -1,3 +1,318 @@
-from django.test import TestCase
+import csv
+import os
+import shutil
+import tempfile
+from datetime import time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core.models import Hospital
+from doctors.models import Doctor
+from drugs.composition import composition_key, parse_composition
+from drugs.fuzzy import PHONETIC_SCORE, FuzzyVocabulary, edit_distance
+from drugs.ingredients import same_composition
+from drugs.pagination import decode_cursor, encode_cursor, keyset_page
+from drugs.catalog import catalog_version, delta, log_drug_changes, prune_drug_changes
+from drugs.models import Drug, DrugChange, drug_name_key
+from drugs.search import DrugSearchIndex, drug_index_version, fts_file_behind, refresh_fts_file
+
+
+class FuzzyMatchingTests(SimpleTestCase):
+    """drugs.fuzzy: OSL distance with its cutoff, and vocabulary removal."""
+
+    def test_adjacent_swap_is_one_edit(self):
+        self.assertEqual(edit_distance("paracetmaol", "paracetamol"), 1)
+        # optimal string alignment: a swapped pair is not edited again
+        self.assertEqual(edit_distance("ca", "abc"), 3)
+
+    def test_limit_cuts_off_at_limit_plus_one(self):
+        self.assertEqual(edit_distance("kitten", "sitting", limit=3), 3)       # within: exact
+        self.assertEqual(edit_distance("abcdef", "ghijkl", limit=2), 3)
+        self.assertEqual(edit_distance("ab", "abcdef"), 4)
+        self.assertEqual(edit_distance("ab", "abcdef", limit=2), 3)            # length gap alone
+
+    def test_discard_drops_edit_and_phonetic_matches(self):
+        vocab = FuzzyVocabulary()
+        vocab.add("phenylephrine")
+        vocab.add("paracetamol")
+        self.assertEqual(vocab.lookup("fenylefrin"), {"phenylephrine": PHONETIC_SCORE})
+
+        vocab.discard("phenylephrine")
+        self.assertEqual(vocab.lookup("fenylefrin"), {})
+        self.assertEqual(vocab.lookup("phenylephrin"), {})
+        self.assertEqual(vocab.lookup("paracetmaol"), {"paracetamol": 1})
+
+        vocab.add("phenylephrine")                 # stale delete variants don't double it
+        self.assertEqual(vocab.lookup("phenylephrin"), {"phenylephrine": 1})
+
+
+class ParseCompositionTests(SimpleTestCase):
+    """drugs.composition: the free-text forms found in the imported catalog."""
+
+    def test_percent_strength_in_parentheses(self):
+        self.assertEqual(
+            parse_composition("Mometasone (0.1% w/w) + Terbinafine (1% w/w)"),
+            [("mometasone", "0.1%w/w"), ("terbinafine", "1%w/w")],
+        )
+
+    def test_trailing_strength(self):
+        self.assertEqual(
+            parse_composition("Paracetamol 500mg, Caffeine 30 mg"),
+            [("paracetamol", "500mg"), ("caffeine", "30mg")],
+        )
+
+    def test_aliases_and_parenthesised_abbreviations(self):
+        self.assertEqual(
+            parse_composition("Amoxycillin (250mg) + Potassium Clavulanate (125mg)"),
+            [("amoxicillin", "250mg"), ("clavulanic acid", "125mg")],
+        )
+        self.assertEqual(parse_composition("Chorionic Gonadotropin (hCG) 5000 IU"),
+                         [("chorionic gonadotropin", "5000iu")])
+        self.assertEqual(composition_key("Acetaminophen 500mg"), composition_key("Paracetamol (500 mg)"))
+        self.assertEqual(parse_composition(None), [])
+
+
+class ImportDrugsUpdateTests(TestCase):
+    """manage.py import_drugs --update must be a no-op on an unchanged file."""
+
+    ROWS = [
+        {"drug_name": "Dolo 650 Tablet", "composition": "Paracetamol 650mg"},
+        {"drug_name": "DOLO-650  tablet", "composition": "Paracetamol (650mg)"},   # same name_key
+        {"drug_name": "Azithral 500 Tablet", "composition": "Azithromycin 500mg"},
+        {"drug_name": "azithral 500 tablet", "composition": "Azithromycin (500mg)"},
+    ]
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["drug_name", "composition"])
+            writer.writeheader()
+            writer.writerows(self.ROWS)
+        self.addCleanup(os.remove, self.path)
+
+    def run_import(self):
+        out = StringIO()
+        call_command("import_drugs", csv=self.path, update=True, stdout=out)
+        return out.getvalue()
+
+    def test_first_duplicate_row_wins(self):
+        out = self.run_import()
+        self.assertIn("Imported: 2", out)
+        self.assertIn("2 duplicate names skipped", out)
+        self.assertEqual(
+            sorted(Drug.objects.values_list("composition", flat=True)),
+            ["Azithromycin 500mg", "Paracetamol 650mg"],
+        )
+
+    def test_rerun_changes_nothing(self):
+        self.run_import()
+        changes = DrugChange.objects.count()
+
+        for _ in range(2):
+            out = self.run_import()
+            self.assertIn("Imported: 0", out)
+            self.assertIn("Updated:  0", out)
+        self.assertEqual(DrugChange.objects.count(), changes)   # no catalog deltas for browsers
+
+    def test_update_applies_a_real_change(self):
+        self.run_import()
+        self.ROWS = [dict(r) for r in self.ROWS]
+        self.ROWS[0]["composition"] = "Paracetamol 650mg + Caffeine"
+        self.setUp()
+
+        out = self.run_import()
+        self.assertIn("Updated:  1", out)
+        self.assertTrue(Drug.objects.filter(composition="Paracetamol 650mg + caffeine").exists())
+
+
+class LegacyDuplicateDrugTests(TestCase):
+    """Duplicates that migration 0009 keyed "<key>#<id>" can still be edited."""
+
+    def setUp(self):
+        self.first = Drug.objects.create(drug_name="Dolo 650 Tablet")
+        self.twin = Drug.objects.create(drug_name="Dolo 650 Syrup")
+        # as populate_keys left it: same scope and name as the first row
+        Drug.objects.filter(pk=self.twin.pk).update(
+            drug_name="Dolo 650 Tablet", name_key=f"dolo 650 tablet#{self.twin.pk}",
+        )
+        self.twin.refresh_from_db()
+
+    def test_edit_keeps_the_suffixed_key(self):
+        self.twin.composition = "Paracetamol 650mg"
+        self.twin.save()
+        self.twin.refresh_from_db()
+        self.assertEqual(self.twin.name_key, f"dolo 650 tablet#{self.twin.pk}")
+
+    def test_rename_gets_a_plain_key(self):
+        self.twin.drug_name = "Dolo 500 Tablet"
+        self.twin.save()
+        self.assertEqual(self.twin.name_key, "dolo 500 tablet")
+
+    def test_new_duplicate_is_still_refused(self):
+        with self.assertRaises(ValueError):
+            Drug.objects.create(drug_name="DOLO-650 tablet")
+
+
+class DrugSearchIndexFreshnessTests(TestCase):
+    """A change made by another process (no signal here) reaches the index without a shared cache."""
+
+    def other_process_adds(self, name):
+        drug = Drug(drug_name=name, composition="Cetirizine 10mg", name_key=drug_name_key(name))
+        Drug.objects.bulk_create([drug])           # skips this process' signals
+        log_drug_changes([drug])
+
+    def names(self, index, term):
+        return [entry.drug_name for entry, _scope in index.search(term)]
+
+    def test_new_drug_moves_the_version(self):
+        before = drug_index_version()
+        self.other_process_adds("Okacet Tablet")
+        self.assertGreater(drug_index_version(), before)
+
+    def test_stale_index_rebuilds_off_the_request(self):
+        index = DrugSearchIndex()
+        index.build()
+        self.other_process_adds("Okacet Tablet")
+        index._checked_at = 0
+
+        with mock.patch.object(index, "_rebuild_in_background") as rebuild:
+            self.assertEqual(self.names(index, "okacet"), [])      # old index answers meanwhile
+        rebuild.assert_called_once_with()
+
+        index.build()                # what the background thread runs
+        self.assertEqual(self.names(index, "okacet"), ["Okacet Tablet"])
+        self.assertEqual(index.version, drug_index_version())
+
+
+class DrugFTSFileRefreshTests(TestCase):
+    """fts5 backend: a global drug edited after build_drug_fts gets the file rewritten."""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        settings_override = override_settings(
+            DRUG_SEARCH_BACKEND="fts5", DRUG_SEARCH_FTS_PATH=os.path.join(tmp, "drugs.sqlite3"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        log_drug_changes([Drug.objects.create(drug_name="Dolo 650 Tablet")])
+        call_command("build_drug_fts", stdout=StringIO())
+
+    def test_admin_edit_rewrites_the_file(self):
+        index = DrugSearchIndex()
+        index.build()
+        self.assertTrue(index.fts)
+        self.assertFalse(fts_file_behind())
+
+        log_drug_changes([Drug.objects.create(drug_name="Okacet Tablet")])   # admin save
+        self.assertTrue(fts_file_behind())
+        index.version = drug_index_version()     # only the file is behind
+        self.assertTrue(index._stale(index._built_at))
+
+        refresh_fts_file()                 # what the background rebuild runs first
+        self.assertFalse(fts_file_behind())
+        index.build()
+        self.assertEqual([e.drug_name for e, _scope in index.search("okacet")], ["Okacet Tablet"])
+
+    def test_hospital_drugs_leave_the_file_alone(self):
+        hospital = Hospital.objects.create(
+            hospital_name="FTS Test", phone_num="9990004444", email="fts@test.local", name="fts",
+        )
+        log_drug_changes([Drug.objects.create(drug_name="Okacet Tablet", hospital=hospital)])
+        self.assertFalse(fts_file_behind())
+
+
+class DrugVisibilityTests(TestCase):
+    """Another doctor's own drug stays private even inside the same hospital."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(
+            hospital_name="Scope Test", phone_num="9990003333", email="scope@test.local", name="scope",
+        )
+        cls.doctor, cls.colleague = (
+            Doctor.objects.create(
+                doctor_name=name, doc_mobile_num=mobile, average_time_minutes=10, fees=100,
+                hospital=cls.hospital, start_time=time(9, 0),
+            )
+            for name, mobile in (("Dr Own", "9800000300"), ("Dr Colleague", "9800000301"))
+        )
+        cls.shared = Drug.objects.create(
+            drug_name="Okacet Tablet", composition="Cetirizine 10mg", hospital=cls.hospital,
+        )
+        cls.private = Drug.objects.create(
+            drug_name="Okacet Cold Tablet", composition="Cetirizine 10mg",
+            hospital=cls.hospital, added_by_doctor=cls.colleague,
+        )
+
+    def test_search_hides_a_colleagues_drug(self):
+        index = DrugSearchIndex()
+        index.build()
+        names = [e.drug_name for e, _scope in index.search("okacet", self.doctor.pk, self.hospital.pk)]
+        self.assertEqual(names, ["Okacet Tablet"])
+        names = [e.drug_name for e, _scope in index.search("okacet", self.colleague.pk, self.hospital.pk)]
+        self.assertCountEqual(names, ["Okacet Tablet", "Okacet Cold Tablet"])
+
+    def test_same_composition_hides_a_colleagues_drug(self):
+        found = same_composition(composition="Cetirizine 10mg", doctor=self.doctor, hospital=self.hospital)
+        self.assertEqual([d.pk for d in found], [self.shared.pk])
+
+
+class KeysetPageTests(TestCase):
+    """drugs.pagination: cursors that point before page one or can't be read."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.drugs = [Drug.objects.create(drug_name=f"Drug {c} Tablet") for c in "ABCDE"]
+
+    def page(self, **kwargs):
+        page = keyset_page(Drug.objects.all(), per_page=2, **kwargs)
+        return [d.pk for d in page], page
+
+    def test_before_cursor_back_to_page_one(self):
+        ids, page = self.page(before=encode_cursor(self.drugs[2]), number=2)
+        self.assertEqual(ids, [self.drugs[0].pk, self.drugs[1].pk])
+        self.assertEqual(page.number, 1)
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_before_the_first_row_shows_page_one(self):
+        ids, page = self.page(before=encode_cursor(self.drugs[0]), number=3)
+        self.assertEqual(ids, [self.drugs[0].pk, self.drugs[1].pk])
+        self.assertEqual((page.number, page.previous_cursor), (1, ""))
+
+    def test_garbled_cursors_are_ignored(self):
+        for value in ("%%%", "bm90IGpzb24", encode_cursor(self.drugs[0])[:-3], "WyJhIl0"):   # WyJhIl0 = ["a"]
+            self.assertIsNone(decode_cursor(value), value)
+            ids, page = self.page(after=value, number=4)
+            self.assertEqual((ids, page.number), ([self.drugs[0].pk, self.drugs[1].pk], 1))
+        self.assertEqual(decode_cursor(encode_cursor(self.drugs[3])), ("Drug D Tablet", self.drugs[3].pk))
+
+
+class DrugChangePruningTests(TestCase):
+    """Old DrugChange rows are pruned; browsers that were further behind get a reset."""
+
+    def setUp(self):
+        drugs = [Drug.objects.create(drug_name=f"Drug {i} Tablet") for i in range(4)]
+        log_drug_changes(drugs)                    # the signal logs on commit, which TestCase skips
+        DrugChange.objects.update(changed_at=timezone.now() - timedelta(days=60))
+        self.first, *_, self.last = DrugChange.objects.order_by("id")
+
+    def test_prune_keeps_the_newest_row(self):
+        removed = prune_drug_changes(timezone.now() - timedelta(days=30))
+        self.assertEqual(removed, 3)
+        self.assertEqual(list(DrugChange.objects.values_list("id", flat=True)), [self.last.id])
+        self.assertEqual(catalog_version(), self.last.id)
+
+    def test_delta_resets_when_changes_were_pruned(self):
+        since = self.first.id
+        self.assertFalse(delta(None, None, since)["reset"])
+
+        prune_drug_changes(timezone.now() - timedelta(days=30))
+        self.assertTrue(delta(None, None, since)["reset"])
+        self.assertFalse(delta(None, None, self.last.id - 1)["reset"])    # nothing it needs is gone
+        self.assertFalse(delta(None, None, self.last.id)["reset"])
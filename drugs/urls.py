@@ -1,9 +1,14 @@
 from django.urls import path
-from .views import drug_autocomplete, drug_library, drug_templates,lib_add_drug
+from .views import drug_autocomplete, drug_library, drug_templates,lib_add_drug, drugs_by_ingredient
+from .views import notes_autocomplete, drug_catalog, drug_catalog_delta
 from .views import drug_library_edit,add_drug_template, view_drug_template,delete_drug_template
 
 urlpatterns = [
     path("api/autocomplete/", drug_autocomplete, name="drug_autocomplete"),
+    path("api/by-ingredient/", drugs_by_ingredient, name="drugs_by_ingredient"),
+    path("api/notes-autocomplete/", notes_autocomplete, name="notes_autocomplete"),
+    path("api/catalog/", drug_catalog, name="drug_catalog"),
+    path("api/catalog/delta/", drug_catalog_delta, name="drug_catalog_delta"),
     path('library/', drug_library, name='drug_library'),
     path('add/', lib_add_drug, name='lib_add_drug'),
     path('library/edit/', drug_library_edit, name='drug_library_edit'),
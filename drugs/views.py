@@ -22,6 +22,14 @@ from django.db import transaction
 from drugs.forms import DrugTemplateForm
 from django.shortcuts import render, redirect, get_object_or_404
 from django.db.models import IntegerField
+from drugs.search import search_drugs
+from drugs.ingredients import brands_containing
+from drugs.presets import clear_user_presets, note_suggestions
+from drugs.pagination import cached_count, keyset_page
+from drugs.catalog import catalog_etag, delta, snapshot
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import etag
 
 
 @require_GET
@@ -36,27 +44,17 @@ def drug_autocomplete(request):
     doctor   = getattr(user, 'doctor', None) or getattr(user, 'doctor_profile', None)
     hospital = getattr(user, 'hospital', None)
 
-    qs = (
-        Drug.objects
-        .filter(drug_name__icontains=term)
-        .annotate(
-            priority=Case(
-                When(added_by_doctor=doctor, then=Value(0)),   # doctor-specific first
-                When(hospital=hospital, then=Value(1)),         # hospital next
-                default=Value(2),                               # global last
-                output_field=IntegerField(),
-            )
-        )
-        .order_by('priority', 'drug_name')[:60]
-    )
-
-    # De-dupe by normalized name across scopes
-    out, seen = [], set()
-    for d in qs:
-        key = (d.drug_name or '').strip().lower()
-        if key in seen:
-            continue
-        seen.add(key)
+    # In-memory index: doctor-specific first, then hospital, then global;
+    # already de-duplicated by normalized name across scopes.
+    # ?mode=fuzzy tolerates typos; a plain search with no hits falls back to it.
+    fuzzy = request.GET.get('mode') == 'fuzzy'
+    matches = search_drugs(term, doctor=doctor, hospital=hospital, limit=60, fuzzy=fuzzy)
+    if not matches and not fuzzy:
+        fuzzy = True
+        matches = search_drugs(term, doctor=doctor, hospital=hospital, limit=60, fuzzy=True)
+
+    out = []
+    for d, scope in matches:
         out.append({
             "id": d.id,
             "label": d.drug_name,     # jQuery UI needs label/value
@@ -65,15 +63,88 @@ def drug_autocomplete(request):
             "dosage": d.dosage or "",
             "frequency": d.frequency or "",
             "duration": d.duration or "",
-            "scope": (
-                "doctor" if d.added_by_doctor_id == getattr(doctor, 'id', None)
-                else ("hospital" if d.hospital_id == getattr(hospital, 'id', None) else "global")
-            ),
+            "scope": scope,
+            "fuzzy": fuzzy,
         })
 
     return JsonResponse(out, safe=False)
 
 
+@require_GET
+@login_required
+def drugs_by_ingredient(request):
+    """
+    Brands containing a salt: ?q=amoxicillin[&strength=500mg].
+    Answered from the DrugIngredient (ingredient, strength) index.
+    """
+    term = (request.GET.get('q') or request.GET.get('term') or '').strip()
+    if not term:
+        return JsonResponse({"ingredients": [], "results": []})
+
+    user     = request.user
+    doctor   = getattr(user, 'doctor', None) or getattr(user, 'doctor_profile', None)
+    hospital = getattr(user, 'hospital', None)
+
+    ingredients, links = brands_containing(
+        term, strength=request.GET.get('strength'), doctor=doctor, hospital=hospital,
+    )
+    out, seen = [], set()
+    for link in links:
+        d = link.drug
+        if d.id in seen:
+            continue
+        seen.add(d.id)
+        out.append({
+            "id": d.id,
+            "drug_name": d.drug_name,
+            "composition": d.composition or "",
+            "manufacturer": d.manufacturer or "",
+            "ingredient": link.ingredient.name,
+            "strength": link.strength,
+        })
+
+    return JsonResponse({"ingredients": [i.name for i in ingredients], "results": out})
+
+
+def _catalog_owner(request):
+    user = request.user
+    doctor = getattr(user, 'doctor', None) or getattr(user, 'doctor_profile', None)
+    return doctor, getattr(user, 'hospital', None)
+
+
+def _catalog_etag(request):
+    return catalog_etag(*_catalog_owner(request))
+
+
+_COMPACT_JSON = {"separators": (",", ":"), "ensure_ascii": False}
+
+
+@require_GET
+@login_required
+@cache_control(private=True, no_cache=True)
+@gzip_page
+@etag(_catalog_etag)
+def drug_catalog(request):
+    """
+    Full drug catalog for browser-side search (drugs.catalog.snapshot):
+    columnar JSON, gzipped, 304 when the browser's ETag is current.
+    """
+    return JsonResponse(snapshot(*_catalog_owner(request)), json_dumps_params=_COMPACT_JSON)
+
+
+@require_GET
+@login_required
+@cache_control(private=True, no_cache=True)
+@gzip_page
+def drug_catalog_delta(request):
+    """Changes since ?since=<version>; {"reset": true} means fetch the full catalog again."""
+    try:
+        since = int(request.GET.get('since', ''))
+    except ValueError:
+        return JsonResponse({"error": "since must be a catalog version"}, status=400)
+    return JsonResponse(delta(*_catalog_owner(request), since), json_dumps_params=_COMPACT_JSON)
+
+
 # ✅ Drug autocomplete (used by drug name field)
 @require_GET
 @login_required
@@ -84,25 +155,9 @@ def notes_autocomplete(request):
     if not field or field not in PRESETS:
         return JsonResponse([], safe=False)
 
-    presets_default = PRESETS[field]
-
-    # 1. User-defined presets
-    user_presets = list(UserPreset.objects.filter(
-        user=request.user, field_name=field
-    ).values_list("value", flat=True))
-
-    # 2. Frequently used values (hospital-specific)
-    used_values = list(PrescriptionDetails.objects.filter(
-        prescription__hospital=request.user.hospital
-    ).exclude(**{field: None}).values(field).annotate(
-        count=Count(field)
-    ).order_by('-count').values_list(field, flat=True)[:10])
-
-    # 3. Combine without duplicates
-    combined = user_presets + [v for v in presets_default if v not in user_presets] + \
-               [v for v in used_values if v not in user_presets and v not in presets_default]
-
-    filtered = [val for val in combined if term in val.lower()][:10]
+    # User presets + PRESETS + hospital's most used values (NoteValueCount rollup),
+    # all from the per-process cache in drugs.presets
+    filtered = note_suggestions(request.user, field, term)
 
     # ✅ Final payload with 'field'
     results = [{"label": val, "value": val, "field": field} for val in filtered]
@@ -124,6 +179,7 @@ def save_user_preset(request):
                 UserPreset.objects.get_or_create(
                     user=request.user, field_name=field, value=value
                 )
+                clear_user_presets(request.user.pk)
                 return JsonResponse({"message": "Preset saved!"})
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=400)
@@ -153,6 +209,50 @@ def drug_templates(request):
 
 
 
+def _library_drugs(doctor, query, show_global, show_hospital, show_doctor):
+    """Drugs for the library pages (no ordering / annotations: drugs.pagination adds those)."""
+    filters = Q()
+    if show_global:
+        filters |= Q(hospital__isnull=True, added_by_doctor__isnull=True)
+    if show_hospital:
+        filters |= Q(hospital=doctor.hospital, added_by_doctor__isnull=True)
+    if show_doctor:
+        filters |= Q(added_by_doctor=doctor)
+    if not filters:
+        return Drug.objects.none()
+
+    drugs_qs = Drug.objects.filter(filters)
+    if query:
+        drugs_qs = drugs_qs.filter(drug_name__icontains=query)
+    return drugs_qs
+
+
+def _library_page(request, drugs_qs, doctor, *filter_key):
+    """Keyset page (?after= / ?before= cursors) with a cached total and the 'Added By' label."""
+    try:
+        number = int(request.GET.get('page') or 1)
+    except ValueError:
+        number = 1
+    count = cached_count(drugs_qs, doctor.id, doctor.hospital_id, *filter_key)
+    drugs = keyset_page(
+        drugs_qs,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        number=number,
+        count=count,
+    )
+    for drug in drugs:
+        if drug.added_by_doctor_id == doctor.id:
+            drug.added_by = 'Doctor'
+        elif drug.added_by_doctor_id is None and drug.hospital_id == doctor.hospital_id:
+            drug.added_by = 'Hospital'
+        elif drug.added_by_doctor_id is None and drug.hospital_id is None:
+            drug.added_by = 'Global'
+        else:
+            drug.added_by = 'Unknown'
+    return drugs
+
+
 @doctor_required
 @login_required
 def drug_library(request):
@@ -175,41 +275,11 @@ def drug_library(request):
         show_doctor = show_doctor == '1'
 
     if not doctor:
-        drugs_qs = Drug.objects.none()
+        drugs = []
     else:
-        filters = Q()
-        if show_global:
-            filters |= Q(hospital__isnull=True, added_by_doctor__isnull=True)
-        if show_hospital:
-            filters |= Q(hospital=doctor.hospital, added_by_doctor__isnull=True)
-        if show_doctor:
-            filters |= Q(added_by_doctor=doctor)
-
-        drugs_qs = Drug.objects.filter(filters)
-
-        if query:
-            drugs_qs = drugs_qs.filter(drug_name__icontains=query)
-
-        drugs_qs = drugs_qs.annotate(
-            added_by=Case(
-                When(added_by_doctor=doctor, then=Value('Doctor')),
-                When(hospital=doctor.hospital, added_by_doctor__isnull=True, then=Value('Hospital')),
-                When(hospital__isnull=True, added_by_doctor__isnull=True, then=Value('Global')),
-                default=Value('Unknown'),
-                output_field=CharField(),
-            )
-        ).order_by('drug_name')
-
-    # Pagination: 50 drugs per page
-    paginator = Paginator(drugs_qs, 50)
-    page = request.GET.get('page')
-
-    try:
-        drugs = paginator.page(page)
-    except PageNotAnInteger:
-        drugs = paginator.page(1)
-    except EmptyPage:
-        drugs = paginator.page(paginator.num_pages)
+        # Keyset pagination on (drug_name, id): 50 drugs per page, any depth
+        drugs_qs = _library_drugs(doctor, query, show_global, show_hospital, show_doctor)
+        drugs = _library_page(request, drugs_qs, doctor, query, show_global, show_hospital, show_doctor)
 
     context = {
         'drugs': drugs,
@@ -235,7 +305,13 @@ def drug_library_edit(request):
         selected_drug_ids = request.POST.getlist('selected_drugs')
         selected_drug_ids = list(map(int, selected_drug_ids)) if selected_drug_ids else []
 
-        DoctorDrug.objects.filter(doctor=doctor).exclude(drug_id__in=selected_drug_ids).delete()
+        # Only the drugs shown on the submitted page can be un-ticked;
+        # selections on other pages stay as they are.
+        shown_ids = [int(i) for i in request.POST.getlist('page_drugs') if i.isdigit()]
+        unselected = DoctorDrug.objects.filter(doctor=doctor).exclude(drug_id__in=selected_drug_ids)
+        if shown_ids:
+            unselected = unselected.filter(drug_id__in=shown_ids)
+        unselected.delete()
 
         existing_ids = set(DoctorDrug.objects.filter(doctor=doctor).values_list('drug_id', flat=True))
         new_ids = set(selected_drug_ids) - existing_ids
@@ -253,40 +329,15 @@ def drug_library_edit(request):
     show_hospital = True if show_hospital is None else show_hospital == '1'
     show_doctor = True if show_doctor is None else show_doctor == '1'
 
-    filters = Q()
-    if show_global:
-        filters |= Q(hospital__isnull=True, added_by_doctor__isnull=True)
-    if show_hospital:
-        filters |= Q(hospital=doctor.hospital, added_by_doctor__isnull=True)
-    if show_doctor:
-        filters |= Q(added_by_doctor=doctor)
-
-    drugs_qs = Drug.objects.filter(filters)
-    if query:
-        drugs_qs = drugs_qs.filter(drug_name__icontains=query)
+    drugs_qs = _library_drugs(doctor, query, show_global, show_hospital, show_doctor)
+    drugs = _library_page(request, drugs_qs, doctor, query, show_global, show_hospital, show_doctor)
 
-    selected_qs = DoctorDrug.objects.filter(doctor=doctor, drug=OuterRef('pk'))
-
-    drugs_qs = drugs_qs.annotate(
-        is_selected=Exists(selected_qs),
-        added_by=Case(
-            When(added_by_doctor=doctor, then=Value('Doctor')),
-            When(hospital=doctor.hospital, added_by_doctor__isnull=True, then=Value('Hospital')),
-            When(hospital__isnull=True, added_by_doctor__isnull=True, then=Value('Global')),
-            default=Value('Unknown'),
-            output_field=CharField(),
-        )
-    ).order_by('drug_name')
-
-    # Pagination
-    paginator = Paginator(drugs_qs, 50)  # 50 per page
-    page = request.GET.get('page')
-    try:
-        drugs = paginator.page(page)
-    except PageNotAnInteger:
-        drugs = paginator.page(1)
-    except EmptyPage:
-        drugs = paginator.page(paginator.num_pages)
+    # One IN query for the page instead of an EXISTS per row
+    selected = set(DoctorDrug.objects.filter(
+        doctor=doctor, drug_id__in=[d.id for d in drugs]
+    ).values_list('drug_id', flat=True))
+    for drug in drugs:
+        drug.is_selected = drug.id in selected
 
     context = {
         'drugs': drugs,
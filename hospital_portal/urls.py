@@ -2,7 +2,7 @@ from django.urls import path, re_path,include
 from django.shortcuts import redirect
 from core.models import Hospital
 from core.views import CustomLoginView
-from queue_mgt.views import queue_display
+from queue_mgt.views import queue_display, queue_display_stream
 from patients.views import register_patient_view   # ✅ import your hybrid register view
 from . import views
 
@@ -28,6 +28,7 @@ urlpatterns = [
 
     # 🧾 Patient self-registration (kiosk / QR)
     path("<slug:slug>/display/", queue_display, name="hospital_display"),
+    path("<slug:slug>/display/stream/", queue_display_stream, name="hospital_display_stream"),
 
     # 🖥️ Queue display (public)
     path("<slug:slug>/self_register/", views.self_register_view, name="hospital_self_register"),
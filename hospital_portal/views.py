@@ -15,7 +15,8 @@ from appointments.forms import AppointmentForm
 from core.models import Hospital
 from patients.forms import PatientRegistrationForm
 from patients.utils import generate_token_string
-from appointments.utils import get_registration_queue_position
+from appointments.utils import allocate_registration_position
+from queue_mgt.events import bump_queue_version, get_queue_snapshot, queue_etag, not_modified, set_etag
 from utils.eta_calculator import predict_eta_for_registration
 from doctors.models import Doctor
 from datetime import datetime
@@ -134,12 +135,11 @@ def self_register_view(request, slug=None):
                     appt_obj.token_num = generate_token_string()
 
                     # Compute queue position
-                    pos_data = get_registration_queue_position(
+                    appt_obj.que_pos = allocate_registration_position(
                         doctor=appt_obj.doctor,
                         date=appt_obj.appointment_on,
                         hospital=hospital,
                     )
-                    appt_obj.que_pos = pos_data["next_pos"]
 
                     # Compute ETA using standard function
                     appt_obj.eta = calculate_eta_time(
@@ -147,11 +147,13 @@ def self_register_view(request, slug=None):
                         appt_obj.doctor.average_time_minutes,
                         appt_obj.que_pos,
                         appointment_on=appt_obj.appointment_on,
+                        doctor=appt_obj.doctor,
                     )
                     appt_obj.completed = AppointmentDetails.STATUS_REGISTERED
                     appt_obj.save()
 
                 # ✅ Commit successful
+                bump_queue_version(hospital, appt_obj.appointment_on)
                 messages.success(request, "✅ Patient registration completed successfully.")
                 if is_public:
                     return redirect(f"/h/{hospital.slug}/display/")
@@ -231,25 +233,33 @@ def doctor_info_api(request, doctor_id, slug=None):
         doctor = get_object_or_404(Doctor, id=doctor_id, hospital=hospital)
 
         today = date.today()
-        queued = AppointmentDetails.objects.filter(
-            doctor=doctor,
-            appointment_on=today,
-            completed=AppointmentDetails.STATUS_IN_QUEUE,  # 0
-            hospital=hospital
-        ).count()
+        version, rows = get_queue_snapshot(hospital, today)
+        queued = sum(
+            1 for r in rows
+            if r["doctor_id"] == doctor.id
+            and r["completed"] == AppointmentDetails.STATUS_IN_QUEUE  # 0
+        )
 
         eta = calculate_eta_time(
             doctor.start_time,
             doctor.average_time_minutes,
             queued + 1,  # next patient
-            appointment_on=today
+            appointment_on=today,
+            doctor=doctor,
         )
+        eta_str = eta.strftime("%H:%M") if eta else None
+
+        # ETA also moves with the clock, so it is part of the tag
+        etag = queue_etag(version, "doctor", doctor.id, eta_str)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
 
-        return JsonResponse({
+        return set_etag(JsonResponse({
             "doctor": doctor.doctor_name,
             "queued": queued,
-            "eta": eta.strftime("%H:%M") if eta else None
-        })
+            "eta": eta_str
+        }), etag)
 
     except Exception as e:
         import traceback, logging
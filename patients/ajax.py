@@ -5,6 +5,7 @@ from utils.eta_calculator import calculate_eta_time
 from appointments.utils import get_next_queue_position
 from doctors.models import Doctor
 from django.utils import timezone
+from queue_mgt.events import get_queue_snapshot, queue_etag, not_modified, set_etag
 import logging
 
 #patients/ajax.py
@@ -34,22 +35,22 @@ def get_eta_ajax(request):
 def get_queued_patients(request):
     doctor_id = request.GET.get("doctor_id")
     hospital = request.user.hospital  # ✅ use hospital from logged-in user
-    today = timezone.now().date()
+    today = date.today()
 
-    appointments = appointments.AppointmentDetails.objects.filter(
-        doctor_id=doctor_id,
-        hospital=hospital,
-        appointment_on=today,
-        completed__in=[0, None]
-    ).select_related('patient')
+    version, rows = get_queue_snapshot(hospital, today)
+    etag = queue_etag(version, "queued", doctor_id)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
 
     data = [
         {
-            'id': appt.id,
-            'patient_name': appt.patient.patient_name,
-            'token_num': appt.token_num,
+            'id': appt['appoint_id'],
+            'patient_name': appt['patient']['patient_name'],
+            'token_num': appt['token_num'],
         }
-        for appt in appointments
+        for appt in rows
+        if str(appt['doctor_id']) == str(doctor_id) and appt['completed'] in (0, None)
     ]
-    return JsonResponse(data, safe=False)
+    return set_etag(JsonResponse(data, safe=False), etag)
 
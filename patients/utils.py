@@ -76,7 +76,7 @@ def _compute_eta_preview(appointment_form, hospital, post_data=None):
             que_pos = pos_data["next_pos"]
             completed_count = pos_data["completed_count"]
             que_pos_for_eta = que_pos-completed_count
-            eta_t = calculate_eta_time(doc.start_time, doc.average_time_minutes, que_pos_for_eta, appointment_on=appt_date)
+            eta_t = calculate_eta_time(doc.start_time, doc.average_time_minutes, que_pos_for_eta, appointment_on=appt_date, doctor=doc)
             return eta_t if eta_t else None
 
         # Fallback: try to pull from incoming POST (when the form has errors elsewhere)
@@ -97,7 +97,7 @@ def _compute_eta_preview(appointment_form, hospital, post_data=None):
             que_pos = pos_data["next_pos"]
             completed_count = pos_data["completed_count"]
             que_pos_for_eta = que_pos-completed_count
-            eta_t = calculate_eta_time(doc.start_time, doc.average_time_minutes, que_pos_for_eta, appointment_on=appt_date)
+            eta_t = calculate_eta_time(doc.start_time, doc.average_time_minutes, que_pos_for_eta, appointment_on=appt_date, doctor=doc)
             return eta_t if eta_t else None
     except Exception as e:
         logger.debug("ETA preview computation skipped: %s", e)
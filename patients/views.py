@@ -14,13 +14,17 @@ from appointments.forms import AppointmentForm
 from billing.forms import PaymentTransactionForm
 from billing.models import PaymentTransaction, PaymentMaster
 from appointments.models import AppointmentDetails
+from appointments.history import (
+    doctor_patients_q, get_appointment_or_404, latest_doctor_names, patient_appointments,
+)
 from doctors.models import Doctor
 from patients.utils import generate_token_string
 from .utils import perform_patient_search
-from appointments.utils import get_next_queue_position, get_registration_queue_position
+from appointments.utils import get_next_queue_position, allocate_registration_position
+from queue_mgt.events import bump_queue_version
 from utils.eta_calculator import calculate_eta_time
 from .models import Patient
-from .utils import render_to_pdf
+from utils.pdf_cache import cached_pdf_response
 from django.http import JsonResponse, HttpResponse
 import logging
 from django.utils.timezone import now
@@ -28,7 +32,6 @@ import traceback
 from utils.form_validation import validate_or_report
 from django.core.exceptions import ValidationError
 from django.template.loader import get_template
-from weasyprint import HTML
 from decimal import Decimal, ROUND_HALF_UP
 from core.utils.policies import get_consultation_policy  # ⬅️ add this import
 from core.models import Hospital
@@ -105,17 +108,17 @@ def register_patient_view(request):
                     appt_obj.token_num = generate_token_string()
 
                     # Calculate queue position and ETA
-                    pos_data = get_registration_queue_position(
+                    appt_obj.que_pos = appt_obj.que_pos or allocate_registration_position(
                                     doctor=appt_obj.doctor,
                                     date=appt_obj.appointment_on,
                                     hospital=hospital
                                 )
-                    appt_obj.que_pos = appt_obj.que_pos or pos_data["next_pos"]
                     appt_obj.eta = calculate_eta_time(
                         appt_obj.doctor.start_time,
                         appt_obj.doctor.average_time_minutes,
                         appt_obj.que_pos,
-                        appointment_on=appt_obj.appointment_on
+                        appointment_on=appt_obj.appointment_on,
+                        doctor=appt_obj.doctor,
                     )
                     appt_obj.status = AppointmentDetails.STATUS_REGISTERED
                     appt_obj.save()
@@ -128,6 +131,7 @@ def register_patient_view(request):
                         pay.total_amount = final_total
                         pay.save(update_fields=["total_amount"])
 
+                bump_queue_version(hospital, appt_obj.appointment_on)
                 messages.success(request, "✅ Patient registration completed successfully.")
                 return redirect(reverse('patients:view', args=[patient.pk]))
 
@@ -241,6 +245,7 @@ def edit_patient_view(request, patient_id):
                     pay.total_amount = txn_obj.amount
                     pay.save(update_fields=['total_amount'])
 
+                bump_queue_version(hospital, appt_obj.appointment_on)
                 messages.success(request, "✅ Patient updated successfully.")
                 return redirect(reverse('patients:view', args=[patient.pk]))
 
@@ -284,12 +289,10 @@ def view_patient_view(request, patient_id):
     hospital = request.user.hospital
     patient  = get_object_or_404(Patient, pk=patient_id, hospital=hospital)
 
-    appointments = (AppointmentDetails.objects
-                    .filter(patient=patient, hospital=hospital)
-                    .select_related('doctor', 'payment')
-                    .order_by('-appointment_on', '-pk'))
+    # every visit, including days archive_closed_days has moved to history
+    appointments = patient_appointments(hospital, patient, related=('doctor', 'payment'))
     payments     = [appt.payment for appt in appointments if appt.payment]
-    latest_appt  = appointments.first()
+    latest_appt  = appointments[0] if appointments else None
 
     # --- Build vitals URLs (robust; won’t crash if route names change) ---
     vitals_new_url = None
@@ -298,7 +301,7 @@ def view_patient_view(request, patient_id):
         vitals_new_url = reverse("vitals:create_for_patient", kwargs={"patient_id": patient.pk})
     except NoReverseMatch:
         pass
-    if latest_appt:
+    if isinstance(latest_appt, AppointmentDetails):   # archived visits take no new vitals
         try:
             vitals_new_for_appt_url = reverse(
                 "vitals:create_for_appointment",
@@ -306,6 +309,8 @@ def view_patient_view(request, patient_id):
             )
         except NoReverseMatch:
             vitals_new_for_appt_url = vitals_new_url  # fallback to patient-scoped
+    elif latest_appt:
+        vitals_new_for_appt_url = vitals_new_url
 
     context = {
         'patient':          patient,
@@ -340,23 +345,8 @@ def patient_dashboard(request):
     doctor_obj = getattr(request.user, "doctor", None)
 
     if doctor_obj is not None:
-        patients = patients.filter(
-            appointmentdetails__doctor=doctor_obj
-        ).distinct()
-
-    # ============================================================
-    # Build latest doctor mapping
-    # ============================================================
-    appts = (
-        AppointmentDetails.objects.filter(hospital=hospital)
-        .order_by('patient_id', '-appointment_on')
-        .select_related('doctor')
-    )
-
-    latest_doctor = {}
-    for appt in appts:
-        if appt.patient_id not in latest_doctor:
-            latest_doctor[appt.patient_id] = appt.doctor.doctor_name
+        # hot and archived visits, so patients seen before the archive cutoff stay listed
+        patients = patients.filter(doctor_patients_q(doctor_obj.pk))
 
     # ============================================================
     # 🔍 Search logic
@@ -381,6 +371,11 @@ def patient_dashboard(request):
     # ============================================================
     patients = list(patients.order_by('-id')[:100])
 
+    # ============================================================
+    # Build latest doctor mapping (listed patients, hot + archive)
+    # ============================================================
+    latest_doctor = latest_doctor_names(hospital, [p.id for p in patients])
+
     if sort == 'doctor':
         patients.sort(key=lambda p: latest_doctor.get(p.id, '').lower())
     
@@ -438,12 +433,9 @@ def cash_receipt_pdf(request, appointment_id):
     Generate a PDF cash receipt for a given appointment.
     Updated for DOB-based patient model.
     """
-    appt = get_object_or_404(
-        AppointmentDetails.objects.select_related(
-            "hospital", "patient__contact", "doctor", "payment"
-        ),
-        pk=appointment_id,
-        hospital=request.user.hospital,
+    appt = get_appointment_or_404(
+        request.user.hospital, appointment_id,
+        related=("hospital", "patient__contact", "doctor", "payment"),
     )
 
     if not appt.payment:
@@ -512,14 +504,14 @@ def cash_receipt_pdf(request, appointment_id):
         "gender": gender,
     }
 
-    # --- Render PDF
+    # --- Render PDF (reprints come from the PDF cache)
     tpl = get_template("pdf_templates/cash_receipt.html")
     html_string = tpl.render(context, request=request)
-
-    pdf_bytes = HTML(string=html_string, base_url=request.build_absolute_uri("/")).write_pdf()
-    response = HttpResponse(pdf_bytes, content_type="application/pdf")
-    response["Content-Disposition"] = f'inline; filename="receipt_{appt.pk}.pdf"'
-    return response
+    response = cached_pdf_response(
+        request, html_string, f"receipt_{appt.pk}.pdf",
+        base_url=request.build_absolute_uri("/"), page_size=page_class,
+    )
+    return response or HttpResponse("Could not generate the receipt, please try again.", status=503)
 
 
 ALLOWED_SIZES   = {"A5", "A4", "Letter"}
@@ -531,12 +523,9 @@ def cash_receipt_preview(request, appointment_id):
     """
     Preview cash receipt for a given appointment (DOB-based patient info version).
     """
-    appt = get_object_or_404(
-        AppointmentDetails.objects.select_related(
-            "hospital", "patient__contact", "doctor", "payment"
-        ),
-        pk=appointment_id,
-        hospital=request.user.hospital,
+    appt = get_appointment_or_404(
+        request.user.hospital, appointment_id,
+        related=("hospital", "patient__contact", "doctor", "payment"),
     )
 
     # Toolbar inputs
@@ -630,10 +619,8 @@ def token_pdf(request, appointment_id):
     Generate printable token/slip PDF for an appointment.
     Updated for DOB-based patient model.
     """
-    appt = get_object_or_404(
-        AppointmentDetails.objects.select_related("hospital", "patient__contact", "doctor"),
-        pk=appointment_id,
-        hospital=request.user.hospital,
+    appt = get_appointment_or_404(
+        request.user.hospital, appointment_id, related=("hospital", "patient__contact", "doctor"),
     )
 
     fmt = request.GET.get("format", "slip").lower()
@@ -693,16 +680,12 @@ def token_pdf(request, appointment_id):
     "for_pdf": True,
 }
 
-    # ✅ Render PDF
-    pdf_bytes = render_to_pdf("pdf_templates/token_dynamic.html", context)
-    if not pdf_bytes:
-        return HttpResponse("Error generating token", status=500)
-
-    resp = HttpResponse(pdf_bytes, content_type="application/pdf")
-    resp["Content-Disposition"] = f'inline; filename="token_{appt.pk}.pdf"'
-    resp["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    resp["Pragma"] = "no-cache"
-    return resp
+    # ✅ Render PDF (reprints come from the PDF cache; the browser revalidates by ETag)
+    html = get_template("pdf_templates/token_dynamic.html").render(context)
+    resp = cached_pdf_response(
+        request, html, f"token_{appt.pk}.pdf", engine="xhtml2pdf", page_size=pagesize,
+    )
+    return resp or HttpResponse("Could not generate the token, please try again.", status=503)
 
 
 
@@ -714,10 +697,8 @@ ALLOWED_ORIENT = ["portrait", "landscape"]
 @login_required
 def token_preview(request, appointment_id):
     """HTML preview for token/slip generation (DOB-based patient info)."""
-    appt = get_object_or_404(
-        AppointmentDetails.objects.select_related("hospital", "patient__contact", "doctor"),
-        pk=appointment_id,
-        hospital=request.user.hospital,
+    appt = get_appointment_or_404(
+        request.user.hospital, appointment_id, related=("hospital", "patient__contact", "doctor"),
     )
 
     fmt = request.GET.get("format", "slip").lower()
@@ -845,12 +826,9 @@ ALLOWED_ORIENT = {"portrait", "landscape"}
 
 @login_required
 def combined_receipt_token_pdf(request, appointment_id):
-    appt = get_object_or_404(
-        AppointmentDetails.objects.select_related(
-            "hospital", "patient__contact", "doctor", "payment"
-        ),
-        pk=appointment_id,
-        hospital=request.user.hospital,
+    appt = get_appointment_or_404(
+        request.user.hospital, appointment_id,
+        related=("hospital", "patient__contact", "doctor", "payment"),
     )
 
     # --- Consultation policy (optional)
@@ -920,11 +898,11 @@ def combined_receipt_token_pdf(request, appointment_id):
     # --- Render and return PDF
     tpl = get_template("pdf_templates/combined_receipt_token.html")
     html = tpl.render(context, request=request)
-    pdf_bytes = HTML(string=html, base_url=request.build_absolute_uri("/")).write_pdf()
-
-    resp = HttpResponse(pdf_bytes, content_type="application/pdf")
-    resp["Content-Disposition"] = f'inline; filename="receipt_token_{appt.pk}.pdf"'
-    return resp
+    resp = cached_pdf_response(
+        request, html, f"receipt_token_{appt.pk}.pdf",
+        base_url=request.build_absolute_uri("/"), page_size=f"{pagesize} {orientation}",
+    )
+    return resp or HttpResponse("Could not generate the receipt, please try again.", status=503)
 
 
 
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_archive_history'),
+        ('core', '0010_alter_role_role_name'),
+        ('doctors', '0003_doctor_consult_message_template_and_more'),
+        ('prescription', '0008_alter_prescriptionmaster_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='prescriptiondraft',
+            name='appointment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='appointments.appointmentdetails'),
+        ),
+        migrations.AlterField(
+            model_name='prescriptionmaster',
+            name='appointment',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='Prescription is not strictly tied to an appointment', null=True, on_delete=django.db.models.deletion.SET_NULL, to='appointments.appointmentdetails'),
+        ),
+        migrations.CreateModel(
+            name='PrescriptionDraftHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('appointment_id', models.IntegerField(blank=True, db_index=True, null=True)),
+                ('current_step', models.CharField(max_length=50)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('ai_suggestions', models.JSONField(blank=True, default=dict)),
+                ('finalized', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField()),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='doctors.doctor')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'db_table': 'prescription_draft_history',
+            },
+        ),
+    ]
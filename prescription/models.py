@@ -19,8 +19,9 @@ class PrescriptionMaster(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
 
+    # db_constraint=False: archived appointments keep their id in appointment_details_history
     appointment = models.ForeignKey(AppointmentDetails,on_delete=models.SET_NULL,null=True,
-        blank=True,help_text="Prescription is not strictly tied to an appointment",)
+        blank=True,db_constraint=False,help_text="Prescription is not strictly tied to an appointment",)
 
     # Notes
     notes_history = models.TextField(blank=True)
@@ -102,7 +103,8 @@ class PrescriptionDraft(models.Model):
 
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
-    appointment = models.ForeignKey(AppointmentDetails, null=True, blank=True, on_delete=models.SET_NULL)
+    appointment = models.ForeignKey(AppointmentDetails, null=True, blank=True, on_delete=models.SET_NULL,
+                                    db_constraint=False)  # may point into appointment history
 
 
     # Current wizard step: 'history', 'symptoms', 'findings', 'diagnosis', 'prescription', 'review'
@@ -188,3 +190,23 @@ class PrescriptionLog(models.Model):
         return f"{self.action.upper()} by {self.changed_by} on {self.changed_at}"
 
 
+class PrescriptionDraftHistory(models.Model):
+    """Drafts moved out of prescription_draft by `manage.py archive_closed_days`."""
+    id = models.BigIntegerField(primary_key=True)
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    appointment_id = models.IntegerField(null=True, blank=True, db_index=True)  # hot or archived
+
+    current_step = models.CharField(max_length=50)
+    data = models.JSONField(default=dict, blank=True)
+    ai_suggestions = models.JSONField(default=dict, blank=True)
+    finalized = models.BooleanField(default=False)
+
+    updated_at = models.DateTimeField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "prescription_draft_history"
+
+    def __str__(self):
+        return f"Archived draft {self.id} for Appt {self.appointment_id}"
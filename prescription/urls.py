@@ -13,7 +13,7 @@ from .views_ai_wizard import (
     ai_finalize, ai_start, ai_review, ai_discard,ai_prescription,ai_copy_old_prescription,
     add_history_template, ai_prescription_manual,ai_prescription_print_builder
 )
-from .views_ajax import ajax_add_drug,drug_autocomplete
+from .views_ajax import ajax_add_drug,drug_autocomplete,drug_alternatives
 
 
 app_name = "prescription"
@@ -83,5 +83,6 @@ path("rx/print/<int:rx_id>/", ai_prescription_print_builder, name="ai_prescripti
 
 path("ajax/drug-autocomplete/", drug_autocomplete, name="drug_autocomplete"),
 path("ajax/add-drug/", ajax_add_drug, name="ajax_add_drug"),
+path("ajax/drug-alternatives/", drug_alternatives, name="drug_alternatives"),
 ]
 
@@ -14,8 +14,11 @@ from prescription.models import PrescriptionDraft, PrescriptionDetails, Prescrip
 from prescription.forms import PrescriptionMasterForm, ManualDetailFormSet
 from drugs.forms import DetailInlineFormSet
 from vitals.models import PatientVital
-from drugs.models import Drug, DrugTemplate, DrugTemplateItem,DoctorDrugUsage
+from drugs.models import Drug, DrugTemplate, DrugTemplateItem,DoctorDrugUsage, drug_name_key
+from drugs.ranking import bump_doctor_ranking
 from appointments.models import AppointmentDetails
+from appointments.history import attach_archived_appointments
+from queue_mgt.events import on_consultation_done
 
 from doctors.models import Doctor
 from core.models import Hospital
@@ -1146,13 +1149,19 @@ def ai_finalize(request, draft_id):
                 # -------- Learn doctor usage (Docon logic) --------
                 obj, _ = DoctorDrugUsage.objects.get_or_create(
                     doctor=doctor,
-                    drug_name=name
+                    drug_key=drug_name_key(name),
+                    defaults={"drug_name": name},
                 )
 
+                # .update() skips auto_now, so set last_used_on for the recency decay
                 DoctorDrugUsage.objects.filter(pk=obj.pk).update(
-                    usage_count=F("usage_count") + 1
+                    usage_count=F("usage_count") + 1,
+                    last_used_on=datetime.now(),
                 )
 
+            # Re-rank this doctor's autocomplete (drugs.ranking) once committed
+            transaction.on_commit(lambda: bump_doctor_ranking(doctor.id))
+
 
             # -------- Update appointment status --------
             
@@ -1164,6 +1173,11 @@ def ai_finalize(request, draft_id):
                 appointment.completed_at = datetime.now()
 
                 appointment.save(update_fields=["completed", "completed_at"])
+                transaction.on_commit(
+                    lambda: on_consultation_done(
+                        appointment.doctor, appointment.hospital, appointment.appointment_on
+                    )
+                )
 
             # -------- Finalize the draft --------
             draft.finalized = True
@@ -1300,6 +1314,7 @@ def ai_prescription_print_builder(request, rx_id):
         PrescriptionMaster.objects.select_related("doctor", "patient", "hospital", "appointment"),
         pk=rx_id,
     )
+    attach_archived_appointments([master])
 
     details = PrescriptionDetails.objects.filter(prescription=master)
 
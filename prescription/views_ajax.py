@@ -2,10 +2,11 @@
 from django.http import JsonResponse
 from django.views.decorators.http import require_GET, require_POST
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
 from django.utils.text import capfirst
 
 from drugs.models import Drug
+from drugs.ingredients import same_composition
+from drugs.search import search_drugs
 from doctors.models import Doctor
 
 
@@ -20,10 +21,14 @@ def drug_autocomplete(request):
     if not term:
         return JsonResponse([], safe=False)
 
-    qs = Drug.objects.filter(
-        Q(drug_name__icontains=term) |
-        Q(composition__icontains=term)
-    ).order_by("drug_name")[:20]
+    user = request.user
+    doctor = getattr(user, "doctor", None) or getattr(user, "doctor_profile", None)
+    hospital = getattr(user, "hospital", None)
+    fuzzy = request.GET.get("mode") == "fuzzy"
+    matches = search_drugs(term, doctor=doctor, hospital=hospital, limit=20, composition=True, fuzzy=fuzzy)
+    if not matches and not fuzzy:
+        # nothing as typed: try typo-tolerant ("paracetmol")
+        matches = search_drugs(term, doctor=doctor, hospital=hospital, limit=20, composition=True, fuzzy=True)
 
     results = [
         {
@@ -31,12 +36,48 @@ def drug_autocomplete(request):
             "value": d.drug_name,
             "composition": d.composition or "",
         }
-        for d in qs
+        for d, _scope in matches
     ]
 
     return JsonResponse(results, safe=False)
 
 
+# ---------------------------------------------------------
+# 🔁 1b) Same-composition alternatives (wizard drug rows)
+# ---------------------------------------------------------
+@login_required
+@require_GET
+def drug_alternatives(request):
+    """
+    ?drug_id=<id> or ?composition=<text>: other brands with exactly the
+    same salts and strengths (indexed Drug.composition_key lookup).
+    """
+    user = request.user
+    doctor = getattr(user, "doctor", None) or getattr(user, "doctor_profile", None)
+    hospital = getattr(user, "hospital", None)
+
+    drug = None
+    drug_id = request.GET.get("drug_id")
+    if drug_id and drug_id.isdigit():
+        drug = Drug.objects.filter(pk=drug_id).only("id", "composition_key").first()
+    composition = request.GET.get("composition", "").strip()
+    if drug is None and not composition:
+        return JsonResponse([], safe=False)
+
+    qs = same_composition(drug=drug, composition=composition, doctor=doctor, hospital=hospital)
+    results = [
+        {
+            "id": d.id,
+            "label": d.drug_name,
+            "value": d.drug_name,
+            "composition": d.composition or "",
+            "manufacturer": d.manufacturer or "",
+        }
+        for d in qs
+    ]
+    return JsonResponse(results, safe=False)
+
+
 # ---------------------------------------------------------
 # ➕ 2) Add new Drug (Manual Entry)
 # ---------------------------------------------------------
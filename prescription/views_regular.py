@@ -11,7 +11,9 @@ from django.urls import reverse
 from .forms import PrescriptionMasterForm, PrescriptionDetailForm
 from django.db import transaction
 from appointments.models import AppointmentDetails
-from datetime import date
+from appointments.history import attach_archived_appointments
+from queue_mgt.events import on_consultation_done
+from datetime import date, datetime
 import json
 from drugs.models import UserPreset, Drug
 from drugs.forms import DetailInlineFormSet
@@ -23,7 +25,9 @@ import os
 from io import BytesIO
 from xhtml2pdf import pisa
 from doctors.models import Doctor
-from drugs.models import Drug, DrugTemplate, DrugTemplateItem
+from drugs.models import Drug, DrugTemplate, DrugTemplateItem, drug_name_key, drug_scope_key
+from drugs.search import closest_drug
+from drugs.presets import clear_user_presets
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse, Http404
 from django.db.models import Q, Value, CharField
@@ -258,7 +262,8 @@ def prescribe_patient(request):
                     # Mark appointment completed if this is the first Rx for this appt
                     if appointment_id and not instance and appt:
                         appt.completed = AppointmentDetails.STATUS_DONE
-                        appt.save(update_fields=['completed'])
+                        appt.completed_at = datetime.now()
+                        appt.save(update_fields=['completed', 'completed_at'])
 
                     # Call next in queue
                     today = date.today()
@@ -273,6 +278,10 @@ def prescribe_patient(request):
                         next_appt.called = True
                         next_appt.save(update_fields=['called'])
 
+                    transaction.on_commit(
+                        lambda: on_consultation_done(request.user.doctor, request.user.hospital, today)
+                    )
+
             except ValidationError as e:
                 messages.error(request, str(e))
             else:
@@ -350,6 +359,7 @@ def save_user_preset(request):
         UserPreset.objects.get_or_create(user=request.user,
                                          field_name=field,
                                          value=value)
+        clear_user_presets(request.user.pk)
         return JsonResponse({'status': 'ok'})
     return JsonResponse({'status': 'error', 'message': 'Invalid data'}, status=400)
 
@@ -446,8 +456,8 @@ def view_prescriptions(request):
         selected_doctor = get_object_or_404(doctors, pk=doctor_pk)
         prescriptions = prescriptions.filter(doctor=selected_doctor)
 
-    # ---- 6. Order & limit ----
-    prescriptions = prescriptions.order_by("-prescribed_on")[:20]
+    # ---- 6. Order & limit (archived visits come from appointments.history) ----
+    prescriptions = attach_archived_appointments(list(prescriptions.order_by("-prescribed_on")[:20]))
 
     return render(
         request,
@@ -462,7 +472,7 @@ def view_prescriptions(request):
 
 from django.template.loader import render_to_string
 from django.http import HttpResponse
-from weasyprint import HTML
+from utils.pdf_cache import cached_pdf_response
 
 @login_required
 def prescription_print_regular(request, rx_id):
@@ -484,10 +494,8 @@ def prescription_print_regular(request, rx_id):
     download = request.GET.get("dl") == "1"
 
     if download:
-        pdf = HTML(string=html_string).write_pdf()
-        response = HttpResponse(pdf, content_type="application/pdf")
-        response["Content-Disposition"] = f'attachment; filename="Prescription-{rx_id}.pdf"'
-        return response
+        response = cached_pdf_response(request, html_string, f"Prescription-{rx_id}.pdf", disposition="attachment")
+        return response or HttpResponse("Could not generate the PDF, please try again.", status=503)
 
     # Normal browser view
     return HttpResponse(html_string)
@@ -549,21 +557,27 @@ def save_rx_template(request):
         1) doctor-specific
         2) hospital-level (Doctor null)
         3) global (no hospital/doctor)
+        4) otherwise the closest name within 2 typos ("Paracetmol 500 Tablet")
         """
-        qs = Drug.objects.filter(drug_name__iexact=drug_name.strip())
-        if doctor:
-            m = qs.filter(added_by_doctor=doctor).first()
-            if m: return m
+        scopes = [drug_scope_key(doctor_id=doctor.id)]
         if hospital:
-            m = qs.filter(hospital=hospital, added_by_doctor__isnull=True).first()
-            if m: return m
-        return qs.filter(hospital__isnull=True, added_by_doctor__isnull=True).first()
+            scopes.append(drug_scope_key(hospital_id=hospital.id))
+        scopes.append(drug_scope_key())
+        # one lookup on the (scope_key, name_key) unique index
+        found = {
+            d.scope_key: d
+            for d in Drug.objects.filter(scope_key__in=scopes, name_key=drug_name_key(drug_name))
+        }
+        for scope in scopes:
+            if scope in found:
+                return found[scope]
+        near = closest_drug(drug_name, doctor=doctor, hospital=hospital)
+        return Drug.objects.filter(pk=near.id).first() if near else None
 
     with transaction.atomic():
         tmpl = DrugTemplate.objects.create(doctor=doctor, name=name)
 
         items = []
-        matched_ids = set()
 
         for idx, row in enumerate(details):
             dn = (row.get("drug_name") or "").strip()
@@ -576,8 +590,6 @@ def save_rx_template(request):
             food = (row.get("food_order") or "").strip()
 
             matched = match_drug(dn)
-            if matched:
-                matched_ids.add(matched.id)
 
             items.append(DrugTemplateItem(
                 template=tmpl,
@@ -593,12 +605,9 @@ def save_rx_template(request):
         if not items:
             return JsonResponse({"ok": False, "error": "No valid rows"}, status=400)
 
+        # item.drug links the matched catalog drug (DrugTemplate has no drugs M2M any more)
         DrugTemplateItem.objects.bulk_create(items)
 
-        # Fill the M2M with any matched catalog drugs (optional but keeps your M2M meaningful)
-        if matched_ids:
-            tmpl.drugs.add(*matched_ids)
-
     return JsonResponse({"ok": True, "template_id": tmpl.id, "name": tmpl.name, "items": len(items)})
 
 # prescription/views.py
@@ -120,6 +120,42 @@ AWS_STORAGE_BUCKET_NAME_MEDIA = "quelo-media"
 #     }
 # }
 
+# Cache alias holding the per-(hospital, day) queue snapshots (queue_mgt.events).
+# Point it at a shared backend (Redis/Memcached) so all workers reuse one build.
+QUEUE_SNAPSHOT_CACHE = "default"
+# Open SSE queue streams per process (each holds a thread for up to a minute);
+# keep it below gunicorn's --threads. Further displays fall back to polling.
+QUEUE_STREAM_SLOTS = 4
+
+# DoubleTick HTTP client (whatsapp_notifications.client): (connect, read) timeout
+# in seconds and keep-alive connections kept per process.
+WHATSAPP_HTTP_TIMEOUT = (3.05, 10)
+WHATSAPP_HTTP_POOL_SIZE = 10
+
+# Drug autocomplete index (drugs.search): workers notice drug changes from
+# the DrugChange log within seconds and rebuild in the background; this is
+# the longest one keeps an index before rebuilding anyway, in seconds.
+# DRUG_SEARCH_CACHE is the cache alias for the drug library page counts.
+DRUG_SEARCH_CACHE = "default"
+DRUG_SEARCH_MAX_AGE = 3600
+# "fts5": global drugs are searched in a shared SQLite file (drugs.fts,
+# built by `manage.py build_drug_fts`) instead of each worker's memory.
+DRUG_SEARCH_BACKEND = "memory"
+DRUG_SEARCH_FTS_PATH = BASE_DIR / "drug_search.sqlite3"
+
+# Rendered receipt / token / prescription PDFs (utils.pdf_cache), keyed by a
+# hash of the HTML. Bump PDF_TEMPLATE_VERSION when PDF stylesheets or fonts
+# change so old renders are not served.
+PDF_CACHE_DIR = BASE_DIR / "pdf_cache"
+PDF_CACHE_MAX_BYTES = 200 * 1024 * 1024
+PDF_TEMPLATE_VERSION = "1"
+# PDF render service (utils.pdf_render, Procfile `pdf:`): socket the web
+# workers send HTML to, how long they wait, and static assets each render
+# process fetches at start. Without the socket, PDFs render in process.
+PDF_RENDER_SOCKET = os.getenv("PDF_RENDER_SOCKET", "/tmp/quelo-pdf-render.sock")
+PDF_RENDER_TIMEOUT = 20
+PDF_RENDER_PRELOAD_URLS = []
+
 # Public, cacheable URLs (no signed querystrings)
 AWS_S3_SIGNATURE_VERSION = "s3v4"
 
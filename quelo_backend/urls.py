@@ -22,7 +22,7 @@ from django.shortcuts import redirect
 from django.http import HttpResponse
 from django.views.generic import RedirectView
 from django.templatetags.static import static
-from queue_mgt.views import queue_display
+from queue_mgt.views import queue_display, queue_display_stream
 from core.views import health_check,RootRedirectView
 from hospital_portal.views import doctor_info_api
 
@@ -44,6 +44,7 @@ urlpatterns = [
     path("reports/", include("reports.urls", namespace="reports")),
     path("billing/", include(("billing.urls", "billing"), namespace="billing")),
     path("display/", queue_display, name="queue_display"),
+    path("display/stream/", queue_display_stream, name="queue_display_stream"),
     path("vitals/", include("vitals.urls")),
     path("visit/", include(('visit_workspace.urls', 'visit_workspace'), namespace='visit_workspace')),
 
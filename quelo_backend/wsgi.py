@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "quelo_backend.settings")
 
 application = get_wsgi_application()
+
+# Build the drug autocomplete index per worker now, not on the first keystroke.
+from drugs.search import warm_drug_index  # noqa: E402
+
+warm_drug_index()
@@ -0,0 +1,283 @@
+# queue_mgt/events.py
+"""
+Change notification and snapshot cache for a hospital's daily queue.
+
+Writers call bump_queue_version() after they change a hospital's queue.
+That moves the version and rebuilds the (hospital, day) snapshot once,
+so the dashboard, display, doctor info API and the SSE stream read rows
+from the cache instead of querying AppointmentDetails on every hit.
+
+Each open SSE stream holds a server thread for up to STREAM_SECONDS, so
+a process serves at most QUEUE_STREAM_SLOTS of them (open_queue_stream);
+displays turned away poll the ETag'd page instead.
+"""
+import hashlib
+import json
+import threading
+import time as time_mod
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.middleware.csrf import get_token
+from django.db.models import F, Exists, OuterRef
+from django.utils import formats
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from appointments.models import AppointmentDetails
+from billing.models import PaymentTransaction
+from utils.eta_calculator import recompute_queue_etas
+from .models import QueueVersion
+
+
+STREAM_SECONDS = 55      # recycle the connection; EventSource reconnects by itself
+POLL_SECONDS = 2         # how often the version row is checked
+KEEPALIVE_SECONDS = 15   # comment line so proxies don't drop an idle stream
+RETRY_MS = 3000
+BUSY_RETRY_SECONDS = 20  # Retry-After when every stream slot is taken
+
+# streams per process; keep it under the gunicorn --threads count
+_stream_slots = threading.BoundedSemaphore(getattr(settings, "QUEUE_STREAM_SLOTS", 4))
+
+SNAPSHOT_TIMEOUT = 60 * 60 * 12   # keys are versioned; this only bounds old entries
+
+
+def _hospital_id(hospital):
+    return getattr(hospital, "pk", hospital)
+
+
+def bump_queue_version(hospital, day=None):
+    """Mark the queue for (hospital, day) as changed. Returns the new version."""
+    hospital_id = _hospital_id(hospital)
+    day = day or date.today()
+
+    qs = QueueVersion.objects.filter(hospital_id=hospital_id, queue_date=day)
+    if not qs.update(version=F("version") + 1):
+        obj, created = QueueVersion.objects.get_or_create(
+            hospital_id=hospital_id, queue_date=day, defaults={"version": 1}
+        )
+        if not created:
+            qs.update(version=F("version") + 1)
+
+    version = get_queue_version(hospital_id, day)
+    _store_snapshot(hospital_id, day, version)
+    return version
+
+
+def on_consultation_done(doctor, hospital, day=None):
+    """
+    Completion hook: re-estimate the doctor's waiting ETAs from observed
+    consultation times, then publish the change.
+    """
+    recompute_queue_etas(doctor, hospital, day)
+    return bump_queue_version(hospital, day)
+
+
+def get_queue_version(hospital, day=None):
+    day = day or date.today()
+    return (
+        QueueVersion.objects
+        .filter(hospital_id=_hospital_id(hospital), queue_date=day)
+        .values_list("version", flat=True)
+        .first()
+    ) or 0
+
+
+# ---------------------------------------------------------------
+# Snapshot: every appointment of the day, in dashboard order
+# ---------------------------------------------------------------
+def _snapshot_cache():
+    return caches[getattr(settings, "QUEUE_SNAPSHOT_CACHE", "default")]
+
+
+def _snapshot_key(hospital_id, day, version):
+    return f"queue_snapshot:{hospital_id}:{day.isoformat()}:{version}"
+
+
+def queue_snapshot_queryset(hospital, day):
+    due = PaymentTransaction.objects.filter(payment=OuterRef("payment"), pay_type="Due")
+    return (
+        AppointmentDetails.objects
+        .filter(hospital_id=_hospital_id(hospital), appointment_on=day)
+        .annotate(is_due=Exists(due))
+        # Registered, In Queue, Completed, Cancelled: the status codes
+        # (-1, 0, 1, 2) already sort that way, so the
+        # (hospital, appointment_on, completed, que_pos) index gives the order.
+        .order_by("completed", "que_pos")
+        .values("appoint_id", "token_num", "que_pos", "eta", "called", "completed",
+                "is_due", "doctor_id", "doctor__doctor_name",
+                "patient_id", "patient__patient_name")
+    )
+
+
+def build_queue_snapshot(hospital, day=None):
+    """
+    Read the day's appointments once. Rows are plain dicts shaped like
+    the model (appt.doctor.doctor_name still resolves in templates) so
+    they pickle into any cache backend.
+    """
+    day = day or date.today()
+    qs = queue_snapshot_queryset(hospital, day)
+    return [
+        {
+            "appoint_id": r["appoint_id"],
+            "token_num": r["token_num"],
+            "que_pos": r["que_pos"],
+            "eta": r["eta"],
+            "called": r["called"],
+            "completed": r["completed"],
+            "is_due": r["is_due"],
+            "doctor_id": r["doctor_id"],
+            "doctor": {"id": r["doctor_id"], "doctor_name": r["doctor__doctor_name"]},
+            "patient_id": r["patient_id"],
+            "patient": {"id": r["patient_id"], "patient_name": r["patient__patient_name"]},
+        }
+        for r in qs
+    ]
+
+
+def _store_snapshot(hospital_id, day, version):
+    rows = build_queue_snapshot(hospital_id, day)
+    _snapshot_cache().set(_snapshot_key(hospital_id, day, version), rows, SNAPSHOT_TIMEOUT)
+    return rows
+
+
+def get_queue_snapshot(hospital, day=None):
+    """
+    Return (version, rows) for the hospital's queue. The version row is
+    read first, so cached rows are never older than the version they
+    are filed under.
+    """
+    hospital_id = _hospital_id(hospital)
+    day = day or date.today()
+    version = get_queue_version(hospital_id, day)
+    rows = _snapshot_cache().get(_snapshot_key(hospital_id, day, version))
+    if rows is None:
+        rows = _store_snapshot(hospital_id, day, version)
+    return version, rows
+
+
+def queue_etag(version, *parts):
+    """Strong ETag for a response rendered from snapshot `version`."""
+    return quote_etag("-".join(str(p) for p in ("q", version, *parts)))
+
+
+def session_tag(request):
+    """
+    Short hash of the session key and CSRF secret, for the ETag of a page
+    that embeds the CSRF token: after a new login or token rotation the
+    browser must not get a 304 for the page holding the old token.
+    """
+    get_token(request)              # sets META["CSRF_COOKIE"] to the (unmasked) secret
+    raw = f"{request.session.session_key}:{request.META.get('CSRF_COOKIE', '')}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def not_modified(request, etag):
+    """304 response if the client already has `etag`, else None."""
+    return get_conditional_response(request, etag=etag)
+
+
+def set_etag(response, etag):
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def display_rows(hospital, day=None):
+    """
+    Compact rows for the public display: same filter and order as
+    queue_display, but only the columns the screen shows.
+    """
+    _, snapshot = get_queue_snapshot(hospital, day)
+    return {
+        r["appoint_id"]: {
+            "id": r["appoint_id"],
+            "t": r["token_num"],
+            "p": r["patient"]["patient_name"] or "-",
+            "d": r["doctor"]["doctor_name"] or "-",
+            "q": r["que_pos"],
+            "e": formats.time_format(r["eta"]) if r["eta"] else "-",
+            "c": r["called"],
+        }
+        for r in snapshot
+        if r["completed"] == AppointmentDetails.STATUS_IN_QUEUE
+    }
+
+
+def diff_rows(prev, curr):
+    """Return (upserted rows, removed ids) turning `prev` into `curr`."""
+    upserts = [row for pk, row in curr.items() if prev.get(pk) != row]
+    removed = [pk for pk in prev if pk not in curr]
+    return upserts, removed
+
+
+def _sse(version, payload):
+    return f"id: {version}\nevent: queue\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+def queue_event_stream(hospital, last_version=None):
+    """
+    Generator for StreamingHttpResponse. The first event is a full reset
+    unless the client already holds the current version (Last-Event-ID);
+    after that only deltas are sent, and only when the version changes.
+    """
+    hospital_id = _hospital_id(hospital)
+    day = date.today()
+
+    version = get_queue_version(hospital_id, day)
+    rows = display_rows(hospital_id, day)
+
+    yield f"retry: {RETRY_MS}\n\n"
+    if str(version) != str(last_version):
+        yield _sse(version, {"v": version, "reset": True, "up": list(rows.values()), "rm": []})
+
+    started = last_sent = time_mod.monotonic()
+    while time_mod.monotonic() - started < STREAM_SECONDS:
+        time_mod.sleep(POLL_SECONDS)
+
+        current = get_queue_version(hospital_id, day)
+        if current != version:
+            version = current
+            fresh = display_rows(hospital_id, day)
+            upserts, removed = diff_rows(rows, fresh)
+            rows = fresh
+            if upserts or removed:
+                yield _sse(version, {"v": version, "reset": False, "up": upserts, "rm": removed})
+                last_sent = time_mod.monotonic()
+                continue
+
+        if time_mod.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+            yield ": ping\n\n"
+            last_sent = time_mod.monotonic()
+
+
+class _SlotStream:
+    """Stream iterable that frees its slot on close(), which the WSGI server always calls."""
+
+    def __init__(self, events, release):
+        self._events = events
+        self._release = release
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        try:
+            self._events.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+def open_queue_stream(hospital, last_version=None):
+    """
+    queue_event_stream() holding one of this process' stream slots, or
+    None when they are all taken (answer 503 + Retry-After; the display
+    falls back to polling).
+    """
+    if not _stream_slots.acquire(blocking=False):
+        return None
+    return _SlotStream(queue_event_stream(hospital, last_version), _stream_slots.release)
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.14 on 2026-10-17 23:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0010_alter_role_role_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queue_date', models.DateField()),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+            ],
+            options={
+                'db_table': 'queue_version',
+                'unique_together': {('hospital', 'queue_date')},
+            },
+        ),
+    ]
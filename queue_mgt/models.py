@@ -1,3 +1,22 @@
 from django.db import models
 
-# Create your models here.
+# queue_mgt/models.py
+
+
+class QueueVersion(models.Model):
+    """
+    Monotonic change counter for one hospital's queue on one day.
+    Bumped by every write that changes the queue; live displays compare
+    versions instead of re-querying appointments on a timer.
+    """
+    hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
+    queue_date = models.DateField()
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "queue_version"
+        unique_together = ("hospital", "queue_date")
+
+    def __str__(self):
+        return f"{self.hospital_id} @ {self.queue_date}: v{self.version}"
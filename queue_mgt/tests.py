@@ -1,3 +1,56 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.backends.db import SessionStore
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import rotate_token
+from django.test import RequestFactory, SimpleTestCase
+
+from queue_mgt import events
+from queue_mgt.events import open_queue_stream, queue_etag, session_tag
+
+
+class QueueEtagTests(SimpleTestCase):
+    """The dashboard ETag must change with the CSRF token the page embeds."""
+
+    def request(self, csrf_secret):
+        request = RequestFactory().get("/queue/")
+        request.session = SessionStore(session_key="s" * 32)
+        request.META["CSRF_COOKIE"] = csrf_secret       # as CsrfViewMiddleware reads it
+        return request
+
+    def test_same_session_same_tag(self):
+        secret = "a" * 32
+        self.assertEqual(session_tag(self.request(secret)), session_tag(self.request(secret)))
+
+    def test_new_csrf_token_changes_the_etag(self):
+        request = self.request("a" * 32)
+        before = queue_etag(7, "dash", 1, session_tag(request))
+        rotate_token(request)                      # what login() does
+        self.assertNotEqual(queue_etag(7, "dash", 1, session_tag(request)), before)
+        self.assertNotEqual(session_tag(self.request("b" * 32)), session_tag(self.request("a" * 32)))
+
+
+class QueueStreamSlotTests(SimpleTestCase):
+    """SSE streams are capped per process; a slot comes back when the response is closed."""
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(events, "_stream_slots", threading.BoundedSemaphore(1)),
+            mock.patch.object(events, "queue_event_stream", lambda hospital, last: (e for e in ["retry: 1\n\n"])),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_second_stream_is_refused_until_the_first_closes(self):
+        first = StreamingHttpResponse(open_queue_stream(1))
+        self.assertIsNone(open_queue_stream(1))
+
+        first.close()                              # never iterated: client gone before the first byte
+        second = open_queue_stream(1)
+        self.assertIsNotNone(second)
+        self.assertEqual(list(second), ["retry: 1\n\n"])
+        second.close()
+        second.close()                             # closing twice frees the slot once
+        self.assertIsNotNone(open_queue_stream(1))
@@ -1,14 +1,16 @@
 from django.urls import path
 from .views import (queue_dashboard, 
-                    update_status,queue_display,
+                    update_status,bulk_update_status,queue_display,queue_display_stream,
                     call_patient,
                     reschedule_page)
 
 urlpatterns = [
     path('', queue_dashboard, name='queue'),
     path('display/', queue_display, name='queue_display'),
+    path('display/stream/', queue_display_stream, name='queue_display_stream'),
     path('call-patient/<int:appoint_id>/', call_patient, name='call_patient'),
     path('update-status/<int:appoint_id>/<int:new_status>/', update_status, name='update_status'),
+    path('update-status/bulk/', bulk_update_status, name='bulk_update_status'),
     path("reschedule/", reschedule_page, name="reschedule_page"),
 
 ]
@@ -6,9 +6,13 @@ from doctors.models import Doctor
 from .forms import AppointmentFilterForm
 from django.urls import reverse
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse
-from utils.eta_calculator import calculate_eta_time
-from appointments.utils import get_next_queue_position
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from utils.eta_calculator import calculate_eta_time, recompute_queue_etas
+from appointments.utils import allocate_queue_position, allocate_queue_positions
+from django.db import transaction
+from django.db.models import Count
+from collections import defaultdict
+import json
 from django.contrib import messages
 from appointments.models import AppointmentDetails, AppointmentAuditLog
 from core.models import Hospital
@@ -18,6 +22,8 @@ from whatsapp_notifications.utils import send_reschedule_notifications
 from django.db.models import Exists, OuterRef, Value, BooleanField
 from billing.models import PaymentTransaction
 from prescription.models import PrescriptionDraft
+from .events import (bump_queue_version, on_consultation_done, open_queue_stream, get_queue_snapshot,
+                     queue_etag, not_modified, set_etag, session_tag, BUSY_RETRY_SECONDS)
 
 @login_required
 def queue_dashboard(request):
@@ -34,6 +40,10 @@ def queue_dashboard(request):
     # Doctor view restriction
     # ---------------------------
     doctor_obj = getattr(request.user, "doctor", None)
+
+    if hospital:
+        return _queue_dashboard_from_snapshot(request, hospital, today, doctor_obj)
+
     if doctor_obj:
         # Doctor sees ALL his patients (no status filter)
         qs = qs.filter(doctor=doctor_obj)
@@ -85,6 +95,45 @@ def queue_dashboard(request):
     })
 
 
+def _queue_dashboard_from_snapshot(request, hospital, today, doctor_obj):
+    """
+    queue_dashboard for a hospital user: same filters and order, applied
+    to the cached day snapshot. Answers 304 while the queue is unchanged.
+    """
+    version, rows = get_queue_snapshot(hospital, today)
+    etag = queue_etag(version, "dash", request.user.pk, session_tag(request), request.GET.urlencode())
+
+    # Pending flash messages must reach the page, so never 304 over them
+    if not len(messages.get_messages(request)):
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
+
+    form = AppointmentFilterForm(request.GET or None, hospital=hospital)
+    if doctor_obj:
+        # Doctor sees ALL his patients (no status filter)
+        rows = [r for r in rows if r["doctor_id"] == doctor_obj.pk]
+    elif form.is_valid():
+        doctor = form.cleaned_data.get("doctor")
+        if doctor:
+            rows = [r for r in rows if r["doctor_id"] == doctor.pk]
+
+        status = form.cleaned_data.get("status")
+        if status != "":
+            rows = [r for r in rows if r["completed"] == int(status)]
+
+        patient = (form.cleaned_data.get("patient") or "").lower()
+        if patient:
+            rows = [r for r in rows
+                    if patient in (r["patient"]["patient_name"] or "").lower()]
+
+    response = render(request, "queue_mgt/queue.html", {
+        "form": form,
+        "appointments": rows,
+    })
+    return set_etag(response, etag)
+
+
 
 def format_eta_window(eta_time):
     """Return a string like '06:00 PM – 06:30 PM' from a time object."""
@@ -110,7 +159,6 @@ def update_status(request, appoint_id, new_status):
 
     qs   = request.GET.urlencode()
     appt = get_object_or_404(AppointmentDetails, appoint_id=appoint_id)
-    appt.queue_start_time = datetime.now()
     old_status = appt.completed
     appt.completed = new_status
 
@@ -133,21 +181,24 @@ def update_status(request, appoint_id, new_status):
     # ===============================
     if old_status == -1 and new_status == 0:
 
-        # 🟦 Queue position
-        pos_info = get_next_queue_position(
-            doctor, 
-            appt.appointment_on or date.today(), 
-            hospital
-        )
-        appt.que_pos = pos_info["next_pos"]
+        appt_date = appt.appointment_on or date.today()
+
+        # 🟦 Queue position (atomic per doctor/day counter)
+        appt.que_pos = allocate_queue_position(doctor, appt_date, hospital)
 
-        # 🟦 ETA calculation
-        ahead = pos_info["next_pos"] - pos_info["completed_count"]
+        # 🟦 ETA calculation: patients still waiting + this one
+        ahead = AppointmentDetails.objects.filter(
+            doctor=doctor,
+            appointment_on=appt_date,
+            hospital=hospital,
+            completed=AppointmentDetails.STATUS_IN_QUEUE,
+        ).count() + 1
         appt.eta = calculate_eta_time(
             doctor.start_time,
             doctor.average_time_minutes,
             ahead,
-            appt.appointment_on or date.today()
+            appt_date,
+            doctor=doctor,
         )
 
         # ⭐ RECORD QUEUE START TIME (NATIVE TIME)
@@ -215,11 +266,194 @@ def update_status(request, appoint_id, new_status):
         "completed_at",
     ])
 
+    # A slot freed up: the rest of the doctor's queue moves
+    if new_status in (AppointmentDetails.STATUS_DONE, AppointmentDetails.STATUS_NO_SHOW):
+        on_consultation_done(doctor, hospital, appt.appointment_on)
+    else:
+        bump_queue_version(hospital, appt.appointment_on)
+
     # redirect
     base = reverse("queue")
     return redirect(f"{base}?{qs}") if qs else redirect(base)
 
 
+BULK_STATUS_LIMIT = 200
+VALID_STATUSES = {
+    AppointmentDetails.STATUS_REGISTERED,
+    AppointmentDetails.STATUS_IN_QUEUE,
+    AppointmentDetails.STATUS_DONE,
+    AppointmentDetails.STATUS_NO_SHOW,
+}
+
+
+def _transition_error(old_status, new_status):
+    """Same rules as update_status; returns a message or None."""
+    if new_status not in VALID_STATUSES:
+        return "Unknown status."
+    if old_status == new_status:
+        return "Already in that status."
+    if old_status == AppointmentDetails.STATUS_REGISTERED and new_status == AppointmentDetails.STATUS_DONE:
+        return "Move the patient to Queue before marking as Completed."
+    if old_status == AppointmentDetails.STATUS_DONE and new_status == AppointmentDetails.STATUS_NO_SHOW:
+        return "A completed appointment cannot be cancelled."
+    return None
+
+
+@login_required
+@require_POST
+def bulk_update_status(request):
+    """
+    Apply many status transitions in one request.
+
+    POST JSON: {"transitions": [{"appoint_id": 12, "status": 0}, ...]}
+    Valid transitions are applied together in one transaction: queue
+    positions are reserved per doctor-day in one counter UPDATE, audit
+    rows go in with bulk_create and appointments with bulk_update.
+    Invalid ones are skipped and reported back.
+    """
+    hospital = getattr(request.user, "hospital", None)
+    if not hospital:
+        return JsonResponse({"error": "No hospital linked to this user."}, status=400)
+
+    try:
+        payload = json.loads(request.body)
+        requested = [
+            (int(t["appoint_id"]), int(t["status"]))
+            for t in payload.get("transitions", [])
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    if not requested:
+        return JsonResponse({"error": "No transitions given."}, status=400)
+    if len(requested) > BULK_STATUS_LIMIT:
+        return JsonResponse({"error": f"At most {BULK_STATUS_LIMIT} transitions per request."}, status=400)
+
+    errors = []
+    seen = set()
+    wanted = {}
+    for appoint_id, new_status in requested:
+        if appoint_id in seen:
+            errors.append({"appoint_id": appoint_id, "error": "Duplicate appointment."})
+            continue
+        seen.add(appoint_id)
+        wanted[appoint_id] = new_status
+
+    now_local = datetime.now()
+    updated, audit_rows = [], []
+    freed = set()   # (doctor, day) whose waiting ETAs move
+
+    with transaction.atomic():
+        appts = {
+            a.appoint_id: a
+            for a in AppointmentDetails.objects
+            .select_for_update()
+            .filter(hospital=hospital, appoint_id__in=list(wanted))
+        }
+        # fetched apart from the locked rows so doctors aren't locked too
+        doctors = Doctor.objects.in_bulk({a.doctor_id for a in appts.values()})
+
+        to_queue = defaultdict(list)
+        for appoint_id, new_status in wanted.items():
+            appt = appts.get(appoint_id)
+            if appt is None:
+                errors.append({"appoint_id": appoint_id, "error": "Appointment not found."})
+                continue
+            problem = _transition_error(appt.completed, new_status)
+            if problem:
+                errors.append({"appoint_id": appoint_id, "error": problem})
+                continue
+
+            old_status = appt.completed
+            appt.completed = new_status
+            updated.append(appt)
+
+            if old_status == AppointmentDetails.STATUS_REGISTERED and new_status == AppointmentDetails.STATUS_IN_QUEUE:
+                to_queue[(appt.doctor_id, appt.appointment_on or date.today())].append(appt)
+            elif old_status == AppointmentDetails.STATUS_IN_QUEUE and new_status == AppointmentDetails.STATUS_DONE:
+                appt.completed_at = now_local
+                audit_rows.append((appt, "completed"))
+                freed.add((appt.doctor_id, appt.appointment_on))
+            elif new_status == AppointmentDetails.STATUS_NO_SHOW:
+                audit_rows.append((appt, "cancelled"))
+                freed.add((appt.doctor_id, appt.appointment_on))
+
+        # 🟦 REGISTERED → IN_QUEUE: positions in registration order, ETAs behind today's queue
+        if to_queue:
+            waiting = dict(
+                ((row["doctor_id"], row["appointment_on"]), row["n"])
+                for row in AppointmentDetails.objects
+                .filter(hospital=hospital,
+                        doctor_id__in={d for d, _ in to_queue},
+                        appointment_on__in={day for _, day in to_queue},
+                        completed=AppointmentDetails.STATUS_IN_QUEUE)
+                .values("doctor_id", "appointment_on")
+                .annotate(n=Count("appoint_id"))
+            )
+            for (doctor_id, day), group in to_queue.items():
+                group.sort(key=lambda a: (a.que_pos or 0, a.appoint_id))
+                doctor = doctors[doctor_id]
+                positions = allocate_queue_positions(doctor, day, hospital, len(group))
+                ahead = waiting.get((doctor_id, day), 0)
+                for offset, (appt, pos) in enumerate(zip(group, positions), start=1):
+                    appt.que_pos = pos
+                    appt.eta = calculate_eta_time(
+                        doctor.start_time,
+                        doctor.average_time_minutes,
+                        ahead + offset,
+                        day,
+                        doctor=doctor,
+                    )
+                    if not appt.queue_start_time:
+                        appt.queue_start_time = now_local
+                    audit_rows.append((appt, "queued"))
+
+        AppointmentAuditLog.objects.bulk_create([
+            AppointmentAuditLog(
+                hospital=hospital,
+                appointment=appt,
+                doctor_id=appt.doctor_id,
+                patient_id=appt.patient_id,
+                action=action,
+                token_num=appt.token_num,
+                que_pos=appt.que_pos,
+                eta=appt.eta,
+                completion_time=appt.completed_at if action == "completed" else None,
+            )
+            for appt, action in audit_rows
+        ])
+        AppointmentDetails.objects.bulk_update(updated, [
+            "completed",
+            "eta",
+            "que_pos",
+            "queue_start_time",
+            "completed_at",
+        ])
+
+    for doctor_id, day in freed:
+        recompute_queue_etas(doctors[doctor_id], hospital, day)
+    if freed:
+        # recomputation may have moved ETAs we are about to report
+        etas = dict(
+            AppointmentDetails.objects
+            .filter(appoint_id__in=[a.appoint_id for a in updated])
+            .values_list("appoint_id", "eta")
+        )
+        for appt in updated:
+            appt.eta = etas.get(appt.appoint_id, appt.eta)
+    for day in {a.appointment_on for a in updated}:
+        bump_queue_version(hospital, day)
+
+    return JsonResponse({
+        "updated": [
+            {"appoint_id": a.appoint_id, "status": a.completed, "que_pos": a.que_pos,
+             "eta": a.eta.strftime("%H:%M") if a.eta else None}
+            for a in updated
+        ],
+        "errors": errors,
+    }, status=200 if updated or not errors else 400)
+
+
 
  
 # quelo_backend/views.py
@@ -243,18 +477,60 @@ def queue_display(request, slug=None):
         return render(request, 'errors/no_hospital.html', status=404)
 
     today = date.today()
-    appointments = (
-        AppointmentDetails.objects
-        .filter(hospital=hospital, appointment_on=today, completed=0)
-        .select_related('doctor', 'patient')
-        .order_by('doctor__doctor_name', 'que_pos')
+    version, rows = get_queue_snapshot(hospital, today)
+    etag = queue_etag(version, "display", slug or "")
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    appointments = sorted(
+        (r for r in rows if r["completed"] == AppointmentDetails.STATUS_IN_QUEUE),
+        key=lambda r: (r["doctor"]["doctor_name"] or "", r["que_pos"] or 0),
+    )
+
+    stream_url = (
+        reverse('hospital_display_stream', kwargs={'slug': slug}) if slug
+        else reverse('queue_display_stream')
     )
 
-    return render(request, 'queue/queue_display.html', {
+    response = render(request, 'queue/queue_display.html', {
         'appointments': appointments,
         'hospital': hospital,
         'slug_mode': bool(slug),
+        'stream_url': stream_url,
     })
+    return set_etag(response, etag)
+
+
+def queue_display_stream(request, slug=None):
+    """
+    Server-Sent Events feed for the queue display.
+    Same hospital resolution as queue_display; pushes a compact
+    delta only when the hospital's queue version changes.
+    """
+    if slug:
+        hospital = get_object_or_404(Hospital, slug=slug)
+    else:
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "login required"}, status=401)
+        hospital = getattr(request.user, 'hospital', None)
+
+    if not hospital:
+        return JsonResponse({"error": "hospital not found"}, status=404)
+
+    last_version = request.headers.get("Last-Event-ID") or request.GET.get("v")
+
+    stream = open_queue_stream(hospital, last_version)
+    if stream is None:
+        # every stream slot of this worker is busy: the display polls the page instead
+        resp = HttpResponse("Too many open queue streams", status=503, content_type="text/plain")
+        resp["Retry-After"] = str(BUSY_RETRY_SECONDS)
+        return resp
+
+    resp = StreamingHttpResponse(stream, content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"   # don't let nginx buffer the stream
+    return resp
 
 
 
@@ -265,6 +541,7 @@ def call_patient(request, appoint_id):
     appt = get_object_or_404(AppointmentDetails, appoint_id=appoint_id)
     appt.called = True
     appt.save(update_fields=['called'])
+    bump_queue_version(appt.hospital_id, appt.appointment_on)
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
         return JsonResponse({"status": "ok"})
     else:
@@ -289,12 +566,15 @@ def reschedule_page(request):
 
         try:
             doctor = Doctor.objects.get(id=doctor_id, hospital=hospital)
-            results = send_reschedule_notifications(hospital, doctor, delay)
-
-            sent = sum(1 for r in results if r["status"] == "sent")
-            failed = sum(1 for r in results if r["status"] == "failed")
-
-            messages.success(request, f"Reschedule sent: {sent} messages, {failed} failed.")
+            summary = send_reschedule_notifications(hospital, doctor, delay)
+            bump_queue_version(hospital)
+
+            # delivered in the background by whatsapp_outbox_worker
+            messages.success(
+                request,
+                f"Delay of {delay} min applied to {summary['patients']} patients; "
+                f"{summary['queued']} messages queued.",
+            )
             return redirect("queue")  # or stay on reschedule_page
         except Doctor.DoesNotExist:
             messages.error(request, "Doctor not found.")
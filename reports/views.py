@@ -5,6 +5,7 @@ from django.db.models import Sum, Q
 from django.shortcuts import render
 from datetime import date, datetime
 from appointments.models import AppointmentDetails
+from appointments.history import appointment_rows, status_counts, status_counts_by_doctor
 from billing.models import PaymentTransaction  # adjust if module name differs
 from core.decorators import hospital_admin_required
 from openpyxl import Workbook
@@ -34,17 +35,14 @@ def daily_opd_report(request):
     else:
         report_date = date.today()
 
-    # -------- Appointments for that day --------
-    appts = (
-        AppointmentDetails.objects
-        .filter(hospital=hospital, appointment_on=report_date)
-        .select_related("doctor", "patient")
-    )
+    # -------- Appointments for that day (hot + archived) --------
+    appts = appointment_rows(hospital, report_date)
+    counts = status_counts(hospital, report_date)
 
-    total_reg      = appts.count()
-    total_completed = appts.filter(completed=1).count()
-    total_queued    = appts.filter(completed=0).count()
-    total_cancelled = appts.filter(completed=2).count()
+    total_reg      = sum(counts.values())
+    total_completed = counts[1]
+    total_queued    = counts[0]
+    total_cancelled = counts[2]
 
     # -------- Payments for that day --------
     txns = PaymentTransaction.objects.filter(
@@ -397,6 +395,7 @@ def doctor_productivity_report(request):
         end = date.today()
 
     doctors = Doctor.objects.filter(hospital=hospital)
+    by_doctor = status_counts_by_doctor(hospital, start, end)
 
     report_rows = []
     chart_labels = []
@@ -404,18 +403,14 @@ def doctor_productivity_report(request):
     chart_revenue = []
 
     for doctor in doctors:
-        # Appointments for doctor
-        appts = AppointmentDetails.objects.filter(
-            hospital=hospital,
-            doctor=doctor,
-            appointment_on__range=[start, end]
-        )
+        # Appointments for doctor (hot + archived)
+        counts = by_doctor[doctor.id]
 
-        total_patients = appts.count()
-        registered = appts.filter(completed=-1).count()
-        queued = appts.filter(completed=0).count()
-        completed_count = appts.filter(completed=1).count()
-        cancelled = appts.filter(completed=2).count()
+        total_patients = sum(counts.values())
+        registered = counts[-1]
+        queued = counts[0]
+        completed_count = counts[1]
+        cancelled = counts[2]
 
         # Revenue for doctor
         revenue_qs = PaymentTransaction.objects.filter(
@@ -488,20 +483,17 @@ def doctor_productivity_export_excel(request):
     # Collect data (same as report)
     # ---------------------------
     doctors = Doctor.objects.filter(hospital=hospital)
+    by_doctor = status_counts_by_doctor(hospital, start, end)
     export_rows = []
 
     for doctor in doctors:
-        appts = AppointmentDetails.objects.filter(
-            hospital=hospital,
-            doctor=doctor,
-            appointment_on__range=[start, end]
-        )
+        counts = by_doctor[doctor.id]
 
-        total_patients = appts.count()
-        registered = appts.filter(completed=-1).count()
-        queued = appts.filter(completed=0).count()
-        completed_count = appts.filter(completed=1).count()
-        cancelled = appts.filter(completed=2).count()
+        total_patients = sum(counts.values())
+        registered = counts[-1]
+        queued = counts[0]
+        completed_count = counts[1]
+        cancelled = counts[2]
 
         revenue_qs = PaymentTransaction.objects.filter(
             hospital=hospital,
@@ -573,25 +565,24 @@ def waiting_time_report(request):
     start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else date.today()
     end   = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else date.today()
 
-    qs = AppointmentDetails.objects.filter(
-        hospital=hospital,
-        appointment_on__range=[start, end],
+    appts = appointment_rows(
+        hospital, start, end,
         completed_at__isnull=False,
         queue_start_time__isnull=False,
-    ).select_related("doctor", "patient")
+    )
 
     # ------------------------------------------
     # Compute waiting time (in minutes)
     # ------------------------------------------
     rows = []
-    for appt in qs:
-        wt_minutes = int((appt.completed_at - appt.queue_start_time).total_seconds() // 60)
+    for appt in appts:
+        wt_minutes = int((appt["completed_at"] - appt["queue_start_time"]).total_seconds() // 60)
         rows.append({
-            "doctor": appt.doctor.doctor_name,
-            "patient": appt.patient.patient_name,
-            "token": appt.token_num,
-            "queue_start": appt.queue_start_time,
-            "completed_at": appt.completed_at,
+            "doctor": appt["doctor"]["doctor_name"],
+            "patient": appt["patient"]["patient_name"],
+            "token": appt["token_num"],
+            "queue_start": appt["queue_start_time"],
+            "completed_at": appt["completed_at"],
             "wait_minutes": wt_minutes,
         })
 
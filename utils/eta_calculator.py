@@ -1,5 +1,7 @@
 import logging
-from appointments.models import AppointmentDetails
+import time as time_mod
+import numpy as np
+from appointments.models import AppointmentDetails, AppointmentAuditLog, DoctorServiceStat
 from doctors.models import Doctor
 from datetime import datetime, date, time, timedelta
 import logging
@@ -52,9 +54,53 @@ def round_time_to_nearest_5min(t: time) -> time:
     rounded = dt.replace(minute=0, second=0, microsecond=0) + timedelta(minutes=minutes)
     return rounded.time()
 
-def calculate_eta_time(start_time_input, avg_minutes, que_pos, appointment_on=None) -> time | None:
+# ---------------------------------------------------------------
+# Learned service times (DoctorServiceStat), cached per process
+# ---------------------------------------------------------------
+SERVICE_STATS_TTL = 600     # seconds before a doctor's table is re-read
+MIN_STAT_SAMPLES = 5        # buckets with fewer samples are ignored
+
+_service_stats = {}         # doctor_id -> (expires_at, {(weekday, hour): minutes})
+
+
+def learned_service_minutes(doctor, when):
+    """
+    EWMA consultation length for the doctor at `when` (weekday + hour),
+    from the nightly DoctorServiceStat table. Falls back to the
+    neighbouring hours; None when nothing has been learned yet.
+    """
+    doctor_id = getattr(doctor, "pk", doctor)
+    if not doctor_id or when is None:
+        return None
+
+    entry = _service_stats.get(doctor_id)
+    if entry is None or entry[0] < time_mod.monotonic():
+        table = {
+            (wd, hr): minutes
+            for wd, hr, minutes in DoctorServiceStat.objects.filter(
+                doctor_id=doctor_id, samples__gte=MIN_STAT_SAMPLES,
+            ).values_list("weekday", "hour", "ewma_minutes")
+        }
+        entry = (time_mod.monotonic() + SERVICE_STATS_TTL, table)
+        _service_stats[doctor_id] = entry
+
+    table = entry[1]
+    wd = when.weekday()
+    for hr in (when.hour, when.hour - 1, when.hour + 1):
+        if (wd, hr) in table:
+            return table[(wd, hr)]
+    return None
+
+
+def clear_service_stats_cache():
+    _service_stats.clear()
+
+
+def calculate_eta_time(start_time_input, avg_minutes, que_pos, appointment_on=None, doctor=None) -> time | None:
     """
     Calculate ETA for a given doctor, average time, and queue position.
+    If `doctor` is given and a learned service time exists for that
+    weekday/hour, it replaces avg_minutes.
     Returns a time object rounded to nearest 5 minutes or None on failure.
     """
     try:
@@ -70,6 +116,8 @@ def calculate_eta_time(start_time_input, avg_minutes, que_pos, appointment_on=No
 
         effective_start = max(now.time(), start_time) if appt_date == now.date() else start_time
         base = datetime.combine(appt_date, effective_start)
+        if doctor is not None:
+            avg_minutes = learned_service_minutes(doctor, base) or avg_minutes
         eta = base + timedelta(minutes=avg_minutes * que_pos)
         return round_time_to_nearest_5min(eta.time().replace(second=0, microsecond=0))
 
@@ -109,7 +157,8 @@ def predict_eta_for_registration(doctor, hospital, appointment_on=None):
             doctor.start_time,
             doctor.average_time_minutes,
             queued + 1,             # next patient
-            appointment_on=appt_date
+            appointment_on=appt_date,
+            doctor=doctor,
         )
 
         return eta, queued
@@ -117,3 +166,143 @@ def predict_eta_for_registration(doctor, hospital, appointment_on=None):
     except Exception as e:
         logging.getLogger(__name__).warning(f"⚠️ ETA prediction failed: {e}")
         return None, 0
+
+
+
+# ---------------------------------------------------------------
+# Whole-queue ETA recomputation from observed consultation times
+# ---------------------------------------------------------------
+ETA_WINDOW = 8            # recent consultations that count towards the rolling average
+ETA_PRIOR_WEIGHT = 3      # pseudo-samples of Doctor.average_time_minutes blended in
+IDLE_GAP_FACTOR = 3       # a gap longer than this × average is a break, not a consultation
+MIN_CONSULT_MINUTES = 0.5
+
+
+def _completion_times(doctor, hospital, day):
+    """
+    Completion timestamps for the doctor's day. Completions come from
+    AppointmentDetails.completed_at and from "completed" audit entries
+    (paths that don't stamp completed_at still write those).
+    """
+    stamps = dict(
+        AppointmentDetails.objects.filter(
+            doctor=doctor, hospital=hospital, appointment_on=day,
+            completed=AppointmentDetails.STATUS_DONE, completed_at__isnull=False,
+        ).values_list("appoint_id", "completed_at")
+    )
+    for appt_id, ts in AppointmentAuditLog.objects.filter(
+        doctor=doctor, hospital=hospital, action="completed",
+        completion_time__date=day,
+    ).values_list("appointment_id", "completion_time"):
+        stamps.setdefault(appt_id, ts)
+    return sorted(stamps.values())
+
+
+def observed_consult_minutes(doctor, hospital, day=None, completions=None, when=None):
+    """
+    Rolling consultation length in minutes for the doctor's day.
+
+    Consecutive completions are one consultation apart while the doctor
+    is busy; gaps much longer than the expected length are breaks and
+    are dropped. The last ETA_WINDOW intervals are averaged and shrunk
+    towards the learned service time (or Doctor.average_time_minutes)
+    while samples are few.
+    """
+    prior = (
+        learned_service_minutes(doctor, when or datetime.now())
+        or float(doctor.average_time_minutes or 0)
+        or 10.0
+    )
+    if completions is None:
+        completions = _completion_times(doctor, hospital, day or date.today())
+    if len(completions) < 2:
+        return prior
+
+    ts = np.array([c.timestamp() for c in completions], dtype=float)
+    gaps = np.diff(ts) / 60.0
+    gaps = gaps[(gaps >= MIN_CONSULT_MINUTES) & (gaps <= prior * IDLE_GAP_FACTOR)]
+    gaps = gaps[-ETA_WINDOW:]
+    if gaps.size == 0:
+        return prior
+
+    return float((gaps.sum() + prior * ETA_PRIOR_WEIGHT) / (gaps.size + ETA_PRIOR_WEIGHT))
+
+
+def recompute_queue_etas(doctor, hospital, day=None, now=None):
+    """
+    Re-estimate ETAs for every waiting (IN_QUEUE, not yet called)
+    appointment of the doctor's day in one pass, and write back only
+    the ones that moved with a single bulk_update. Returns that count.
+    """
+    day = day or date.today()
+    now = now or datetime.now()
+
+    queue = list(
+        AppointmentDetails.objects
+        .filter(doctor=doctor, hospital=hospital, appointment_on=day,
+                completed=AppointmentDetails.STATUS_IN_QUEUE)
+        .only("appoint_id", "que_pos", "eta", "called")
+        .order_by("que_pos")
+    )
+    waiting = [a for a in queue if not a.called]
+    if not waiting:
+        return 0
+
+    completions = _completion_times(doctor, hospital, day)
+    avg = observed_consult_minutes(doctor, hospital, day, completions=completions, when=now)
+
+    # Earliest moment the doctor is free for the next waiting patient
+    start = datetime.combine(day, normalize_time_input(doctor.start_time))
+    free_at = max(now, start) if day == now.date() else start
+    if len(waiting) < len(queue):
+        # someone is with the doctor: assume they started at the last completion
+        last = completions[-1] if completions else now
+        free_at = max(free_at, last + timedelta(minutes=avg))
+
+    # Minutes since midnight, rounded to 5 like calculate_eta_time
+    base = (free_at - datetime.combine(day, time(0, 0))).total_seconds() / 60.0
+    minutes = base + np.arange(len(waiting)) * avg
+    minutes = np.clip(np.round(minutes / 5.0) * 5.0, 0, 24 * 60 - 5).astype(int)
+
+    changed = []
+    for appt, m in zip(waiting, minutes.tolist()):
+        eta = time(m // 60, m % 60)
+        if appt.eta != eta:
+            appt.eta = eta
+            changed.append(appt)
+
+    if changed:
+        AppointmentDetails.objects.bulk_update(changed, ["eta"])
+    return len(changed)
+
+
+def shift_queue_etas(doctor, hospital, delay_minutes, day=None):
+    """
+    Doctor running late: push every queued ETA of the day by delay_minutes
+    (negative pulls them in), clamped to the same day. Patients are loaded
+    with the same query for the notifications, and all ETAs are written
+    with one UPDATE (bulk_update's CASE on appoint_id). Returns the queued
+    appointments in queue order.
+    """
+    day = day or date.today()
+    queue = list(
+        AppointmentDetails.objects
+        .filter(doctor=doctor, hospital=hospital, appointment_on=day,
+                completed=AppointmentDetails.STATUS_IN_QUEUE)
+        .select_related("patient")
+        .order_by("que_pos")
+    )
+
+    delta = timedelta(minutes=delay_minutes)
+    day_start = datetime.combine(day, time(0, 0))
+    day_end = datetime.combine(day, time(23, 59))
+    shifted = []
+    for appt in queue:
+        if appt.eta:
+            moved = datetime.combine(day, appt.eta) + delta
+            appt.eta = min(max(moved, day_start), day_end).time()
+            shifted.append(appt)
+
+    if shifted:
+        AppointmentDetails.objects.bulk_update(shifted, ["eta"])
+    return queue
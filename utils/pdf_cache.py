@@ -0,0 +1,175 @@
+# utils/pdf_cache.py
+"""
+Disk cache for rendered PDFs (receipts, tokens, prescriptions).
+
+A PDF is stored under the SHA-256 of everything that decides its bytes:
+
+    engine | PDF_TEMPLATE_VERSION | page size | rendered HTML
+
+so a reprint of an unchanged receipt is a file read, and any change to the
+data (the HTML) or to the stylesheets / fonts (bump PDF_TEMPLATE_VERSION)
+renders again. The key doubles as a strong ETag: the browser's
+If-None-Match gets a 304 before the cache is even read.
+
+Files live in PDF_CACHE_DIR (local disk; media storage is S3 and would
+cost a round trip per hit). mtime is when the PDF was rendered
+(Last-Modified), atime when it was last served. Once a minute a writer
+drops the least recently served files above PDF_CACHE_MAX_BYTES.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .pdf_render import render_pdf
+
+logger = logging.getLogger(__name__)
+
+SWEEP_SECONDS = 60
+SWEEP_TARGET = 0.8              # evict down to this share of the limit
+
+_sweep = {"at": 0.0}
+_sweep_lock = threading.Lock()
+
+
+def _cache_dir():
+    return str(getattr(settings, "PDF_CACHE_DIR", settings.BASE_DIR / "pdf_cache"))
+
+
+def _max_bytes():
+    return getattr(settings, "PDF_CACHE_MAX_BYTES", 200 * 1024 * 1024)
+
+
+def pdf_cache_key(html, engine="weasyprint", page_size=""):
+    version = getattr(settings, "PDF_TEMPLATE_VERSION", "1")
+    digest = hashlib.sha256()
+    for part in (engine, str(version), page_size):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(html.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _path(key):
+    return os.path.join(_cache_dir(), key[:2], f"{key}.pdf")
+
+
+def get_cached_pdf(key):
+    """(pdf bytes, rendered-at timestamp) or None."""
+    path = _path(key)
+    try:
+        with open(path, "rb") as f:
+            pdf = f.read()
+        rendered_at = os.stat(path).st_mtime
+        os.utime(path, (time.time(), rendered_at))       # last served -> atime (LRU)
+        return pdf, rendered_at
+    except FileNotFoundError:
+        return None
+    except OSError:
+        logger.exception("PDF cache: read failed for %s", key)
+        return None
+
+
+def store_pdf(key, pdf):
+    """Write atomically (temp file + rename); a failed write only costs the next render."""
+    path = _path(key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(pdf)
+        os.replace(tmp, path)
+    except OSError:
+        logger.exception("PDF cache: write failed for %s", key)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    _maybe_sweep()
+
+
+def _maybe_sweep():
+    now = time.monotonic()
+    if now - _sweep["at"] < SWEEP_SECONDS or not _sweep_lock.acquire(blocking=False):
+        return
+    try:
+        _sweep["at"] = now
+        evict_pdfs()
+    finally:
+        _sweep_lock.release()
+
+
+def evict_pdfs(max_bytes=None):
+    """Remove least recently served PDFs until the cache fits. Returns the number removed."""
+    max_bytes = _max_bytes() if max_bytes is None else max_bytes
+    files, total = [], 0
+    for root, _dirs, names in os.walk(_cache_dir()):
+        for name in names:
+            if not name.endswith(".pdf"):
+                continue                         # a write in progress
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_atime, st.st_size, path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    target = max_bytes * SWEEP_TARGET
+    for _atime, size, path in sorted(files):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    logger.info("PDF cache: evicted %s files", removed)
+    return removed
+
+
+def cached_pdf_response(request, html, filename, engine="weasyprint", base_url=None, page_size="",
+                        disposition="inline"):
+    """
+    HttpResponse with the PDF for `html`, rendered (utils.pdf_render) only
+    on a cache miss. Answers 304 when the browser already has it.
+    Returns None if the render failed or timed out (the caller reports it).
+    """
+    key = pdf_cache_key(html, engine, page_size)
+    etag = quote_etag(key)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _headers(not_modified, etag, None)
+
+    cached = get_cached_pdf(key)
+    if cached is None:
+        pdf = render_pdf(html, base_url=base_url, engine=engine)
+        if not pdf:
+            return None
+        store_pdf(key, pdf)
+        cached = (pdf, time.time())
+
+    pdf, rendered_at = cached
+    response = HttpResponse(pdf, content_type="application/pdf")
+    response["Content-Disposition"] = f'{disposition}; filename="{filename}"'
+    return _headers(response, etag, rendered_at)
+
+
+def _headers(response, etag, rendered_at):
+    response["ETag"] = etag
+    if rendered_at is not None:
+        response["Last-Modified"] = http_date(rendered_at)
+    # receipts carry patient data: the browser may keep them, proxies may not
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,175 @@
+# utils/pdf_render.py
+"""
+HTML -> PDF for the receipt / token / prescription views.
+
+With PDF_RENDER_SOCKET set, render_pdf() hands the HTML to the
+`pdf_render_worker` service (Procfile `pdf:`) over that Unix socket and
+waits at most PDF_RENDER_TIMEOUT seconds, so a gunicorn thread is not
+pinned by a render. The service keeps a pool of processes that have
+already imported WeasyPrint, loaded the fonts and fetched the remote
+assets (S3 static) once; each render reuses that state.
+
+If the service is not running, the render happens in process as before.
+On a timeout or a render error render_pdf() returns None and the view
+answers 503. The request carries its deadline, so the service drops a job
+nobody is waiting for any more, and a full service refuses at once.
+
+Wire format, both directions: one JSON header line with "length", then
+that many bytes (HTML in, PDF out).
+"""
+import io
+import json
+import logging
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("weasyprint", "xhtml2pdf")
+FETCH_CACHE_SIZE = 256           # remote assets kept per render process
+FETCH_CACHE_SECONDS = 3600
+MAX_MESSAGE_BYTES = 32 * 1024 * 1024
+
+
+class PdfRenderError(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------
+# rendering (in the worker processes, or in process as the fallback)
+# ----------------------------------------------------------------------
+_fetched = {}                    # url -> (fetched_at, fetcher result)
+_fetch_lock = threading.Lock()
+_font_config = None
+
+
+def _cached_url_fetcher(url, timeout=10, ssl_context=None):
+    """weasyprint.default_url_fetcher, remembering http(s) assets for FETCH_CACHE_SECONDS."""
+    from weasyprint import default_url_fetcher
+
+    if not url.startswith(("http://", "https://")):
+        return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+    now = time.monotonic()
+    hit = _fetched.get(url)
+    if hit is not None and now - hit[0] < FETCH_CACHE_SECONDS:
+        return dict(hit[1])
+
+    result = default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+    if "file_obj" in result:
+        with result.pop("file_obj") as f:
+            result["string"] = f.read()
+    with _fetch_lock:
+        if len(_fetched) >= FETCH_CACHE_SIZE:
+            _fetched.pop(min(_fetched, key=lambda u: _fetched[u][0]))
+        _fetched[url] = (now, result)
+    return dict(result)
+
+
+def _fonts():
+    global _font_config
+    if _font_config is None:
+        from weasyprint.text.fonts import FontConfiguration
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def render_local(html, base_url=None, engine="weasyprint"):
+    """Render in this process. Returns PDF bytes; raises PdfRenderError."""
+    if engine == "xhtml2pdf":
+        from xhtml2pdf import pisa
+
+        result = io.BytesIO()
+        pdf = pisa.pisaDocument(io.BytesIO(html.encode("utf-8")), result)
+        if pdf.err:
+            raise PdfRenderError("xhtml2pdf could not render the document")
+        return result.getvalue()
+    if engine != "weasyprint":
+        raise PdfRenderError(f"unknown PDF engine {engine!r}")
+
+    from weasyprint import HTML
+
+    fonts = _fonts()
+    return HTML(string=html, base_url=base_url, url_fetcher=_cached_url_fetcher).write_pdf(font_config=fonts)
+
+
+def warm_renderer():
+    """Worker start: import the engines, load fonts and preload PDF_RENDER_PRELOAD_URLS."""
+    started = time.perf_counter()
+    for url in getattr(settings, "PDF_RENDER_PRELOAD_URLS", ()):
+        try:
+            _cached_url_fetcher(url)
+        except Exception:
+            logger.warning("PDF render: could not preload %s", url)
+    sample = "<html><body style='font-family: sans-serif'><p>warm-up <b>bold</b></p></body></html>"
+    for engine in ENGINES:
+        try:
+            render_local(sample, engine=engine)
+        except Exception:
+            logger.exception("PDF render: %s warm-up failed", engine)
+    logger.info("PDF render process warm in %.1fs", time.perf_counter() - started)
+
+
+# ----------------------------------------------------------------------
+# wire format
+# ----------------------------------------------------------------------
+def send_message(sock, header, body=b""):
+    line = json.dumps(dict(header, length=len(body))).encode("utf-8") + b"\n"
+    sock.sendall(line + body)
+
+
+def read_message(rfile):
+    """(header dict, body bytes) from a socket file; raises PdfRenderError on a short read."""
+    line = rfile.readline(64 * 1024)
+    if not line.endswith(b"\n"):
+        raise PdfRenderError("connection closed")
+    header = json.loads(line)
+    length = int(header.get("length", 0))
+    if not 0 <= length <= MAX_MESSAGE_BYTES:
+        raise PdfRenderError(f"bad message length {length}")
+    body = rfile.read(length)
+    if len(body) != length:
+        raise PdfRenderError("connection closed")
+    return header, body
+
+
+# ----------------------------------------------------------------------
+# client (web processes)
+# ----------------------------------------------------------------------
+def _render_remote(path, html, base_url, engine, timeout):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        header = {"engine": engine, "base_url": base_url, "deadline": time.time() + timeout}
+        send_message(sock, header, html.encode("utf-8"))
+        with sock.makefile("rb") as rfile:
+            header, body = read_message(rfile)
+    if not header.get("ok"):
+        raise PdfRenderError(header.get("error") or "render failed")
+    return body
+
+
+def render_pdf(html, base_url=None, engine="weasyprint", timeout=None):
+    """PDF bytes for `html`, or None if rendering failed or timed out."""
+    path = getattr(settings, "PDF_RENDER_SOCKET", None)
+    timeout = timeout or getattr(settings, "PDF_RENDER_TIMEOUT", 20)
+    if path:
+        started = time.monotonic()
+        try:
+            return _render_remote(str(path), html, base_url, engine, timeout)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            logger.warning("PDF render service unavailable (%s); rendering in process", e)
+        except TimeoutError:
+            logger.error("PDF render service timed out after %.1fs", time.monotonic() - started)
+            return None
+        except (OSError, ValueError, PdfRenderError) as e:
+            logger.error("PDF render service failed: %s", e)
+            return None
+
+    try:
+        return render_local(html, base_url, engine)
+    except Exception:
+        logger.exception("PDF render failed (%s)", engine)
+        return None
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_archive_history'),
+        ('visit_workspace', '0004_visitdocument_ai_summary_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visitdocument',
+            name='appointment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='visit_documents', to='appointments.appointmentdetails'),
+        ),
+        migrations.AlterField(
+            model_name='visitnote',
+            name='appointment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='visit_notes', to='appointments.appointmentdetails'),
+        ),
+    ]
@@ -37,6 +37,7 @@ class VisitDocument(models.Model):
         null=True,
         blank=True,
         related_name="visit_documents",
+        db_constraint=False,  # may point into appointment history
     )
 
     doc_type = models.CharField(max_length=20, choices=DOCUMENT_TYPES)
@@ -82,6 +83,7 @@ class VisitNote(models.Model):
         null=True,
         blank=True,
         related_name="visit_notes",
+        db_constraint=False,  # may point into appointment history
     )
 
     note_type = models.CharField(max_length=20, choices=NOTE_TYPES)
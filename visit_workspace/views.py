@@ -251,7 +251,7 @@ def save_summary(request, doc_id):
                 VisitNote.objects.create(
                     hospital=hospital,
                     patient=doc.patient,
-                    appointment=doc.appointment,
+                    appointment_id=doc.appointment_id,     # may be archived (appointments.history)
                     note_type=note_type,
                     text=text,
                     source="AI",
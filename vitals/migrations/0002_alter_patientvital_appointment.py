@@ -0,0 +1,20 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_archive_history'),
+        ('vitals', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='patientvital',
+            name='appointment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='appointments.appointmentdetails'),
+        ),
+    ]
@@ -12,7 +12,8 @@ from appointments.models import AppointmentDetails  # if optional, keep null=Tru
 class PatientVital(models.Model):
     hospital    = models.ForeignKey(Hospital, on_delete=models.CASCADE, db_index=True)
     patient     = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="vitals", db_index=True)
-    appointment = models.ForeignKey(AppointmentDetails, on_delete=models.SET_NULL, null=True, blank=True)
+    appointment = models.ForeignKey(AppointmentDetails, on_delete=models.SET_NULL, null=True, blank=True,
+                                    db_constraint=False)  # may point into appointment history
 
     height_cm   = models.DecimalField(max_digits=5, decimal_places=2, validators=[MinValueValidator(Decimal("30.00"))])
     weight_kg   = models.DecimalField(max_digits=5, decimal_places=2, validators=[MinValueValidator(Decimal("1.00"))])
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import WhatsappConfig, WhatsappMessageLog
+from .models import WhatsappConfig, WhatsappMessageLog, WhatsappOutbox
 
 @admin.register(WhatsappConfig)
 class WhatsappConfigAdmin(admin.ModelAdmin):
@@ -14,3 +14,10 @@ class WhatsappMessageLogAdmin(admin.ModelAdmin):
     list_filter = ("status", "template_name", "hospital")
     search_fields = ("recipient_number", "patient__patient_name", "doctor__doctor_name")
     readonly_fields = ("created_at", "updated_at")
+
+@admin.register(WhatsappOutbox)
+class WhatsappOutboxAdmin(admin.ModelAdmin):
+    list_display = ("hospital", "template_name", "template_type", "recipient_number", "status", "attempts", "next_attempt_at", "created_at")
+    list_filter = ("status", "hospital")
+    search_fields = ("recipient_number", "patient__patient_name")
+    readonly_fields = ("created_at", "sent_at", "locked_at")
@@ -0,0 +1,121 @@
+# whatsapp_notifications/client.py
+"""
+Shared HTTP client for the DoubleTick provider.
+
+One requests.Session per process keeps TLS connections alive between
+messages (pool sized for the outbox worker's threads), every call has a
+(connect, read) timeout, and a circuit breaker stops hammering the
+provider while it is down: after FAILURE_THRESHOLD consecutive failures
+calls fail fast with CircuitOpenError for RESET_AFTER seconds, then one
+trial request decides whether to close it again.
+"""
+import json
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DOUBLETICK_HEADERS = {
+    "accept": "application/json",
+    "content-type": "application/json",
+    "Authorization": "key_U370Xs8rSS",
+}
+
+FAILURE_THRESHOLD = 5
+RESET_AFTER = 30           # seconds the circuit stays open
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Provider marked down; raised without making a request (retryable)."""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_after=RESET_AFTER):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN       # let exactly one trial through
+                return
+            raise CircuitOpenError(
+                f"DoubleTick circuit open after {self.failures} failures; retry later"
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    logger.warning("DoubleTick circuit opened after %s failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class DoubleTickClient:
+    def __init__(self, pool_size=None, timeout=None):
+        self.pool_size = pool_size or getattr(settings, "WHATSAPP_HTTP_POOL_SIZE", 10)
+        self.timeout = timeout or getattr(settings, "WHATSAPP_HTTP_TIMEOUT", (3.05, 10))
+        self.breaker = CircuitBreaker()
+
+        self.session = requests.Session()
+        self.session.headers.update(DOUBLETICK_HEADERS)
+        # retries are the outbox worker's job (with backoff), not the adapter's
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post_template(self, webhook_url, payload):
+        """POST one payload; returns (response json, provider message id). Raises on HTTP errors."""
+        self.breaker.before_call()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📤 WhatsApp payload → %s: %s", webhook_url, json.dumps(payload))
+
+        try:
+            resp = self.session.post(webhook_url, json=payload, timeout=self.timeout)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+
+        if resp.status_code >= 500 or resp.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            # 4xx is about this message, not the provider's health
+            self.breaker.record_success()
+        resp.raise_for_status()
+
+        data = resp.json()
+        return data, data.get("messages", [{}])[0].get("messageId")
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(pool_size=None):
+    """Process-wide client; the first caller may size the connection pool."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DoubleTickClient(pool_size=pool_size)
+    return _client
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0003_doctor_consult_message_template_and_more'),
+        ('patients', '0003_remove_patient_age_months_remove_patient_age_years'),
+        ('core', '0010_alter_role_role_name'),
+        ('whatsapp_notifications', '0007_alter_whatsappmessagelog_provider_message_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WhatsappMessageLogHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('template_name', models.CharField(max_length=100)),
+                ('recipient_number', models.CharField(max_length=20)),
+                ('placeholders', models.JSONField()),
+                ('buttons', models.JSONField(blank=True, null=True)),
+                ('provider_message_id', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('delivered', 'Delivered'), ('read', 'Read'), ('failed', 'Failed')], max_length=20)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='doctors.doctor')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='patients.patient')),
+            ],
+            options={
+                'db_table': 'whatsapp_message_log_history',
+                'indexes': [models.Index(fields=['hospital', 'created_at'], name='wa_log_hist_hosp_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0003_doctor_consult_message_template_and_more'),
+        ('core', '0010_alter_role_role_name'),
+        ('patients', '0003_remove_patient_age_months_remove_patient_age_years'),
+        ('whatsapp_notifications', '0008_archive_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WhatsappOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template_type', models.CharField(blank=True, max_length=50)),
+                ('template_name', models.CharField(blank=True, max_length=150)),
+                ('recipient_number', models.CharField(max_length=20)),
+                ('placeholders', models.JSONField()),
+                ('buttons', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='doctors.doctor')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+                ('log', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outbox', to='whatsapp_notifications.whatsappmessagelog')),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='patients.patient')),
+            ],
+            options={
+                'db_table': 'whatsapp_outbox',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='wa_outbox_status_due')],
+            },
+        ),
+    ]
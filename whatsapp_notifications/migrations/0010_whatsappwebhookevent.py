@@ -0,0 +1,30 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_notifications', '0009_whatsappoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WhatsappWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=20)),
+                ('hospital_id', models.IntegerField(blank=True, null=True)),
+                ('dedupe_key', models.CharField(blank=True, max_length=300, null=True, unique=True)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'whatsapp_webhook_event',
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='wa_webhook_evt_pending')],
+            },
+        ),
+    ]
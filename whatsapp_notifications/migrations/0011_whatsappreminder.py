@@ -0,0 +1,37 @@
+# Generated by Django 4.2.14 on 2026-10-18 00:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_archive_history'),
+        ('core', '0010_alter_role_role_name'),
+        ('whatsapp_notifications', '0010_whatsappwebhookevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='whatsapptemplate',
+            name='template_type',
+            field=models.CharField(choices=[('confirmation', 'Confirmation'), ('reschedule', 'Reschedule'), ('followup', 'Follow-up'), ('reminder', 'Reminder')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='WhatsappReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(default='reminder', max_length=20)),
+                ('due_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='appointments.appointmentdetails')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.hospital')),
+                ('outbox', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='whatsapp_notifications.whatsappoutbox')),
+            ],
+            options={
+                'db_table': 'whatsapp_reminder',
+                'unique_together': {('appointment', 'kind')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_notifications', '0011_whatsappreminder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='whatsappwebhookevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.db import models
 from django.db import models
 
 from django.db import models
+from django.utils import timezone
 
 class WhatsappConfig(models.Model):
     hospital = models.OneToOneField("core.Hospital", on_delete=models.CASCADE)
@@ -24,6 +25,7 @@ class WhatsappTemplate(models.Model):
         ("confirmation", "Confirmation"),
         ("reschedule", "Reschedule"),
         ("followup", "Follow-up"),
+        ("reminder", "Reminder"),     # sent by run_reminder_scheduler before the ETA
     ]
 
     hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
@@ -76,6 +78,107 @@ class WhatsappMessageLog(models.Model):
         return f"{self.template_name} → {self.recipient_number} ({self.status})"
 
 
+class WhatsappOutbox(models.Model):
+    """
+    Outgoing template messages waiting for `manage.py whatsapp_outbox_worker`.
+    Views write here (inside their own transaction) instead of calling the
+    provider; the worker sends, retries with backoff and updates `log`.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENDING, "Sending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
+    patient = models.ForeignKey("patients.Patient", on_delete=models.SET_NULL, null=True, blank=True)
+    doctor = models.ForeignKey("doctors.Doctor", on_delete=models.SET_NULL, null=True, blank=True)
+    log = models.OneToOneField(WhatsappMessageLog, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name="outbox")
+
+    template_type = models.CharField(max_length=50, blank=True)
+    template_name = models.CharField(max_length=150, blank=True)
+    recipient_number = models.CharField(max_length=20)
+    placeholders = models.JSONField()
+    buttons = models.BooleanField(default=True)       # add the hospital "Call Us" button
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)   # set while a worker holds it
+    last_error = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "whatsapp_outbox"
+        indexes = [
+            # worker poll: due pending rows, oldest first
+            models.Index(fields=["status", "next_attempt_at"], name="wa_outbox_status_due"),
+        ]
+
+    def __str__(self):
+        return f"{self.template_name or self.template_type} → {self.recipient_number} ({self.status})"
+
+
+class WhatsappWebhookEvent(models.Model):
+    """
+    Raw provider callbacks, one row per event. The webhook views only
+    insert here and return; `manage.py process_whatsapp_webhooks` applies
+    them in batches. dedupe_key drops provider retries at insert time.
+    A receipt that arrives before its outbox log is left pending with
+    next_attempt_at set, so it does not hold up newer events meanwhile.
+    """
+    source = models.CharField(max_length=20)              # "whatsapp" | "doubletick"
+    hospital_id = models.IntegerField(null=True, blank=True)   # from the webhook URL, if any
+    dedupe_key = models.CharField(max_length=300, unique=True, null=True, blank=True)
+    payload = models.JSONField()
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)    # None: claim now
+    error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        db_table = "whatsapp_webhook_event"
+        indexes = [models.Index(fields=["processed_at", "id"], name="wa_webhook_evt_pending")]
+
+    def __str__(self):
+        return f"{self.source} event {self.id} ({'done' if self.processed_at else 'pending'})"
+
+
+class WhatsappReminder(models.Model):
+    """
+    One row per appointment reminder handed to the outbox. The unique
+    (appointment, kind) pair is what stops run_reminder_scheduler from
+    sending twice, across restarts and parallel daemons.
+    """
+    KIND_REMINDER = "reminder"
+
+    hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
+    # no DB constraint: archive_closed_days moves appointments to history
+    appointment = models.ForeignKey("appointments.AppointmentDetails", on_delete=models.DO_NOTHING,
+                                    db_constraint=False, related_name="+")
+    kind = models.CharField(max_length=20, default=KIND_REMINDER)
+    outbox = models.ForeignKey(WhatsappOutbox, on_delete=models.SET_NULL, null=True, blank=True)
+    due_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "whatsapp_reminder"
+        unique_together = ("appointment", "kind")
+
+    def __str__(self):
+        return f"{self.kind} for appt {self.appointment_id} (due {self.due_at:%d-%m %H:%M})"
+
+
 class WhatsappInboundMessage(models.Model):
     hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
     patient = models.ForeignKey("patients.Patient", null=True, blank=True, on_delete=models.SET_NULL)
@@ -111,3 +214,32 @@ class WhatsappInboundMessage(models.Model):
 
     def __str__(self):
         return f"{self.from_number} → {self.event_type} ({self.created_at:%d-%m %H:%M})"
+
+
+class WhatsappMessageLogHistory(models.Model):
+    """Message logs moved out by `manage.py archive_closed_days`."""
+    id = models.BigIntegerField(primary_key=True)
+    hospital = models.ForeignKey("core.Hospital", on_delete=models.CASCADE)
+    patient = models.ForeignKey("patients.Patient", on_delete=models.SET_NULL, null=True, blank=True)
+    doctor = models.ForeignKey("doctors.Doctor", on_delete=models.SET_NULL, null=True, blank=True)
+
+    template_name = models.CharField(max_length=100)
+    recipient_number = models.CharField(max_length=20)
+
+    placeholders = models.JSONField()
+    buttons = models.JSONField(blank=True, null=True)
+
+    provider_message_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+
+    status = models.CharField(max_length=20, choices=WhatsappMessageLog.STATUS_CHOICES)
+    error_message = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "whatsapp_message_log_history"
+        indexes = [models.Index(fields=["hospital", "created_at"], name="wa_log_hist_hosp_created")]
+
+    def __str__(self):
+        return f"{self.template_name} → {self.recipient_number} ({self.status}, archived)"
@@ -0,0 +1,223 @@
+# whatsapp_notifications/reminders.py
+"""
+Appointment reminders for `manage.py run_reminder_scheduler`.
+
+The scheduler keeps a heap of (due_at, appoint_id) for appointments whose
+ETA falls in the next lead + window minutes (due_at = ETA - lead):
+
+- refresh()   every few minutes reloads only that window, by date + ETA on
+              the appointment_on index, in appoint_id keyset batches;
+- tail()      every tick picks up appointments registered since, by PK range
+              (appoint_id > highest seen), instead of re-scanning the day;
+- fire_due()  pops due entries, re-reads them (ETA may have moved, patient
+              may be done) and, per hospital in one transaction, inserts
+              WhatsappReminder rows + outbox messages.
+
+WhatsappReminder is unique per (appointment, kind): after a restart the
+refresh skips appointments already reminded, and a second daemon racing
+for the same rows hits the constraint and rolls back instead of sending.
+
+A reminder is only sent if its due time came after the appointment was
+created (a walk-in whose ETA is already within the lead has just had its
+token message) and at most catch_up before the scheduler started (a
+restart does not fire every reminder it missed while down).
+"""
+import heapq
+import logging
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+
+from appointments.models import AppointmentDetails
+from .models import WhatsappConfig, WhatsappReminder
+from .services import enqueue_whatsapp_template
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = (AppointmentDetails.STATUS_REGISTERED, AppointmentDetails.STATUS_IN_QUEUE)
+
+
+class ReminderScheduler:
+    def __init__(self, lead_minutes=60, window_minutes=180, batch_size=500, catch_up_minutes=10):
+        self.lead = timedelta(minutes=lead_minutes)
+        self.window = timedelta(minutes=window_minutes)
+        self.catch_up = timedelta(minutes=catch_up_minutes)
+        self.started_at = None      # first refresh
+        self.batch_size = batch_size
+        self.heap = []              # (due_at, appoint_id)
+        self.scheduled = {}         # appoint_id -> due_at currently in the heap
+        self.enabled = set()        # hospital ids with reminders on + a reminder template
+        self.max_seen_id = 0
+        self.horizon = None         # ETAs up to here are loaded
+
+    # ------------------------------------------------------------------
+    def _open_appointments(self, now):
+        """Open, not yet reminded appointments of enabled hospitals from today on."""
+        reminded = WhatsappReminder.objects.filter(
+            appointment_id=OuterRef("appoint_id"), kind=WhatsappReminder.KIND_REMINDER,
+        )
+        return (
+            AppointmentDetails.objects
+            .filter(
+                appointment_on__gte=now.date(),
+                completed__in=OPEN_STATUSES,
+                eta__isnull=False,
+                hospital_id__in=self.enabled,
+            )
+            .exclude(Exists(reminded))
+        )
+
+    def _batches(self, qs):
+        """Keyset batches of (appoint_id, appointment_on, eta, created_at) in PK order."""
+        last = 0
+        while True:
+            rows = list(
+                qs.filter(appoint_id__gt=last)
+                  .order_by("appoint_id")
+                  .values_list("appoint_id", "appointment_on", "eta", "created_at")[:self.batch_size]
+            )
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+    def _too_late(self, due, created_at):
+        """Due before the appointment existed, or long before this scheduler started."""
+        if created_at is not None and due < created_at:
+            return True
+        return self.started_at is not None and due < self.started_at - self.catch_up
+
+    def _push(self, appoint_id, appointment_on, eta, created_at, now):
+        eta_at = datetime.combine(appointment_on, eta)
+        if eta_at < now or eta_at > self.horizon:
+            return False
+        due = eta_at - self.lead
+        if self._too_late(due, created_at):
+            return False
+        if self.scheduled.get(appoint_id) == due:
+            return False
+        self.scheduled[appoint_id] = due
+        heapq.heappush(self.heap, (due, appoint_id))
+        return True
+
+    # ------------------------------------------------------------------
+    def refresh(self, now):
+        """Rebuild the heap from the current window (ETA in [now, now + lead + window])."""
+        self.enabled = set(
+            WhatsappConfig.objects.filter(active=True, send_reminders=True)
+            .filter(hospital__whatsapptemplate__template_type="reminder")
+            .values_list("hospital_id", flat=True)
+        )
+        self.heap, self.scheduled = [], {}
+        self.horizon = now + self.lead + self.window
+        if self.started_at is None:
+            self.started_at = now
+
+        qs = self._open_appointments(now)
+        day = now.date()
+        while day <= self.horizon.date():
+            day_qs = qs.filter(appointment_on=day)
+            if day == now.date():
+                day_qs = day_qs.filter(eta__gte=now.time())
+            if day == self.horizon.date():
+                day_qs = day_qs.filter(eta__lte=self.horizon.time())
+            for rows in self._batches(day_qs):
+                for row in rows:
+                    self._push(*row, now)
+            day += timedelta(days=1)
+
+        self.max_seen_id = max(
+            self.max_seen_id,
+            AppointmentDetails.objects.order_by("-appoint_id").values_list("appoint_id", flat=True).first() or 0,
+        )
+        return len(self.scheduled)
+
+    def tail(self, now):
+        """Schedule appointments created since the last look (PK range only)."""
+        added = 0
+        for rows in self._batches(self._open_appointments(now).filter(appoint_id__gt=self.max_seen_id)):
+            for row in rows:
+                added += self._push(*row, now)
+            self.max_seen_id = max(self.max_seen_id, rows[-1][0])
+        return added
+
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
+
+    # ------------------------------------------------------------------
+    def fire_due(self, now):
+        """Enqueue reminders whose due time has come. Returns the number queued."""
+        due_ids = []
+        while self.heap and self.heap[0][0] <= now:
+            due, appoint_id = heapq.heappop(self.heap)
+            if self.scheduled.get(appoint_id) == due:      # skip superseded entries
+                del self.scheduled[appoint_id]
+                due_ids.append(appoint_id)
+        if not due_ids:
+            return 0
+
+        # re-read: the ETA may have moved (delay, recompute) or the visit is over
+        appts = (
+            AppointmentDetails.objects
+            .filter(appoint_id__in=due_ids, completed__in=OPEN_STATUSES, eta__isnull=False)
+            .select_related("patient", "doctor", "hospital")
+        )
+        by_hospital = {}
+        for appt in appts:
+            eta_at = datetime.combine(appt.appointment_on, appt.eta)
+            if eta_at < now:
+                continue                                   # too late to remind
+            if eta_at - self.lead > now:
+                # pushed back
+                self._push(appt.appoint_id, appt.appointment_on, appt.eta, appt.created_at, now)
+                continue
+            if self._too_late(eta_at - self.lead, appt.created_at):
+                continue                                   # moved forward past its registration
+            by_hospital.setdefault(appt.hospital_id, []).append(appt)
+
+        queued = 0
+        for hospital_id, batch in by_hospital.items():
+            queued += self._enqueue(batch)
+        return queued
+
+    def _enqueue(self, appts):
+        """
+        One transaction per hospital: outbox messages + their WhatsappReminder
+        rows. If another scheduler got there first the unique key fails and
+        the whole batch (outbox rows included) rolls back.
+        """
+        try:
+            with transaction.atomic():
+                already = set(
+                    WhatsappReminder.objects
+                    .filter(appointment_id__in=[a.appoint_id for a in appts],
+                            kind=WhatsappReminder.KIND_REMINDER)
+                    .values_list("appointment_id", flat=True)
+                )
+                reminders = []
+                for appt in appts:
+                    if appt.appoint_id in already:
+                        continue
+                    outbox = enqueue_whatsapp_template(
+                        appt.hospital,
+                        appt.mobile_num,
+                        template_type="reminder",
+                        patient=appt.patient,
+                        doctor=appt.doctor,
+                        token_num=appt.token_num,
+                        que_pos=appt.que_pos,
+                        eta=appt.eta.strftime("%H:%M"),
+                    )
+                    reminders.append(WhatsappReminder(
+                        hospital_id=appt.hospital_id,
+                        appointment_id=appt.appoint_id,
+                        outbox=outbox,
+                        due_at=datetime.combine(appt.appointment_on, appt.eta) - self.lead,
+                    ))
+                WhatsappReminder.objects.bulk_create(reminders)
+                return len(reminders)
+        except IntegrityError:
+            logger.warning("Reminder race for hospital %s; batch left to the other scheduler",
+                           appts[0].hospital_id)
+            return 0
@@ -38,26 +38,38 @@ from django.utils import timezone
 from .models import WhatsappTemplate, WhatsappMessageLog
 
 
-def send_whatsapp_template(
-    hospital,
-    recipient_number,
-    template_type=None,
-    template_name=None,
-    placeholders=None,
-    patient=None,
-    doctor=None,
-    appointment_slot=None,
-    token_num=None,
-    que_pos=None,
-    eta=None,
-    buttons=True,   # default True = include call button
-):
-    """
-    Sends a WhatsApp template message via DoubleTick (flat JSON payload).
-    Supports one PHONE_NUMBER button (Call Us).
-    """
+import logging
+import time
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+
+from .client import get_client
+from .models import WhatsappOutbox
+
+logger = logging.getLogger(__name__)
+
+# (hospital_id, template_type, template_name) -> (stored_at, (name, webhook_url));
+# cleared by core.signals when a WhatsappTemplate changes, TTL covers other processes
+TEMPLATE_CACHE_TTL = 300
+_template_cache = {}
+
+
+def clear_template_cache(hospital_id=None):
+    if hospital_id is None:
+        _template_cache.clear()
+        return
+    for key in [k for k in list(_template_cache) if k[0] == hospital_id]:
+        _template_cache.pop(key, None)
+
+
+def resolve_template(hospital, template_type=None, template_name=None):
+    """Returns (template_name, webhook_url) for the hospital."""
+    key = (getattr(hospital, "pk", hospital), template_type, template_name)
+    hit = _template_cache.get(key)
+    if hit and time.monotonic() - hit[0] < TEMPLATE_CACHE_TTL:
+        return hit[1]
 
-    # --- Resolve template ---
     if template_name:
         tpl = WhatsappTemplate.objects.get(hospital=hospital, template_name=template_name)
     elif template_type:
@@ -65,60 +77,86 @@ def send_whatsapp_template(
     else:
         raise ValueError("Either template_type or template_name must be provided")
 
-    tpl_name = tpl.template_name
-    webhook_url = tpl.webhook_url
-    if not webhook_url:
-        raise ValueError(f"No webhook URL configured for template {tpl_name} (hospital {hospital})")
+    if not tpl.webhook_url:
+        raise ValueError(f"No webhook URL configured for template {tpl.template_name} (hospital {hospital})")
 
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "Authorization": "key_U370Xs8rSS",
-    }
+    resolved = (tpl.template_name, tpl.webhook_url)
+    _template_cache[key] = (time.monotonic(), resolved)
+    return resolved
+
+
+def build_placeholders(patient=None, doctor=None, appointment_slot=None,
+                       token_num=None, que_pos=None, eta=None):
+    """Default body placeholders for the registration-style templates."""
+    doctor_name = doctor.doctor_name if doctor else ""
+    appointment_date = date.today().strftime("%d/%m/%Y")   # USE_TZ=False: localdate() would raise
+    placeholders = [
+        patient.patient_name if patient else "",
+        appointment_slot or "",
+        str(token_num or ""),
+        str(que_pos or ""),
+        doctor_name,
+        appointment_date,
+    ]
+    if eta:
+        placeholders.append(str(eta))
+    return placeholders
 
-    # --- Build placeholders if not passed ---
-    if placeholders is None:
-        doctor_name = doctor.doctor_name if doctor else ""
-        appointment_date = timezone.localdate().strftime("%d/%m/%Y")
-        placeholders = [
-            patient.patient_name if patient else "",
-            appointment_slot or "",
-            str(token_num or ""),
-            str(que_pos or ""),
-            doctor_name,
-            appointment_date,
-        ]
-        if eta:
-            placeholders.append(str(eta))
 
-    # --- Base payload ---
+def build_payload(template_name, recipient_number, placeholders, phone_num=None):
+    """Flat DoubleTick payload; phone_num adds one PHONE_NUMBER button (Call Us)."""
     payload = {
         "recipient": f"+91{recipient_number}",
-        "templateName": tpl_name,
+        "templateName": template_name,
         "language": "en_US",
         "templateData": {
             "body": {"placeholders": placeholders}
         }
     }
-
-    # --- Add Call Us button if enabled ---
-    if buttons and getattr(hospital, "phone_num", None):
+    if phone_num:
         payload["templateData"]["buttons"] = [
             {
                 "type": "string",
-                "parameter": f"+91{hospital.phone_num}"
+                "parameter": f"+91{phone_num}"
             }
         ]
+    return payload
+
+
+def post_template(webhook_url, payload):
+    """POST one payload on the pooled client; returns (response json, provider message id)."""
+    return get_client().post_template(webhook_url, payload)
 
-    # --- Debug print ---
-    print("📤 WhatsApp Payload:")
-    print(json.dumps(payload, indent=2))
 
-    # --- Send ---
+def send_whatsapp_template(
+    hospital,
+    recipient_number,
+    template_type=None,
+    template_name=None,
+    placeholders=None,
+    patient=None,
+    doctor=None,
+    appointment_slot=None,
+    token_num=None,
+    que_pos=None,
+    eta=None,
+    buttons=True,   # default True = include call button
+):
+    """
+    Sends a WhatsApp template message via DoubleTick right now (blocking).
+    Request handlers should use enqueue_whatsapp_template instead.
+    """
+    tpl_name, webhook_url = resolve_template(hospital, template_type, template_name)
+
+    if placeholders is None:
+        placeholders = build_placeholders(patient, doctor, appointment_slot, token_num, que_pos, eta)
+
+    payload = build_payload(
+        tpl_name, recipient_number, placeholders,
+        phone_num=getattr(hospital, "phone_num", None) if buttons else None,
+    )
     try:
-        resp = requests.post(webhook_url, headers=headers, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
+        data, message_id = post_template(webhook_url, payload)
 
         WhatsappMessageLog.objects.create(
             hospital=hospital,
@@ -127,7 +165,7 @@ def send_whatsapp_template(
             template_name=tpl_name,
             recipient_number=recipient_number,
             placeholders=placeholders,
-            provider_message_id=data.get("messages", [{}])[0].get("messageId"),
+            provider_message_id=message_id,
             status="sent",
         )
         return data
@@ -144,3 +182,104 @@ def send_whatsapp_template(
             error_message=str(e),
         )
         raise
+
+
+def enqueue_whatsapp_template(
+    hospital,
+    recipient_number,
+    template_type=None,
+    template_name=None,
+    placeholders=None,
+    patient=None,
+    doctor=None,
+    appointment_slot=None,
+    token_num=None,
+    que_pos=None,
+    eta=None,
+    buttons=True,
+    delay_seconds=0,
+):
+    """
+    Same arguments as send_whatsapp_template, but only writes a pending
+    WhatsappMessageLog + WhatsappOutbox row and returns the outbox entry.
+    Runs in the caller's transaction, so a rolled-back view sends nothing;
+    `manage.py whatsapp_outbox_worker` delivers it.
+    """
+    if not (template_type or template_name):
+        raise ValueError("Either template_type or template_name must be provided")
+
+    if placeholders is None:
+        placeholders = build_placeholders(patient, doctor, appointment_slot, token_num, que_pos, eta)
+
+    with transaction.atomic():
+        log = WhatsappMessageLog.objects.create(
+            hospital=hospital,
+            patient=patient,
+            doctor=doctor,
+            template_name=template_name or template_type,
+            recipient_number=recipient_number,
+            placeholders=placeholders,
+            status="pending",
+        )
+        return WhatsappOutbox.objects.create(
+            hospital=hospital,
+            patient=patient,
+            doctor=doctor,
+            log=log,
+            template_type=template_type or "",
+            template_name=template_name or "",
+            recipient_number=recipient_number,
+            placeholders=placeholders,
+            buttons=buttons,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay_seconds),
+        )
+
+
+def enqueue_whatsapp_batch(hospital, messages, template_type=None, template_name=None, buttons=True):
+    """
+    Queue many messages of one template in one transaction. Each message is
+    a dict with recipient_number, placeholders and optional patient/doctor.
+    Outbox rows go in with one bulk INSERT; the pending logs too where the
+    backend returns ids from bulk inserts (MySQL does not, so there they are
+    inserted one by one inside the same transaction). Returns the outbox rows.
+    """
+    if not (template_type or template_name):
+        raise ValueError("Either template_type or template_name must be provided")
+    if not messages:
+        return []
+
+    now = timezone.now()
+    with transaction.atomic():
+        logs = [
+            WhatsappMessageLog(
+                hospital=hospital,
+                patient=m.get("patient"),
+                doctor=m.get("doctor"),
+                template_name=template_name or template_type,
+                recipient_number=m["recipient_number"],
+                placeholders=m["placeholders"],
+                status="pending",
+            )
+            for m in messages
+        ]
+        if connection.features.can_return_rows_from_bulk_insert:
+            logs = WhatsappMessageLog.objects.bulk_create(logs)
+        else:
+            for log in logs:
+                log.save()
+
+        return WhatsappOutbox.objects.bulk_create([
+            WhatsappOutbox(
+                hospital=hospital,
+                patient=m.get("patient"),
+                doctor=m.get("doctor"),
+                log=log,
+                template_type=template_type or "",
+                template_name=template_name or "",
+                recipient_number=m["recipient_number"],
+                placeholders=m["placeholders"],
+                buttons=buttons,
+                next_attempt_at=now,
+            )
+            for m, log in zip(messages, logs)
+        ])
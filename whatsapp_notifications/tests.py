@@ -1,3 +1,172 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.management.commands.whatsapp_outbox_worker import (
+    BACKOFF_BASE, BACKOFF_CAP, STALE_LOCK, Command as OutboxWorker, backoff_seconds,
+)
+from core.models import Hospital
+from whatsapp_notifications.models import WhatsappMessageLog, WhatsappOutbox, WhatsappWebhookEvent
+from whatsapp_notifications.services import enqueue_whatsapp_template
+from whatsapp_notifications.reminders import ReminderScheduler
+from whatsapp_notifications.webhooks import ORPHAN_GRACE, ORPHAN_RETRY, process_webhook_events
+
+
+class WebhookProcessingTests(TestCase):
+    """process_webhook_events: receipts waiting for their log must not block newer events."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(
+            hospital_name="Webhook Test", phone_num="9990004444",
+            email="webhook@test.local", name="webhook",
+        )
+
+    def receipt(self, message_id, status="delivered"):
+        return WhatsappWebhookEvent.objects.create(
+            source="doubletick", payload={"messageId": message_id, "status": status},
+        )
+
+    def test_waiting_receipt_does_not_starve_newer_events(self):
+        orphan = self.receipt("wamid.not-yet-logged")
+        log = WhatsappMessageLog.objects.create(
+            hospital=self.hospital, template_name="token", recipient_number="9100000000",
+            placeholders=[], status="sent", provider_message_id="wamid.known",
+        )
+        newer = self.receipt("wamid.known")
+
+        self.assertEqual(process_webhook_events(batch_size=1)["waiting"], 1)
+        counts = process_webhook_events(batch_size=1)          # the orphan is not due yet
+        self.assertEqual((counts["claimed"], counts["status"]), (1, 1))
+        self.assertIsNone(process_webhook_events(batch_size=1))
+
+        newer.refresh_from_db()
+        log.refresh_from_db()
+        orphan.refresh_from_db()
+        self.assertIsNotNone(newer.processed_at)
+        self.assertEqual(log.status, "delivered")
+        self.assertIsNone(orphan.processed_at)
+        self.assertGreater(orphan.next_attempt_at, timezone.now() + ORPHAN_RETRY / 2)
+
+    def test_orphan_receipt_fails_after_the_grace_period(self):
+        orphan = self.receipt("wamid.never-logged")
+        WhatsappWebhookEvent.objects.filter(pk=orphan.pk).update(
+            received_at=timezone.now() - ORPHAN_GRACE - timedelta(seconds=1),
+            next_attempt_at=timezone.now() - timedelta(seconds=1),
+        )
+
+        self.assertEqual(process_webhook_events()["errors"], 1)
+        orphan.refresh_from_db()
+        self.assertIsNotNone(orphan.processed_at)
+        self.assertIn("no WhatsappMessageLog", orphan.error)
+
+
+class ReminderSchedulingTests(SimpleTestCase):
+    """ReminderScheduler._push: only reminders that fall due after the appointment was made."""
+
+    def setUp(self):
+        self.now = datetime(2026, 3, 2, 10, 0)
+        self.scheduler = ReminderScheduler(lead_minutes=60, window_minutes=180, catch_up_minutes=10)
+        self.scheduler.started_at = self.now
+        self.scheduler.horizon = self.now + timedelta(hours=4)
+
+    def push(self, appoint_id, eta, created_at):
+        return self.scheduler._push(appoint_id, self.now.date(), eta, created_at, self.now)
+
+    def test_booked_ahead_is_scheduled(self):
+        self.assertTrue(self.push(1, time(12, 0), self.now - timedelta(hours=3)))
+        self.assertEqual(self.scheduler.next_due(), datetime(2026, 3, 2, 11, 0))
+
+    def test_walk_in_inside_the_lead_gets_no_reminder(self):
+        # registered at 10:00 with ETA 10:30: due at 9:30, before it existed
+        self.assertFalse(self.push(2, time(10, 30), self.now))
+        self.assertIsNone(self.scheduler.next_due())
+
+    def test_restart_skips_reminders_missed_long_ago(self):
+        created = self.now - timedelta(hours=5)
+        self.assertFalse(self.push(3, time(10, 45), created))      # due 9:45, down since
+        self.assertTrue(self.push(4, time(10, 55), created))       # due 9:55, within catch-up
+
+
+class OutboxWorkerTests(TestCase):
+    """whatsapp_outbox_worker: claiming due rows and retrying with backoff."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(
+            hospital_name="Outbox Test", phone_num="9990005555",
+            email="outbox@test.local", name="outbox",
+        )
+
+    def setUp(self):
+        self.worker = OutboxWorker()
+        self.worker.options = {"max_attempts": 3}
+
+    def enqueue(self, **extra):
+        outbox = enqueue_whatsapp_template(
+            self.hospital, "9100000000", template_type="token", placeholders=["A1"],
+        )
+        if extra:
+            WhatsappOutbox.objects.filter(pk=outbox.pk).update(**extra)
+        return outbox
+
+    def test_claim_takes_due_and_abandoned_rows_once(self):
+        now = timezone.now()
+        due = self.enqueue()
+        later = self.enqueue(next_attempt_at=now + timedelta(minutes=5))
+        abandoned = self.enqueue(status=WhatsappOutbox.STATUS_SENDING, locked_at=now - STALE_LOCK * 2)
+        held = self.enqueue(status=WhatsappOutbox.STATUS_SENDING, locked_at=now)
+
+        claimed = self.worker._claim(limit=10)
+        self.assertEqual({r.pk for r in claimed}, {due.pk, abandoned.pk})
+        self.assertTrue(all(r.status == WhatsappOutbox.STATUS_SENDING and r.locked_at for r in claimed))
+        self.assertEqual(self.worker._claim(limit=10), [])          # a second worker gets nothing
+        self.assertEqual(WhatsappOutbox.objects.get(pk=later.pk).status, WhatsappOutbox.STATUS_PENDING)
+        self.assertEqual(WhatsappOutbox.objects.get(pk=held.pk).locked_at, now)       # still the other worker's
+
+    def test_claim_skips_rows_locked_by_another_worker(self):
+        if not connection.features.has_select_for_update_skip_locked:
+            self.skipTest(f"{connection.vendor} has no SKIP LOCKED")
+        self.enqueue()
+        with CaptureQueriesContext(connection) as queries:
+            self.worker._claim(limit=10)
+        self.assertTrue(any("SKIP LOCKED" in q["sql"].upper() for q in queries.captured_queries))
+
+    def flush(self, outbox, message_id=None, error=None, retryable=False):
+        counts = {"sent": 0, "retry": 0, "failed": 0}
+        row = WhatsappOutbox.objects.get(pk=outbox.pk)
+        self.worker._flush({row.pk: row}, [(row.pk, message_id, error, retryable)], counts)
+        return counts, WhatsappOutbox.objects.get(pk=outbox.pk)
+
+    def test_transient_failure_backs_off_then_gives_up(self):
+        outbox = self.enqueue()
+        before = timezone.now()
+        counts, row = self.flush(outbox, error="503 Service Unavailable", retryable=True)
+        self.assertEqual(counts["retry"], 1)
+        self.assertEqual((row.status, row.attempts), (WhatsappOutbox.STATUS_PENDING, 1))
+        self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=BACKOFF_BASE / 2))
+        self.assertLessEqual(row.next_attempt_at, timezone.now() + timedelta(seconds=BACKOFF_BASE))
+
+        self.flush(outbox, error="503 Service Unavailable", retryable=True)
+        counts, row = self.flush(outbox, error="503 Service Unavailable", retryable=True)
+        self.assertEqual(counts["failed"], 1)                       # max_attempts reached
+        self.assertEqual((row.status, row.attempts), (WhatsappOutbox.STATUS_FAILED, 3))
+        self.assertEqual(row.log.status, "failed")
+
+    def test_permanent_failure_and_success(self):
+        bad, good = self.enqueue(), self.enqueue()
+        self.assertEqual(self.flush(bad, error="400 Bad Request")[1].status, WhatsappOutbox.STATUS_FAILED)
+
+        counts, row = self.flush(good, message_id="wamid.sent")
+        self.assertEqual(counts["sent"], 1)
+        self.assertEqual(row.status, WhatsappOutbox.STATUS_SENT)
+        self.assertEqual((row.log.status, row.log.provider_message_id), ("sent", "wamid.sent"))
+
+    def test_backoff_grows_and_is_capped(self):
+        for attempts in range(1, 12):
+            delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempts - 1))
+            self.assertTrue(delay / 2 <= backoff_seconds(attempts) <= delay)
+        self.assertLessEqual(backoff_seconds(50), BACKOFF_CAP)
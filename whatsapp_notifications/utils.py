@@ -1,67 +1,47 @@
 # whatsapp_notifications/utils.py
-from datetime import timedelta, datetime,date
-from appointments.models import AppointmentDetails
-from .services import send_whatsapp_template
+from django.db import transaction
+from utils.eta_calculator import shift_queue_etas
+from .services import enqueue_whatsapp_batch
 
 
 # whatsapp_notifications/utils.py
 
 def send_reschedule_notifications(hospital, doctor, delay_minutes):
     """
-    Sends reschedule WhatsApp messages to all patients currently in queue
-    for a given doctor, applying the delay in minutes and updating ETAs.
+    Applies a doctor's delay to everyone currently in queue and queues the
+    reschedule WhatsApp messages. ETAs move with one UPDATE and the messages
+    go to the outbox in one batch (whatsapp_outbox_worker sends them), so
+    this returns a summary straight away.
     """
-    today = date.today()
-    queued_appts = AppointmentDetails.objects.filter(
-        hospital=hospital,
-        doctor=doctor,
-        appointment_on=today,
-        completed=AppointmentDetails.STATUS_IN_QUEUE
-    ).order_by("que_pos")
-
-    results = []
-
-    for appt in queued_appts:
-        # 🔹 Update ETA: if available, shift by delay_minutes
-        if appt.eta:
-            new_eta = (
-                datetime.combine(appt.appointment_on, appt.eta)
-                + timedelta(minutes=delay_minutes)
-            ).time()
-            appt.eta = new_eta
-            appt.save(update_fields=["eta"])
-
-        # 🔹 Prepare placeholders for DoubleTick template
-        placeholders = [
-            appt.patient.patient_name,            # 1. Patient name
-            doctor.doctor_name,                   # 2. Doctor name
-            str(delay_minutes),                   # 3. Delay in minutes
-            str(appt.token_num),                  # 4. Token number
-            appt.eta.strftime("%H:%M") if appt.eta else "TBD",  # 5. Updated ETA
+    with transaction.atomic():
+        queue = shift_queue_etas(doctor, hospital, delay_minutes)
+
+        # 🔹 Placeholders for the DoubleTick reschedule template
+        messages = [
+            {
+                "recipient_number": appt.mobile_num,
+                "patient": appt.patient,
+                "doctor": doctor,
+                "placeholders": [
+                    appt.patient.patient_name,            # 1. Patient name
+                    doctor.doctor_name,                   # 2. Doctor name
+                    str(delay_minutes),                   # 3. Delay in minutes
+                    str(appt.token_num),                  # 4. Token number
+                    appt.eta.strftime("%H:%M") if appt.eta else "TBD",  # 5. Updated ETA
+                ],
+            }
+            for appt in queue
         ]
-
-        try:
-            response = send_whatsapp_template(
-                hospital=hospital,
-                template_name="appointment_reschedule_universal",
-                placeholders=placeholders,
-                recipient_number=appt.mobile_num,
-                patient=appt.patient,
-                doctor=doctor,
-            )
-            results.append({
-                "patient": appt.patient.patient_name,
-                "status": "sent",
-                "response": response
-            })
-        except Exception as e:
-            results.append({
-                "patient": appt.patient.patient_name,
-                "status": "failed",
-                "error": str(e)
-            })
-
-    return results
+        outbox = enqueue_whatsapp_batch(
+            hospital, messages, template_name="appointment_reschedule_universal",
+        )
+
+    return {
+        "delay_minutes": delay_minutes,
+        "patients": len(queue),
+        "etas_shifted": sum(1 for appt in queue if appt.eta),
+        "queued": len(outbox),
+    }
 
 
 # whatsapp_notifications/utils.py
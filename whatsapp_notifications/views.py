@@ -7,6 +7,7 @@ from django.shortcuts       import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 from .models import WhatsappMessageLog, WhatsappInboundMessage
 from .utils import classify_inbound_message  # move classifier into utils.py if you like
+from .webhooks import ingest_webhook
 from core.models import Hospital  # if you want hospital fallback mapping
 
 
@@ -77,122 +78,16 @@ logger = logging.getLogger(__name__)
 
 @csrf_exempt
 @require_POST
-def whatsapp_webhook(request):
+def whatsapp_webhook(request, hospital_id=None):
     """
     Handles DoubleTick webhooks:
     - Inbound message: payload contains dtMessageId + message + from
     - Status update: payload contains status + messageId (+ to)
     DoubleTick may send a single object or a list.
+    Events are only stored here (one INSERT) and applied in batches by
+    `manage.py process_whatsapp_webhooks`, so receipt storms stay cheap.
     """
-    try:
-        raw = request.body.decode("utf-8") or "{}"
-        payload = json.loads(raw)
-    except Exception:
-        logger.exception("DoubleTick webhook: invalid JSON")
-        return JsonResponse({"error": "invalid_json"}, status=400)
-
-    events = payload if isinstance(payload, list) else [payload]
-
-    inbound_created = 0
-    status_updated = 0
-    unhandled = 0
-
-    for evt in events:
-        # ---------------------------
-        # 1) Sent message status update
-        # ---------------------------
-        # DoubleTick "Sent Message Status" uses: status + messageId (+ to + statusTimestamp)
-        # messageId == dtMessageId from receive payload (per docs)
-        if "status" in evt and "messageId" in evt:
-            msg_id = evt.get("messageId")
-            status = evt.get("status")
-
-            if msg_id and status:
-                updated = WhatsappMessageLog.objects.filter(
-                    provider_message_id=msg_id
-                ).update(status=status)
-                status_updated += int(updated)
-            else:
-                logger.warning("Status webhook missing messageId/status: %s", evt)
-            continue
-
-        # ---------------------------
-        # 2) Inbound message received
-        # ---------------------------
-        # Receive payload contains dtMessageId + from + to + message{...}
-        if "dtMessageId" in evt and "from" in evt and "message" in evt:
-            dt_id = evt.get("dtMessageId")
-            from_number = evt.get("from")
-            to_number = evt.get("to")
-
-            msg = evt.get("message") or {}
-            msg_type = msg.get("type")  # TEXT / BUTTON / IMAGE / DOCUMENT etc.
-            text_body = (
-                msg.get("text") or
-                msg.get("payload") or    # button replies
-                msg.get("caption") or    # media captions
-                ""
-            )
-
-            # Classify safely
-            try:
-                classification = classify_inbound_message(text_body) if text_body else (msg_type or "UNKNOWN")
-            except Exception:
-                logger.exception("Inbound classify failed (dtMessageId=%s)", dt_id)
-                classification = msg_type or "UNKNOWN"
-
-            # Link to previous outbound message if it is a reply:
-            # payload may include dtPairedMessageId (reply to your previous msg)
-            paired_dt_id = evt.get("dtPairedMessageId") or evt.get("pairedMessageId")
-
-            log = None
-            if paired_dt_id:
-                log = WhatsappMessageLog.objects.filter(provider_message_id=paired_dt_id).first()
-
-            # If no paired id, try matching latest outbound to this number (optional heuristic)
-            if not log and from_number:
-                log = (
-                    WhatsappMessageLog.objects
-                    .filter(to_number=from_number)  # change field name if yours differs
-                    .order_by("-created_at")
-                    .first()
-                )
-
-            hospital = getattr(log, "hospital", None)
-            patient = getattr(log, "patient", None)
-
-            # Optional fallback: infer hospital from "to" number (if your Hospital.phone_num stores your WA API number)
-            if hospital is None and to_number:
-                hospital = Hospital.objects.filter(phone_num=to_number).first()
-
-            # IMPORTANT:
-            # If your WhatsappInboundMessage.hospital/patient fields are NOT nullable,
-            # you MUST ensure hospital is resolved OR make those fields null=True.
-            WhatsappInboundMessage.objects.create(
-                hospital=hospital,
-                patient=patient,
-                provider_message_id=dt_id,
-                from_number=from_number,
-                message_text=text_body,
-                event_type=classification,
-                in_reply_to=log,
-            )
-
-            inbound_created += 1
-            continue
-
-        # ---------------------------
-        # 3) Anything else: log it
-        # ---------------------------
-        unhandled += 1
-        logger.info("Unhandled DoubleTick webhook payload: keys=%s evt=%s", list(evt.keys()), evt)
-
-    return JsonResponse({
-        "ok": True,
-        "inbound_created": inbound_created,
-        "status_updated": status_updated,
-        "unhandled": unhandled,
-    })
+    return ingest_webhook(request, "whatsapp", hospital_id=hospital_id)
 
 
 
@@ -0,0 +1,254 @@
+# whatsapp_notifications/webhooks.py
+"""
+DoubleTick webhook pipeline.
+
+ingest_webhook()          – request side: split the callback into events,
+                            one bulk INSERT into WhatsappWebhookEvent, 200 OK.
+process_webhook_events()  – `manage.py process_whatsapp_webhooks`: claims a
+                            batch, coalesces status receipts per message id
+                            (highest status wins, never downgrades), creates
+                            inbound replies, all with bulk queries.
+"""
+import json
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+
+from core.models import Hospital
+from .models import WhatsappInboundMessage, WhatsappMessageLog, WhatsappWebhookEvent
+from .utils import classify_inbound_message
+
+logger = logging.getLogger(__name__)
+
+# receipts can arrive out of order; a "delivered" after "read" is ignored
+STATUS_RANK = {"pending": 0, "sent": 1, "delivered": 2, "read": 3, "failed": 4}
+
+# a receipt may beat the outbox worker writing provider_message_id; keep it this
+# long, looking again every ORPHAN_RETRY (newer events go first meanwhile)
+ORPHAN_GRACE = timedelta(minutes=2)
+ORPHAN_RETRY = timedelta(seconds=10)
+REPLY_LOOKBACK = timedelta(days=7)
+
+
+def _is_status(evt):
+    # "Sent Message Status": status + messageId (+ to + statusTimestamp)
+    return "status" in evt and "messageId" in evt
+
+
+def _is_inbound(evt):
+    # Receive payload: dtMessageId + from + to + message{...}
+    return "dtMessageId" in evt and "from" in evt and "message" in evt
+
+
+def _dedupe_key(evt):
+    if _is_status(evt) and evt.get("messageId") and evt.get("status"):
+        return f"status:{evt['messageId']}:{str(evt['status']).lower()}"[:300]
+    if _is_inbound(evt) and evt.get("dtMessageId"):
+        return f"in:{evt['dtMessageId']}"[:300]
+    return None
+
+
+def ingest_webhook(request, source, hospital_id=None):
+    """Store the callback's events (single object or list) and acknowledge."""
+    try:
+        payload = json.loads(request.body.decode("utf-8") or "{}")
+    except Exception:
+        logger.exception("DoubleTick webhook: invalid JSON")
+        return JsonResponse({"error": "invalid_json"}, status=400)
+
+    events = payload if isinstance(payload, list) else [payload]
+    rows = [
+        WhatsappWebhookEvent(
+            source=source,
+            hospital_id=hospital_id,
+            dedupe_key=_dedupe_key(evt) if isinstance(evt, dict) else None,
+            payload=evt,
+        )
+        for evt in events
+    ]
+    # provider retries hit the unique dedupe_key and are dropped here
+    WhatsappWebhookEvent.objects.bulk_create(rows, ignore_conflicts=True)
+    return JsonResponse({"ok": True, "queued": len(rows)})
+
+
+def _apply_statuses(events, now):
+    """Returns (done ids, leave-for-later ids, {id: error})."""
+    latest = {}          # message id -> (rank, status)
+    event_ids = {}       # message id -> [event ids]
+    done, later, errors = [], [], {}
+
+    for e in events:
+        msg_id, status = e.payload.get("messageId"), e.payload.get("status")
+        if not (msg_id and status):
+            errors[e.id] = "missing messageId/status"
+            continue
+        status = str(status).lower()[:20]
+        rank = STATUS_RANK.get(status, 1)
+        if msg_id not in latest or rank > latest[msg_id][0]:
+            latest[msg_id] = (rank, status)
+        event_ids.setdefault(msg_id, []).append(e)
+
+    logs = WhatsappMessageLog.objects.in_bulk(list(latest), field_name="provider_message_id")
+    changed = []
+    for msg_id, (rank, status) in latest.items():
+        log = logs.get(msg_id)
+        if log is None:
+            for e in event_ids[msg_id]:
+                if now - e.received_at < ORPHAN_GRACE:
+                    later.append(e.id)
+                else:
+                    errors[e.id] = "no WhatsappMessageLog with this messageId"
+            continue
+        if rank > STATUS_RANK.get(log.status, 0):
+            log.status = status
+            log.updated_at = now          # bulk_update skips auto_now
+            changed.append(log)
+        done.extend(e.id for e in event_ids[msg_id])
+
+    WhatsappMessageLog.objects.bulk_update(changed, ["status", "updated_at"], batch_size=500)
+    return done, later, errors
+
+
+def _inbound_text(msg):
+    return (
+        msg.get("text") or
+        msg.get("payload") or    # button replies
+        msg.get("caption") or    # media captions
+        ""
+    )
+
+
+def _apply_inbound(events, now):
+    """Returns (done ids, {id: error})."""
+    done, errors = [], {}
+    unique = {}
+    for e in events:
+        dt_id = e.payload.get("dtMessageId")
+        if not dt_id:
+            errors[e.id] = "missing dtMessageId"
+        elif dt_id in unique:
+            done.append(e.id)                 # same message twice in this batch
+        else:
+            unique[dt_id] = e
+    events = list(unique.values())
+
+    # 1️⃣ replies to a known outbound message
+    paired_ids = {
+        e.payload.get("dtPairedMessageId") or e.payload.get("pairedMessageId") for e in events
+    } - {None, ""}
+    paired = WhatsappMessageLog.objects.in_bulk(list(paired_ids), field_name="provider_message_id")
+
+    # 2️⃣ otherwise the latest outbound to that number (logs store 10 digits)
+    numbers = {str(e.payload.get("from") or "")[-10:] for e in events} - {""}
+    latest_to = {}
+    for log in (
+        WhatsappMessageLog.objects
+        .filter(recipient_number__in=numbers, created_at__gte=now - REPLY_LOOKBACK)
+        .order_by("created_at")
+    ):
+        latest_to[log.recipient_number] = log
+
+    # 3️⃣ hospital fallback from the number the patient wrote to
+    to_numbers = {str(e.payload.get("to") or "")[-10:] for e in events} - {""}
+    hospitals = {h.phone_num: h.id for h in Hospital.objects.filter(phone_num__in=to_numbers)}
+
+    already = set(
+        WhatsappInboundMessage.objects
+        .filter(provider_message_id__in=[e.payload["dtMessageId"] for e in events])
+        .values_list("provider_message_id", flat=True)
+    )
+
+    rows = []
+    for e in events:
+        evt = e.payload
+        dt_id = evt["dtMessageId"]
+        if dt_id in already:
+            done.append(e.id)
+            continue
+
+        msg = evt.get("message") or {}
+        text_body = _inbound_text(msg)
+        try:
+            classification = classify_inbound_message(text_body) if text_body else (msg.get("type") or "UNKNOWN")
+        except Exception:
+            logger.exception("Inbound classify failed (dtMessageId=%s)", dt_id)
+            classification = msg.get("type") or "UNKNOWN"
+
+        paired_id = evt.get("dtPairedMessageId") or evt.get("pairedMessageId")
+        log = paired.get(paired_id) if paired_id else None
+        log = log or latest_to.get(str(evt.get("from") or "")[-10:])
+
+        hospital_id = (
+            getattr(log, "hospital_id", None)
+            or e.hospital_id
+            or hospitals.get(str(evt.get("to") or "")[-10:])
+        )
+        if not hospital_id:
+            errors[e.id] = "could not resolve hospital for inbound message"
+            continue
+
+        rows.append(WhatsappInboundMessage(
+            hospital_id=hospital_id,
+            patient_id=getattr(log, "patient_id", None),
+            provider_message_id=dt_id,
+            from_number=evt.get("from"),
+            message_text=text_body,
+            event_type=classification[:20],
+            in_reply_to=log,
+        ))
+        done.append(e.id)
+
+    WhatsappInboundMessage.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+    return done, errors
+
+
+def process_webhook_events(batch_size=500):
+    """
+    Apply one batch of due events inside one transaction (rows stay
+    locked, so parallel processors skip them). Receipts still waiting for
+    their log are put back until ORPHAN_RETRY from now. Returns None when
+    nothing is due, else
+    counts {"claimed", "status", "inbound", "waiting", "errors", "ignored"}.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            WhatsappWebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return None
+
+        status_events = [e for e in events if isinstance(e.payload, dict) and _is_status(e.payload)]
+        inbound_events = [e for e in events if isinstance(e.payload, dict) and _is_inbound(e.payload)]
+        handled = {e.id for e in status_events} | {e.id for e in inbound_events}
+        ignored = [e for e in events if e.id not in handled]
+        for e in ignored:
+            logger.info("Unhandled DoubleTick webhook payload: %s", e.payload)
+
+        status_done, later, errors = _apply_statuses(status_events, now)
+        inbound_done, inbound_errors = _apply_inbound(inbound_events, now)
+        errors.update(inbound_errors)
+
+        done = status_done + inbound_done + [e.id for e in ignored]
+        WhatsappWebhookEvent.objects.filter(id__in=done).update(processed_at=now)
+        WhatsappWebhookEvent.objects.filter(id__in=later).update(next_attempt_at=now + ORPHAN_RETRY)
+        failed = [e for e in events if e.id in errors]
+        for e in failed:
+            e.processed_at, e.error = now, errors[e.id]
+        WhatsappWebhookEvent.objects.bulk_update(failed, ["processed_at", "error"])
+
+    return {
+        "claimed": len(events),
+        "status": len(status_done),
+        "inbound": len(inbound_done),
+        "waiting": len(later),
+        "errors": len(errors),
+        "ignored": len(ignored),
+    }